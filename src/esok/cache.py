@@ -0,0 +1,99 @@
+import logging
+import time
+from os import path
+from urllib.parse import urlparse
+
+import click
+
+from esok.config.connection_options import current_connection
+from esok.constants import STATE_DIR_NAME
+from esok.util import read_state, write_state
+
+LOG = logging.getLogger(__name__)
+
+METADATA_CACHE_BASENAME = "metadata-cache.json"
+
+
+class MetadataCache(object):
+    def __init__(self, cache_file, host, ttl):
+        """
+        An on-disk cache of metadata of one cluster, such as node roles.
+
+        :param cache_file: File path of the cache, shared between clusters
+        :param host: Host of the cluster, used to key its entries in the cache
+        :param ttl: Number of seconds an entry is valid. 0 disables the cache.
+        """
+        self.cache_file = cache_file
+        self.host = host
+        self.ttl = ttl
+
+    def get(self, key, fetch):
+        """
+        Returns a cached value, or fetches and caches it if it is missing or expired.
+
+        :param key: Name of the cached value
+        :param fetch: Function that fetches the value from the cluster
+        """
+        if self.ttl <= 0:
+            return fetch()
+
+        entry = read_state(self.cache_file).get(self.host, dict()).get(key)
+        if entry is not None and time.time() - entry["fetched_at"] < self.ttl:
+            LOG.debug("Using cached %s of %s", key, self.host)
+            return entry["value"]
+
+        value = fetch()
+        # Re-read, in case the cache was written to while fetching.
+        entries = read_state(self.cache_file)
+        entries.setdefault(self.host, dict())[key] = dict(
+            value=value, fetched_at=time.time()
+        )
+        write_state(self.cache_file, entries)
+        return value
+
+    def invalidate(self):
+        """Removes all cached entries of the cluster."""
+        entries = read_state(self.cache_file)
+        if entries.pop(self.host, None) is not None:
+            write_state(self.cache_file, entries)
+
+
+def metadata_cache(client):
+    """The metadata cache of the cluster a @per_connection command runs for."""
+    obj = click.get_current_context().obj
+    config = obj["config"]
+    host = client.transport.get_connection().host
+
+    cluster, _ = current_connection()
+    # Keys of config sections are lower-cased when parsed, and can't contain ":",
+    # so hosts are matched by hostname only.
+    ttls = config["metadata_cache_ttls"]
+    ttl = next(
+        (
+            ttls[name.lower()]
+            for name in (cluster, urlparse(host).hostname)
+            if name is not None and name.lower() in ttls
+        ),
+        config["metadata_cache_ttl"],
+    )
+
+    cache_file = path.join(obj["app_dir"], STATE_DIR_NAME, METADATA_CACHE_BASENAME)
+    return MetadataCache(cache_file, host, ttl)
+
+
+def nodes(client):
+    """Names and roles of the nodes in the cluster, keyed by node ID."""
+
+    def _fetch():
+        # Using this metric because payload is small
+        r = client.nodes.stats(
+            metric="process", filter_path="nodes.*.name,nodes.*.roles"
+        )
+        return r.get("nodes")
+
+    return metadata_cache(client).get("nodes", _fetch)
+
+
+def data_node_count(client):
+    """Number of data nodes in the cluster."""
+    return sum(1 for node in nodes(client).values() if "data" in node.get("roles"))
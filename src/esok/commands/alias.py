@@ -1,15 +1,27 @@
 import json
 import logging
+import re
 import sys
+from fnmatch import fnmatchcase
 
 import click
 from click_didyoumean import DYMGroup
 
-from esok.config.connection_options import per_connection
-from esok.constants import UNKNOWN_ERROR
+from esok.config.connection_options import (
+    ACKNOWLEDGED,
+    all_connections,
+    echo_connection_header,
+    fan_out,
+    per_connection,
+    response_filter,
+)
+from esok.constants import UNKNOWN_ERROR, USER_ERROR
+from esok.util import format_table
 
 LOG = logging.getLogger(__name__)
 
+ACTION_TYPES = ("add", "remove", "remove_index")
+
 
 @click.group(cls=DYMGroup)
 def alias():
@@ -40,7 +52,9 @@ def list_aliases(client, sort):
 @per_connection()
 def create(client, name, index):
     """Create an alias for an index."""
-    r = client.indices.put_alias(index=index, name=name)
+    r = client.indices.put_alias(
+        index=index, name=name, filter_path=response_filter(ACKNOWLEDGED)
+    )
     LOG.info(json.dumps(r))
     ok = r.get("acknowledged")
     if not ok:
@@ -53,7 +67,9 @@ def create(client, name, index):
 @per_connection()
 def delete(client, name, index):
     """Delete alias from index."""
-    r = client.indices.delete_alias(name=name, index=index)
+    r = client.indices.delete_alias(
+        name=name, index=index, filter_path=response_filter(ACKNOWLEDGED)
+    )
     ok = r.get("acknowledged")
     LOG.info(json.dumps(r))
     if not ok:
@@ -64,18 +80,289 @@ def delete(client, name, index):
 @click.argument("name", type=click.STRING)
 @click.argument("from_index", type=click.STRING)
 @click.argument("to_index", type=click.STRING)
-@per_connection()
-def swap(client, name, from_index, to_index):
-    """Swap alias between indices, atomically."""
-    r = client.indices.update_aliases(
-        {
-            "actions": [
-                {"add": {"index": to_index, "alias": name}},
-                {"remove": {"index": from_index, "alias": name}},
+@click.option("--dry-run", is_flag=True, help="Only print the actions of every site.")
+@all_connections()
+def swap(connections, name, from_index, to_index, dry_run):
+    """Swap alias between indices, atomically.
+
+    NAME and FROM_INDEX may be patterns, to swap every matching alias away from
+    every matching index, in one request per site. A "*" in TO_INDEX is replaced
+    by what the "*" in FROM_INDEX matched.
+
+    Examples:
+
+    \b
+    $ esok alias swap my-alias my-index-v1 my-index-v2
+    $ esok alias swap '*' '*-v1' '*-v2'
+    """
+    if "*" in to_index and from_index.count("*") != 1:
+        LOG.error('A "*" in TO_INDEX requires exactly one "*" in FROM_INDEX.')
+        sys.exit(USER_ERROR)
+
+    if "*" in name or "*" in from_index:
+        _apply(
+            connections,
+            lambda alias_map: _swap_actions(alias_map, name, from_index, to_index),
+            dry_run,
+        )
+    else:
+        # Elasticsearch validates a swap of one alias by itself.
+        actions = [
+            {"add": {"index": to_index, "alias": name}},
+            {"remove": {"index": from_index, "alias": name}},
+        ]
+        _apply(connections, lambda alias_map: actions, dry_run, validate=False)
+
+
+@alias.command()
+@click.argument("file", type=click.File("r"))
+@click.option("--dry-run", is_flag=True, help="Only print the actions of every site.")
+@all_connections()
+def apply(connections, file, dry_run):
+    """Apply the alias actions of FILE, atomically.
+
+    FILE is a YAML or JSON list of add, remove and remove_index actions, as in
+    the body of the update aliases API, which may also be given as is. All
+    actions are sent in one request per site, to all sites at the same time.
+
+    The actions are first checked against the current aliases of every site, and
+    nothing is changed if any of them would fail. Once applied, the aliases are
+    compared with the expected result.
+
+    Example of FILE:
+
+        \b
+        - add: {index: products-v2, alias: products}
+        - remove: {index: products-v1, alias: products}
+        - add: {index: users-v2, alias: users}
+        - remove: {index: users-v1, alias: users}
+    """
+    actions = _read_actions(file)
+    _apply(connections, lambda alias_map: actions, dry_run)
+
+
+def _apply(connections, compile_actions, dry_run, validate=True):
+    """
+    Applies alias actions to all connections, with one update aliases request
+    per site.
+
+    :param connections: Connections given by @all_connections
+    :param compile_actions: Function of the alias map of a site, which returns its
+        list of actions. The alias map is None if not validated.
+    :param dry_run: Only print the actions
+    :param validate: Check the actions against the current alias map of every
+        site, before and after applying them
+    """
+    alias_maps = (
+        fan_out(connections, _alias_map) if validate else [None] * len(connections)
+    )
+    plans = [compile_actions(alias_map) for alias_map in alias_maps]
+
+    expected_maps = list()
+    if validate:
+        failed = False
+        for connection, alias_map, actions in zip(connections, alias_maps, plans):
+            expected, errors = _simulate(alias_map, actions)
+            expected_maps.append(expected)
+            for error in errors:
+                LOG.error("%s - %s: %s", connection.cluster, connection.site, error)
+                failed = True
+        if failed:
+            sys.exit(USER_ERROR)
+
+    if dry_run:
+        for connection, actions in zip(connections, plans):
+            if len(connections) > 1:
+                echo_connection_header(connection.cluster, connection.site)
+            rows = [
+                (action_type, args.get("alias", "-"), args["index"])
+                for action in actions
+                for action_type, args in action.items()
             ]
-        }
+            click.echo(format_table(("action", "alias", "index"), rows))
+        return
+
+    actions_by_client = {
+        connection.client: actions for connection, actions in zip(connections, plans)
+    }
+    responses = fan_out(
+        connections,
+        lambda client: client.indices.update_aliases(
+            dict(actions=actions_by_client[client]),
+            filter_path=response_filter(ACKNOWLEDGED),
+        ),
     )
-    ok = r.get("acknowledged")
-    LOG.info(json.dumps(r))
-    if not ok:
+    for r in responses:
+        LOG.info(json.dumps(r))
+    if not all(r.get("acknowledged") for r in responses):
         sys.exit(UNKNOWN_ERROR)
+
+    if validate:
+        for connection, actions, expected, alias_map in zip(
+            connections, plans, expected_maps, fan_out(connections, _alias_map)
+        ):
+            differences = _alias_differences(expected, alias_map, actions)
+            for alias_name, index, change in differences:
+                LOG.error(
+                    "%s - %s: Expected alias %s to be %s index %s.",
+                    connection.cluster,
+                    connection.site,
+                    alias_name,
+                    change,
+                    index,
+                )
+            if differences:
+                sys.exit(UNKNOWN_ERROR)
+
+    for connection, actions in zip(connections, plans):
+        LOG.info(
+            "%s - %s: Applied %d alias actions.",
+            connection.cluster,
+            connection.site,
+            len(actions),
+        )
+
+
+def _alias_map(client):
+    """Aliases of every index, including indices without aliases."""
+    r = client.indices.get_alias(index="*")
+    return {index: set(body.get("aliases", dict())) for index, body in r.items()}
+
+
+def _read_actions(file):
+    """Alias actions of a file, with one index and alias per action."""
+    import yaml  # JSON is parsed as YAML, too.
+
+    try:
+        content = yaml.safe_load(file)
+    except yaml.YAMLError:
+        LOG.exception("Could not parse alias actions file: {}".format(file.name))
+        sys.exit(USER_ERROR)
+
+    if isinstance(content, dict) and "actions" in content:
+        content = content["actions"]
+    if not isinstance(content, list) or not content:
+        LOG.error("Alias actions file should contain a list of actions.")
+        sys.exit(USER_ERROR)
+
+    actions = list()
+    for i, action in enumerate(content, start=1):
+        if (
+            not isinstance(action, dict)
+            or len(action) != 1
+            or next(iter(action)) not in ACTION_TYPES
+            or not isinstance(next(iter(action.values())), dict)
+        ):
+            LOG.error(
+                "Action {} should be one of {}: {}".format(
+                    i, ", ".join(ACTION_TYPES), action
+                )
+            )
+            sys.exit(USER_ERROR)
+
+        ((action_type, args),) = action.items()
+        args = dict(args)
+        indices = _as_list(args.pop("index", None)) + _as_list(args.pop("indices", []))
+        aliases = _as_list(args.pop("alias", None)) + _as_list(args.pop("aliases", []))
+        if not indices or (action_type != "remove_index" and not aliases):
+            LOG.error("Action {} has no index or alias: {}".format(i, action))
+            sys.exit(USER_ERROR)
+
+        for index in indices:
+            if action_type == "remove_index":
+                actions.append({action_type: dict(args, index=index)})
+                continue
+            for alias_name in aliases:
+                actions.append({action_type: dict(args, index=index, alias=alias_name)})
+    return actions
+
+
+def _swap_actions(alias_map, name, from_index, to_index):
+    """Actions that move the aliases matching name between indices, see swap."""
+    from_pattern = re.compile(
+        "^{}$".format("(.*)".join(re.escape(part) for part in from_index.split("*")))
+    )
+    actions = list()
+    for index in sorted(alias_map):
+        match = from_pattern.match(index)
+        if match is None:
+            continue
+        target = to_index.replace("*", match.group(1)) if "*" in to_index else to_index
+        for alias_name in sorted(alias_map[index]):
+            if fnmatchcase(alias_name, name):
+                actions.append({"add": {"index": target, "alias": alias_name}})
+                actions.append({"remove": {"index": index, "alias": alias_name}})
+    return actions
+
+
+def _simulate(alias_map, actions):
+    """
+    Applies actions to a copy of an alias map, as Elasticsearch would.
+
+    :return: Tuple of the resulting alias map, and a list of the errors of actions
+        that would fail
+    """
+    expected = {index: set(aliases) for index, aliases in alias_map.items()}
+    errors = list()
+    if not actions:
+        errors.append("No aliases match.")
+
+    for action in actions:
+        ((action_type, args),) = action.items()
+        indices = [index for index in expected if fnmatchcase(index, args["index"])]
+        if not indices:
+            errors.append("No index matches {}.".format(args["index"]))
+        elif action_type == "add":
+            for index in indices:
+                expected[index].add(args["alias"])
+        elif action_type == "remove":
+            removed = [
+                (index, alias_name)
+                for index in indices
+                for alias_name in expected[index]
+                if fnmatchcase(alias_name, args["alias"])
+            ]
+            if not removed:
+                errors.append(
+                    "Alias {} does not point to {}.".format(
+                        args["alias"], args["index"]
+                    )
+                )
+            for index, alias_name in removed:
+                expected[index].discard(alias_name)
+        else:
+            for index in indices:
+                del expected[index]
+    return expected, errors
+
+
+def _alias_differences(expected, actual, actions):
+    """
+    Differences between an expected and an actual alias map, in the aliases
+    changed by actions.
+
+    :return: Sorted list of (alias, index, "added to" or "removed from") tuples
+    """
+    patterns = {
+        args["alias"] for a in actions for args in a.values() if "alias" in args
+    }
+
+    def pairs(alias_map):
+        return {
+            (alias_name, index)
+            for index, aliases in alias_map.items()
+            for alias_name in aliases
+            if any(fnmatchcase(alias_name, pattern) for pattern in patterns)
+        }
+
+    expected_pairs, actual_pairs = pairs(expected), pairs(actual)
+    return sorted(
+        [(a, i, "added to") for a, i in expected_pairs - actual_pairs]
+        + [(a, i, "removed from") for a, i in actual_pairs - expected_pairs]
+    )
+
+
+def _as_list(value):
+    if value is None:
+        return list()
+    return list(value) if isinstance(value, list) else [value]
@@ -0,0 +1,198 @@
+import logging
+import shlex
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import click
+
+from esok.constants import USER_ERROR
+from esok.session import Session
+from esok.util import format_table
+
+LOG = logging.getLogger(__name__)
+
+OK = "ok"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+Step = namedtuple("Step", ["name", "args", "after"])
+Result = namedtuple("Result", ["status", "exit_code", "seconds"])
+
+
+@click.command()
+@click.argument("file", type=click.File("r"))
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Maximum number of steps running at the same time.",
+)
+@click.pass_context
+def batch(ctx, file, jobs):
+    """Run the steps of FILE, in parallel where possible.
+
+    FILE is a YAML or JSON list of steps. A step has a command, written as on the
+    command line without the leading "esok". It may also have a name, and the
+    names of steps it should run after. Options given to esok before "batch" are
+    the defaults of every command.
+
+    Steps run as soon as the steps they depend on have succeeded, and are
+    skipped if any of them failed. The configuration and connections to
+    Elasticsearch are shared by all steps. A table of the outcome and duration of
+    every step is printed at the end.
+
+    Example of FILE:
+
+        \b
+        - name: create
+          command: index create my-index-v2 mapping.json
+        - name: swap
+          command: alias swap my-alias my-index-v1 my-index-v2
+          after: [create]
+        - command: index touch other-index
+    """
+    steps = _read_steps(file)
+    _check_order(steps)
+
+    session = Session(ctx)
+    start = time.monotonic()
+    try:
+        results = _run_steps(session, steps, jobs)
+    finally:
+        session.close()
+    seconds = time.monotonic() - start
+
+    rows = [
+        (
+            step.name,
+            results[step.name].status,
+            _or_dash(results[step.name].exit_code),
+            _or_dash(results[step.name].seconds, "{:.2f}"),
+            " ".join(shlex.quote(arg) for arg in step.args),
+        )
+        for step in steps
+    ]
+    click.echo()
+    click.echo(format_table(("step", "status", "exit", "seconds", "command"), rows))
+    click.echo("{} steps in {:.2f} seconds".format(len(steps), seconds))
+
+    failed = [results[s.name] for s in steps if results[s.name].status == FAILED]
+    # Steps are only skipped if another step has failed.
+    if failed:
+        sys.exit(failed[0].exit_code)
+
+
+def _read_steps(file):
+    import yaml  # JSON is parsed as YAML, too.
+
+    try:
+        content = yaml.safe_load(file)
+    except yaml.YAMLError:
+        LOG.exception("Could not parse batch file: {}".format(file.name))
+        sys.exit(USER_ERROR)
+
+    if not isinstance(content, list):
+        LOG.error("Batch file should contain a list of steps: {}".format(file.name))
+        sys.exit(USER_ERROR)
+
+    steps = list()
+    for i, step in enumerate(content, start=1):
+        if isinstance(step, str):
+            step = dict(command=step)
+        if not isinstance(step, dict) or "command" not in step:
+            LOG.error("Step {} has no command: {}".format(i, step))
+            sys.exit(USER_ERROR)
+
+        command = step["command"]
+        if isinstance(command, list):
+            args = [str(arg) for arg in command]
+        else:
+            args = shlex.split(str(command), comments=True)
+
+        after = step.get("after", list())
+        if not isinstance(after, list):
+            after = [after]
+
+        name = str(step.get("name", i))
+        steps.append(Step(name, args, [str(a) for a in after]))
+
+    return steps
+
+
+def _check_order(steps):
+    """Exits if step names are not unique, or dependencies cannot be met."""
+    names = [step.name for step in steps]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        LOG.error("Step names must be unique: {}".format(", ".join(duplicates)))
+        sys.exit(USER_ERROR)
+
+    for step in steps:
+        unknown = [name for name in step.after if name not in names]
+        if unknown:
+            LOG.error(
+                'Step "{}" runs after unknown steps: {}'.format(
+                    step.name, ", ".join(unknown)
+                )
+            )
+            sys.exit(USER_ERROR)
+
+    ordered = set()
+    remaining = list(steps)
+    while remaining:
+        ready = [s.name for s in remaining if all(a in ordered for a in s.after)]
+        if not ready:
+            LOG.error(
+                "Steps depend on each other in a cycle: {}".format(
+                    ", ".join(s.name for s in remaining)
+                )
+            )
+            sys.exit(USER_ERROR)
+        ordered.update(ready)
+        remaining = [s for s in remaining if s.name not in ordered]
+
+
+def _run_steps(session, steps, jobs):
+    """Runs steps once their dependencies have succeeded, and returns their results."""
+    results = dict()
+    waiting = list(steps)
+    running = dict()
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while waiting or running:
+            for step in list(waiting):
+                dependencies = [results.get(name) for name in step.after]
+                if any(r is not None and r.status != OK for r in dependencies):
+                    LOG.warning('Skipping step "{}".'.format(step.name))
+                    results[step.name] = Result(SKIPPED, None, None)
+                    waiting.remove(step)
+                elif all(r is not None for r in dependencies):
+                    LOG.info('Starting step "{}".'.format(step.name))
+                    running[executor.submit(_timed_run, session, step.args)] = step
+                    waiting.remove(step)
+
+            # Returns immediately if nothing is running, so skips cascade.
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                exit_code, seconds = future.result()
+                status = OK if exit_code == 0 else FAILED
+                if status == FAILED:
+                    LOG.error('Step "{}" failed.'.format(step.name))
+                results[step.name] = Result(status, exit_code, seconds)
+
+    return results
+
+
+def _timed_run(session, args):
+    start = time.monotonic()
+    exit_code = session.run(args)
+    return exit_code, time.monotonic() - start
+
+
+def _or_dash(value, template="{}"):
+    return "-" if value is None else template.format(value)
@@ -0,0 +1,27 @@
+import logging
+
+import click
+from click_didyoumean import DYMGroup
+
+from esok.cache import metadata_cache
+from esok.config.connection_options import per_connection
+
+LOG = logging.getLogger(__name__)
+
+
+@click.group(cls=DYMGroup)
+def cache():
+    """Cluster metadata cache operations."""
+    pass
+
+
+@cache.command()
+@per_connection()
+def clear(client):
+    """Clear cached metadata of clusters.
+
+    Cluster metadata, i.e. the roles of nodes, is cached in the app directory for the
+    duration set by "metadata_cache_ttl" in the config file.
+    """
+    metadata_cache(client).invalidate()
+    LOG.info("Cleared cached metadata.")
@@ -0,0 +1,262 @@
+import json
+import logging
+import time
+
+import click
+from click_didyoumean import DYMGroup
+
+from esok.config.connection_options import per_connection
+from esok.util import format_table, human_size
+
+LOG = logging.getLogger(__name__)
+
+# Loads of a node, which skew is computed for.
+LOADS = ("shards", "bytes", "docs", "index/s", "query/s")
+NODE_STATS_FILTER_PATH = ",".join(
+    [
+        "nodes.*.name",
+        "nodes.*.indices.indexing.index_total",
+        "nodes.*.indices.search.query_total",
+    ]
+)
+
+
+@click.group(cls=DYMGroup)
+def cluster():
+    """Cluster operations."""
+    pass
+
+
+@cluster.command()
+@click.option(
+    "-i",
+    "--interval",
+    type=click.FloatRange(min=0),
+    default=5.0,
+    show_default=True,
+    metavar="SECONDS",
+    help="Seconds between the two samples that indexing and search rates are "
+    "computed from. 0 skips the rates.",
+)
+@click.option(
+    "-t",
+    "--threshold",
+    type=click.FloatRange(min=0),
+    default=0.1,
+    show_default=True,
+    help="Fraction above the mean number of shard bytes per node, from which a "
+    "node is considered hot.",
+)
+@click.option(
+    "-m",
+    "--max-moves",
+    type=click.IntRange(min=0),
+    default=10,
+    show_default=True,
+    help="Maximum number of shard moves to suggest.",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Choice(["table", "json"]),
+    default="table",
+    show_default=True,
+    help="Output format. The moves in JSON are commands of the cluster reroute API.",
+)
+@per_connection()
+def hotspots(client, interval, threshold, max_moves, output):
+    """Find data nodes with more than their share of shards or load.
+
+    Prints the shard count, shard bytes, documents, indexing and search rate, and
+    disk usage of every data node, the skew (max / mean) of each of them, and
+    shard moves that would even out the shard bytes between nodes.
+
+    Examples:
+
+    \b
+    $ esok cluster hotspots
+    $ esok cluster hotspots -i 0 -o json | jq .moves
+    """
+    before = _node_counters(client)
+    start = time.monotonic()
+    shards = client.cat.shards(
+        format="json", h="index,shard,prirep,state,docs,store,node", bytes="b"
+    )
+    allocation = client.cat.allocation(format="json", h="node,disk.percent")
+    if interval > 0:
+        time.sleep(interval)
+        rates = _rates(before, _node_counters(client), time.monotonic() - start)
+    else:
+        rates = None
+
+    started = [s for s in shards if s["state"] == "STARTED" and s["node"]]
+    if len(started) < len(shards):
+        LOG.warning("%d shards are not started.", len(shards) - len(started))
+
+    # The cat allocation API lists every data node currently in the cluster, also
+    # those without shards, unlike cached metadata, which may be stale.
+    data_nodes = sorted(a["node"] for a in allocation if a["node"] != "UNASSIGNED")
+    nodes = _node_loads(data_nodes, started, rates)
+    disk = {a["node"]: a.get("disk.percent") for a in allocation}
+    skew = {load: _skew([node[load] for node in nodes.values()]) for load in LOADS}
+    moves = _suggest_moves(nodes, started, threshold, max_moves)
+
+    if output == "json":
+        click.echo(
+            json.dumps(
+                dict(
+                    nodes=[dict(nodes[n], node=n, disk=disk.get(n)) for n in nodes],
+                    skew=skew,
+                    moves=[
+                        dict(
+                            move=dict(
+                                index=m["index"],
+                                shard=int(m["shard"]),
+                                from_node=m["from"],
+                                to_node=m["to"],
+                            )
+                        )
+                        for m in moves
+                    ],
+                )
+            )
+        )
+        return
+
+    loads = [load for load in LOADS if rates is not None or not load.endswith("/s")]
+    rows = [
+        [name] + [_cell(load, node[load]) for load in loads] + [disk.get(name) or "-"]
+        for name, node in nodes.items()
+    ]
+    rows.append(["skew"] + ["{:.2f}".format(skew[load]) for load in loads] + ["-"])
+    click.echo(format_table(["node"] + loads + ["disk%"], rows))
+
+    click.echo()
+    if not moves:
+        click.echo("No shard moves suggested.")
+        return
+    click.echo("Suggested shard moves:")
+    click.echo(
+        format_table(
+            ["index", "shard", "prirep", "bytes", "from", "to"],
+            [
+                [m["index"], m["shard"], m["prirep"], human_size(m["bytes"])]
+                + [m["from"], m["to"]]
+                for m in moves
+            ],
+        )
+    )
+
+
+def _node_counters(client):
+    r = client.nodes.stats(
+        metric="indices",
+        index_metric="indexing,search",
+        filter_path=NODE_STATS_FILTER_PATH,
+    )
+    return {
+        node["name"]: (
+            node["indices"]["indexing"]["index_total"],
+            node["indices"]["search"]["query_total"],
+        )
+        for node in r.get("nodes", dict()).values()
+    }
+
+
+def _rates(before, after, seconds):
+    """Indexing and search rates of nodes, between two samples of counters."""
+    return {
+        name: tuple(
+            max(value - old, 0) / seconds
+            for value, old in zip(counters, before.get(name, counters))
+        )
+        for name, counters in after.items()
+    }
+
+
+def _node_loads(data_nodes, shards, rates=None):
+    """
+    Loads of each data node.
+
+    :param data_nodes: Names of the data nodes, which may have no shards
+    :param shards: Started shards, as returned by the cat shards API in bytes
+    :param rates: Indexing and search rates by node name, if sampled
+    :return: Dict of node name to dict of LOADS
+    """
+    nodes = {name: dict.fromkeys(LOADS, 0) for name in data_nodes}
+    for shard in shards:
+        node = nodes.setdefault(shard["node"], dict.fromkeys(LOADS, 0))
+        node["shards"] += 1
+        node["bytes"] += int(shard["store"] or 0)
+        node["docs"] += int(shard["docs"] or 0)
+
+    for name, (indexing, search) in (rates or dict()).items():
+        if name in nodes:
+            nodes[name].update({"index/s": indexing, "query/s": search})
+    return nodes
+
+
+def _skew(values):
+    """Max over mean of values: 1.0 is perfectly even."""
+    mean = sum(values) / float(len(values)) if values else 0
+    return max(values) / mean if mean else 1.0
+
+
+def _suggest_moves(nodes, shards, threshold, max_moves):
+    """
+    Greedily suggests moves of shards from the node with the most shard bytes to
+    the one with the least, as long as that evens out the bytes, and the source
+    is hot.
+
+    A node never gets two copies of the same shard.
+    """
+    bytes_by_node = {name: node["bytes"] for name, node in nodes.items()}
+    placed = {(s["index"], s["shard"], s["node"]) for s in shards}
+    remaining = sorted(shards, key=lambda s: int(s["store"] or 0), reverse=True)
+    mean = sum(bytes_by_node.values()) / float(len(bytes_by_node) or 1)
+
+    moves = list()
+    while len(moves) < max_moves:
+        hot = max(bytes_by_node, key=bytes_by_node.get)
+        cold = min(bytes_by_node, key=bytes_by_node.get)
+        if bytes_by_node[hot] <= mean * (1 + threshold):
+            break
+
+        gap = bytes_by_node[hot] - bytes_by_node[cold]
+        candidate = next(
+            (
+                s
+                for s in remaining
+                if s["node"] == hot
+                and 0 < int(s["store"] or 0) < gap
+                and (s["index"], s["shard"], cold) not in placed
+            ),
+            None,
+        )
+        if candidate is None:
+            break
+
+        size = int(candidate["store"])
+        remaining.remove(candidate)
+        placed.discard((candidate["index"], candidate["shard"], hot))
+        placed.add((candidate["index"], candidate["shard"], cold))
+        bytes_by_node[hot] -= size
+        bytes_by_node[cold] += size
+        moves.append(
+            dict(
+                index=candidate["index"],
+                shard=candidate["shard"],
+                prirep=candidate["prirep"],
+                bytes=size,
+            )
+        )
+        moves[-1].update({"from": hot, "to": cold})
+    return moves
+
+
+def _cell(load, value):
+    if load == "bytes":
+        return human_size(value)
+    if load.endswith("/s"):
+        return "{:.1f}".format(value)
+    return value
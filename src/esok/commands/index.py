@@ -1,18 +1,95 @@
+import csv
+import hashlib
+import heapq
+import itertools
 import json
 import logging
 import sys
+import time
+from collections import Counter, deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import click
 from click_didyoumean import DYMGroup
-from elasticsearch import Elasticsearch, TransportError
-from elasticsearch.helpers import bulk, scan
 
-from esok.config.connection_options import per_connection, resolve_remote
+from esok import cache, metrics
+from esok.config.connection_options import (
+    ACKNOWLEDGED,
+    all_connections,
+    echo_connection_header,
+    fan_out,
+    per_connection,
+    resolve_remote,
+    response_filter,
+)
 from esok.constants import UNKNOWN_ERROR, USER_ERROR
-from esok.util import clean_index
+from esok.util import (
+    clean_index,
+    format_table,
+    human_size,
+    parse_size,
+    prefetched,
+    task_errors,
+    wait_for_task,
+)
 
 LOG = logging.getLogger(__name__)
 
+# Default columns of esok index list, the same as those of the cat indices API.
+LIST_COLUMNS = (
+    "health",
+    "status",
+    "index",
+    "uuid",
+    "pri",
+    "rep",
+    "docs.count",
+    "docs.deleted",
+    "store.size",
+    "pri.store.size",
+)
+
+# Paths of the index statistics that esok index stats --summary needs.
+SUMMARY_FILTER_PATH = ",".join(
+    [
+        "indices.*.primaries.docs.count",
+        "indices.*.total.store.size_in_bytes",
+        "indices.*.total.indexing.index_total",
+        "indices.*.total.search.query_total",
+    ]
+)
+
+# Columns of esok index stats --watch: the counter that each column is the rate of,
+# and a factor that turns milliseconds per second into a share of time in percent.
+WATCH_COLUMNS = (
+    ("index/s", "indexing.index_total", 1),
+    ("query/s", "search.query_total", 1),
+    ("merge%", "merges.total_time_in_millis", 0.1),
+    ("refresh%", "refresh.total_time_in_millis", 0.1),
+)
+WATCH_HEADER = [column for column, _, _ in WATCH_COLUMNS]
+WATCH_FILTER_PATH = ",".join(
+    "{}.total.{}".format(prefix, path)
+    for prefix in ("_all", "indices.*")
+    for _, path, _ in WATCH_COLUMNS
+)
+
+# Maximum length of comma-separated index names in the URL of a request.
+MAX_URL_INDICES_LENGTH = 3000
+
+ReplicaPlan = namedtuple(
+    "ReplicaPlan", ["index", "primaries", "replicas", "exact", "target"]
+)
+
+
+def _size_option(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return parse_size(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
 
 @click.group(cls=DYMGroup)
 def index():
@@ -21,6 +98,7 @@ def index():
 
 
 @index.command(name="list")
+@click.argument("pattern", type=click.STRING, required=False)
 @click.option(
     "-s",
     "--sort",
@@ -28,13 +106,114 @@ def index():
     metavar="COLUMN",
     show_default=True,
     help="Comma-separated list of column names or column aliases used to sort the "
-    "response.",
+    "response. Append :desc to a column to sort in descending order.",
 )
-@per_connection()
-def list_indices(client, sort):
-    """List indices."""
-    r = client.cat.indices(v=True, s=sort)
-    click.echo(r)
+@click.option(
+    "--columns",
+    default=",".join(LIST_COLUMNS),
+    metavar="COLUMN",
+    show_default=True,
+    help="Comma-separated list of column names to show.",
+)
+@click.option(
+    "--health",
+    type=click.Choice(["green", "yellow", "red"]),
+    help="Only list indices with the given health.",
+)
+@click.option(
+    "--min-size",
+    callback=_size_option,
+    metavar="SIZE",
+    help="Only list indices with at least this store size, e.g. 10gb.",
+)
+@click.option(
+    "--max-size",
+    callback=_size_option,
+    metavar="SIZE",
+    help="Only list indices with at most this store size, e.g. 500mb.",
+)
+@all_connections()
+def list_indices(connections, pattern, sort, columns, health, min_size, max_size):
+    """List indices matching a pattern, of all sites in one table.
+
+    Examples:
+
+    \b
+    $ esok index list
+    $ esok index list 'logs-*' --health yellow
+    $ esok index list --min-size 10gb -s store.size:desc
+    $ esok index list --columns index,docs.count -s docs.count:desc
+    """
+    columns = columns.split(",")
+    sort_keys = [key.partition(":") for key in sort.split(",")]
+    fetched = list(columns)
+    for column in [key for key, _, _ in sort_keys] + ["store.size"]:
+        if column not in fetched:
+            fetched.append(column)
+
+    def _list(client):
+        return client.cat.indices(
+            index=pattern,
+            format="json",
+            h=",".join(fetched),
+            s=sort,
+            bytes="b",
+            health=health,
+        )
+
+    rows = list()
+    for connection, indices in zip(connections, fan_out(connections, _list)):
+        for row in indices:
+            size = int(row.get("store.size") or 0)
+            if (min_size is None or size >= min_size) and (
+                max_size is None or size <= max_size
+            ):
+                rows.append(dict(row, site=connection.site))
+
+    # Each site is already sorted, but the sites are merged here. Rows are keyed
+    # by column names, also if sorted by column aliases.
+    keys = [key for key, _, _ in sort_keys]
+    if rows and any(key not in rows[0] for key in keys):
+        keys = _column_names(connections[0].client, keys)
+    for key, (_, _, order) in reversed(list(zip(keys, sort_keys))):
+        rows.sort(key=lambda r: _sort_value(r.get(key)), reverse=order == "desc")
+
+    header = columns
+    if any(connection.site is not None for connection in connections):
+        header = ["site"] + columns
+    click.echo(
+        format_table(
+            header,
+            [[_list_cell(column, r.get(column)) for column in header] for r in rows],
+        )
+    )
+
+
+def _column_names(client, keys):
+    """Names of columns of the cat indices API, which keys may be aliases of."""
+    names = dict()
+    for line in client.cat.indices(help=True).splitlines():
+        cells = [cell.strip() for cell in line.split("|")]
+        if len(cells) > 1:
+            for alias in cells[1].split(","):
+                names[alias.strip()] = cells[0]
+    return [names.get(key, key) for key in keys]
+
+
+def _sort_value(value):
+    try:
+        return 0, float(value), ""
+    except (TypeError, ValueError):
+        return 1, 0.0, value or ""
+
+
+def _list_cell(column, value):
+    if value is None:
+        return "-"
+    # Sizes are fetched in bytes for sorting and filtering.
+    if column.endswith("size") and value.isdigit():
+        return human_size(value)
+    return value
 
 
 @index.command()
@@ -42,7 +221,7 @@ def list_indices(client, sort):
 @per_connection()
 def touch(client, name):
     """Create an index without mapping."""
-    r = client.indices.create(index=name)
+    r = client.indices.create(index=name, filter_path=response_filter(ACKNOWLEDGED))
     LOG.info(json.dumps(r))
     ok = r.get("acknowledged")
     if not ok:
@@ -57,7 +236,9 @@ def create(client, name, mapping):
     """Create a new index from given mapping."""
     with open(mapping, "r") as f:
         mapping_json = json.load(f)
-    r = client.indices.create(index=name, body=mapping_json)
+    r = client.indices.create(
+        index=name, body=mapping_json, filter_path=response_filter(ACKNOWLEDGED)
+    )
     ok = r.get("acknowledged")
     LOG.info(json.dumps(r))
     if not ok:
@@ -94,6 +275,8 @@ def copy(client, site, source_index, new_index, remote, skip_mapping, skip_setti
 
     This will not copy the data of the index - use the reindex command for that.
     """
+    from elasticsearch import TransportError
+
     # Resolve which source client to use
     if remote is not None:
         source_client = resolve_remote(remote, site)
@@ -112,7 +295,9 @@ def copy(client, site, source_index, new_index, remote, skip_mapping, skip_setti
 
     cleaned_mapping = clean_index(source_mapping, skip_settings, skip_mapping)
 
-    r = client.indices.create(index=new_index, body=cleaned_mapping)
+    r = client.indices.create(
+        index=new_index, body=cleaned_mapping, filter_path=response_filter(ACKNOWLEDGED)
+    )
     ack = r.get("acknowledged")
     LOG.info(json.dumps(r))
     if not ack:
@@ -122,43 +307,517 @@ def copy(client, site, source_index, new_index, remote, skip_mapping, skip_setti
         )
 
 
+@index.command()
+@click.argument("source_index", type=click.STRING)
+@click.argument("target_index", type=click.STRING)
+@click.option(
+    "-R",
+    "--remote",
+    type=click.STRING,
+    metavar="HOSTNAME",
+    help="Remote cluster or hostname of the source index. If no cluster with the "
+    "given name is configured, the passed value will be used as the "
+    "hostname directly.",
+)
+@click.option(
+    "-c",
+    "--chunk-size",
+    type=click.INT,
+    default=1000,
+    show_default=True,
+    help="Number of documents to fetch from each index in each individual request.",
+)
+@click.option(
+    "-i",
+    "--slices",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of slices of each index to fetch concurrently.",
+)
+@per_connection(include_site=True)
+def diff(client, site, source_index, target_index, remote, chunk_size, slices):
+    """Compare the documents of two indices.
+
+    Documents are compared by _id and a hash of their _source. Each difference is
+    printed on its own line: "missing" documents only exist in the source index,
+    "extra" documents only exist in the target index and "changed" documents exist
+    in both, but with different contents.
+
+    With --slices, each index is read with that many sliced scrolls, each sorted
+    by _id, which are merged back into one sorted stream.
+
+    Exits with a non-zero status if the indices differ.
+
+    \b
+    $ esok index diff source-index target-index
+    $ esok -c target index diff -R source-cluster source-index target-index
+    """
+    if remote is not None:
+        source_client = resolve_remote(remote, site)
+    else:
+        source_client = client
+
+    # Both sides are fetched concurrently, while the comparison only ever holds a
+    # few pages of each slice in memory.
+    source_docs = _sorted_id_hashes(source_client, source_index, chunk_size, slices)
+    target_docs = _sorted_id_hashes(client, target_index, chunk_size, slices)
+
+    counts = dict(missing=0, extra=0, changed=0)
+    for kind, doc_id in _merge_join(source_docs, target_docs):
+        counts[kind] += 1
+        click.echo("{}\t{}".format(kind, doc_id))
+
+    click.echo(
+        "{missing} missing, {extra} extra, {changed} changed.".format(**counts),
+        err=True,
+    )
+    if any(counts.values()):
+        sys.exit(UNKNOWN_ERROR)
+
+
 @index.command()
 @click.argument("name", type=click.STRING)
 @per_connection()
-def delete(client: Elasticsearch, name):
+def delete(client, name):
     """Delete an index."""
     # TODO (haeger) Should prompt confirmation if there is an alias on the index
     if name in ["_all", "*"]:
         click.confirm("Really delete ALL indices on the cluster?", abort=True)
 
-    r = client.indices.delete(index=name)
+    r = client.indices.delete(index=name, filter_path=response_filter(ACKNOWLEDGED))
     LOG.info(json.dumps(r))
     ok = r.get("acknowledged")
     if not ok:
         sys.exit(UNKNOWN_ERROR)
 
 
+def _by_query_options(f):
+    f = click.option(
+        "-p",
+        "--poll-interval",
+        type=click.FLOAT,
+        default=5.0,
+        show_default=True,
+        help="Seconds to wait between checking on the task, when waiting for it.",
+    )(f)
+    f = click.option(
+        "-w",
+        "--wait",
+        is_flag=True,
+        help="Wait for the task to finish, and print its response.",
+    )(f)
+    f = click.option(
+        "--conflicts",
+        type=click.Choice(["abort", "proceed"]),
+        default="abort",
+        show_default=True,
+        help="Whether to abort or continue on version conflicts.",
+    )(f)
+    f = click.option(
+        "-r",
+        "--requests-per-second",
+        type=click.FLOAT,
+        help="Throttle of the task, in sub-requests per second. Unthrottled if not "
+        "given.",
+    )(f)
+    return click.option(
+        "-i",
+        "--slices",
+        type=click.IntRange(min=0),
+        default=0,
+        show_default=True,
+        help='Count of slices to use. 0 means "auto".',
+    )(f)
+
+
+@index.command(name="delete-by-query")
+@click.argument("name", type=click.STRING)
+@click.argument("query", type=click.Path(exists=True, dir_okay=False, readable=True))
+@_by_query_options
+@per_connection()
+def delete_by_query(
+    client, name, query, slices, requests_per_second, conflicts, wait, poll_interval
+):
+    """Start a task that deletes the documents matching a query.
+
+    QUERY is a JSON file with the body of the request, such as {"query": {...}}.
+    The task runs in the background unless --wait is given. Its progress can be
+    followed with "esok reindex progress TASK_ID", and it can be cancelled with
+    "esok reindex cancel TASK_ID".
+
+    \b
+    $ esok index delete-by-query logs-2021.01 old-docs.json -r 500
+    $ esok index delete-by-query 'logs-*' old-docs.json -i 10 --wait
+    """
+    if name in ["_all", "*"]:
+        click.confirm("Really delete from ALL indices on the cluster?", abort=True)
+
+    with open(query, "r") as f:
+        body = json.load(f)
+    if "query" not in body:
+        LOG.error("The query file should have a query: %s", query)
+        sys.exit(USER_ERROR)
+
+    _by_query(
+        client,
+        "delete_by_query",
+        name,
+        body,
+        slices,
+        requests_per_second,
+        conflicts,
+        wait,
+        poll_interval,
+    )
+
+
+@index.command(name="update-by-query")
+@click.argument("name", type=click.STRING)
+@click.argument(
+    "query",
+    type=click.Path(exists=True, dir_okay=False, readable=True),
+    required=False,
+)
+@_by_query_options
+@per_connection()
+def update_by_query(
+    client, name, query, slices, requests_per_second, conflicts, wait, poll_interval
+):
+    """Start a task that updates the documents matching a query.
+
+    QUERY is a JSON file with the body of the request, such as a query and a
+    script. Without it, all documents are updated in place, e.g. to pick up a new
+    field of the mapping. The task runs in the background unless --wait is given.
+    Its progress can be followed with "esok reindex progress TASK_ID", and it can
+    be cancelled with "esok reindex cancel TASK_ID".
+
+    \b
+    $ esok index update-by-query products backfill.json -r 1000
+    $ esok index update-by-query products --conflicts proceed --wait
+    """
+    if query is not None:
+        with open(query, "r") as f:
+            body = json.load(f)
+    else:
+        body = None
+
+    _by_query(
+        client,
+        "update_by_query",
+        name,
+        body,
+        slices,
+        requests_per_second,
+        conflicts,
+        wait,
+        poll_interval,
+    )
+
+
+def _by_query(
+    client,
+    operation,
+    name,
+    body,
+    slices,
+    requests_per_second,
+    conflicts,
+    wait,
+    poll_interval,
+):
+    """
+    Starts a delete or update by query task, and waits for it if asked to.
+
+    :param operation: "delete_by_query" or "update_by_query"
+    """
+    params = dict(conflicts=conflicts, slices="auto" if slices == 0 else slices)
+    if requests_per_second is not None:
+        params["requests_per_second"] = requests_per_second
+
+    r = getattr(client, operation)(
+        index=name, body=body, wait_for_completion=False, **params
+    )
+    task_id = r.get("task")
+    if not wait:
+        click.echo("Task ID: {}".format(task_id))
+        return
+
+    metrics.job("index_" + operation)
+    task_info = wait_for_task(client, task_id, poll_interval, metrics.measure_task)
+    click.echo(json.dumps(task_info.get("response", dict())))
+    errors = task_errors(task_info)
+    if errors:
+        LOG.error("Task %s failed: %s", task_id, json.dumps(errors))
+        sys.exit(UNKNOWN_ERROR)
+
+
 @index.command()
 @click.argument("name", type=click.STRING)
 @per_connection()
 def get(client, name):
     """Get index details."""
-    r = client.indices.get(index=name)
+    r = client.indices.get(index=name, filter_path=response_filter())
     click.echo(json.dumps(r))
 
 
 @index.command()
 @click.argument("name", type=click.STRING)
-@per_connection()
-def stats(client, name):
-    """Fetch index statistics."""
-    r = client.indices.stats(index=name)
-    click.echo(json.dumps(r))
-    ok = "_all" in r.keys()
-    if not ok:
+@click.option(
+    "-m",
+    "--metric",
+    metavar="METRIC",
+    help="Comma-separated list of statistics to fetch, e.g. docs,store.",
+)
+@click.option(
+    "-S",
+    "--summary",
+    is_flag=True,
+    help="Print totals and the top indices by size, documents, indexing rate and "
+    "search rate, instead of the full statistics.",
+)
+@click.option(
+    "-n",
+    "--top",
+    type=click.IntRange(min=1),
+    default=10,
+    show_default=True,
+    help="Number of indices in each top list of the summary, and per site when "
+    "watching.",
+)
+@click.option(
+    "-i",
+    "--interval",
+    type=click.FloatRange(min=0),
+    metavar="SECONDS",
+    help="Seconds between the samples that rates are computed from. The summary "
+    "only includes rates if given, after waiting this long. Defaults to 5 when "
+    "watching.",
+)
+@click.option(
+    "-w",
+    "--watch",
+    is_flag=True,
+    help="Continuously print the indexing and query rates, and the share of time "
+    "spent merging and refreshing, of each site and its busiest indices.",
+)
+@click.option(
+    "--count",
+    type=click.IntRange(min=1),
+    help="Number of times to print the rates when watching. Runs until interrupted "
+    "by default.",
+)
+@click.option(
+    "--csv",
+    "csv_file",
+    type=click.File("a"),
+    help="Append the rates of all indices to a CSV file when watching.",
+)
+@all_connections()
+def stats(
+    connections,
+    name,
+    metric,
+    summary,
+    top,
+    interval,
+    watch,
+    count,
+    csv_file,
+):
+    """Fetch index statistics.
+
+    Examples:
+
+    \b
+    $ esok index stats index-name
+    $ esok index stats -m docs,store 'logs-*'
+    $ esok -F 'indices.*.primaries.docs.count' index stats 'logs-*'
+    $ esok index stats --summary 'logs-*'
+    $ esok index stats --watch -i 10 --csv rates.csv 'logs-*'
+    """
+    if watch:
+        interval = 5.0 if interval is None else interval
+        _watch_stats(connections, name, interval, top, count, csv_file)
+        return
+
+    failed = False
+    if summary:
+        outputs = fan_out(
+            connections,
+            lambda client: _stats_summary(client, name, top, interval or 0),
+        )
+    else:
+        filter_path = response_filter()
+        responses = fan_out(
+            connections,
+            lambda client: client.indices.stats(
+                index=name, metric=metric, filter_path=filter_path
+            ),
+        )
+        failed = filter_path is None and any("_all" not in r for r in responses)
+        outputs = [json.dumps(r) for r in responses]
+
+    for connection, output in zip(connections, outputs):
+        if len(connections) > 1:
+            echo_connection_header(connection.cluster, connection.site)
+        click.echo(output)
+    if failed:
         sys.exit(UNKNOWN_ERROR)
 
 
+def _stats_summary(client, name, top, interval):
+    """Totals and top indices of the statistics of an index pattern."""
+    # Only the numbers that are summarized are fetched.
+    sample = _summary_sample(client, name)
+    columns = ["docs", "size"]
+    if interval > 0:
+        time.sleep(interval)
+        before, sample = sample, _summary_sample(client, name)
+        columns += ["indexing/s", "search/s"]
+        for index, values in sample.items():
+            previous = before.get(index, values)
+            values["indexing/s"] = (values["indexed"] - previous["indexed"]) / interval
+            values["search/s"] = (values["searched"] - previous["searched"]) / interval
+
+    totals = {column: sum(v[column] for v in sample.values()) for column in columns}
+    lines = [
+        format_table(
+            ["indices"] + columns,
+            [[len(sample)] + [_summary_cell(c, totals[c]) for c in columns]],
+        )
+    ]
+    for column in columns:
+        ranked = sorted(sample.items(), key=lambda i: i[1][column], reverse=True)
+        rows = [
+            [index] + [_summary_cell(c, values[c]) for c in columns]
+            for index, values in ranked[:top]
+        ]
+        lines.append("")
+        lines.append("Top {} by {}:".format(top, column))
+        lines.append(format_table(["index"] + columns, rows))
+    return "\n".join(lines)
+
+
+def _summary_sample(client, name):
+    r = client.indices.stats(
+        index=name,
+        metric="docs,store,indexing,search",
+        filter_path=SUMMARY_FILTER_PATH,
+    )
+    return {
+        index: dict(
+            docs=stats["primaries"]["docs"]["count"],
+            size=stats["total"]["store"]["size_in_bytes"],
+            indexed=stats["total"]["indexing"]["index_total"],
+            searched=stats["total"]["search"]["query_total"],
+        )
+        for index, stats in r.get("indices", dict()).items()
+    }
+
+
+def _watch_stats(connections, name, interval, top, count, csv_file):
+    """Prints the rates of the counters in WATCH_COLUMNS, until interrupted."""
+    writer = None
+    if csv_file is not None:
+        writer = csv.writer(csv_file)
+        if csv_file.tell() == 0:
+            writer.writerow(["timestamp", "site", "index"] + WATCH_HEADER)
+
+    def _sample():
+        return time.monotonic(), fan_out(
+            connections, lambda client: _watch_sample(client, name)
+        )
+
+    # Only the previous sample is kept, so memory does not grow over time.
+    previous = _sample()
+    printed = 0
+    try:
+        while count is None or printed < count:
+            time.sleep(interval)
+            sample = _sample()
+            rates = [
+                _watch_rates(before, after, sample[0] - previous[0])
+                for before, after in zip(previous[1], sample[1])
+            ]
+            previous = sample
+
+            timestamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+            if writer is not None:
+                for connection, site_rates in zip(connections, rates):
+                    for index, values in sorted(site_rates.items()):
+                        writer.writerow([timestamp, connection.site, index] + values)
+                csv_file.flush()
+
+            if sys.stdout.isatty():
+                click.clear()
+            elif printed:
+                click.echo()
+            click.echo("Every {}s, at {}:".format(interval, timestamp))
+            click.echo(_watch_table(connections, rates, top))
+            printed += 1
+    except KeyboardInterrupt:
+        pass
+
+
+def _watch_sample(client, name):
+    r = client.indices.stats(
+        index=name,
+        metric="indexing,search,merge,refresh",
+        filter_path=WATCH_FILTER_PATH,
+    )
+    indices = dict(r.get("indices", dict()), _all=r.get("_all", dict()))
+    return {
+        index: [
+            _path_value(stats.get("total", dict()), path)
+            for _, path, _ in WATCH_COLUMNS
+        ]
+        for index, stats in indices.items()
+    }
+
+
+def _watch_rates(before, after, seconds):
+    rates = dict()
+    for index, values in after.items():
+        # Counters restart at 0 when an index is recreated.
+        previous = before.get(index, values)
+        rates[index] = [
+            max(value - old, 0) / seconds * factor
+            for value, old, (_, _, factor) in zip(values, previous, WATCH_COLUMNS)
+        ]
+    return rates
+
+
+def _watch_table(connections, rates, top):
+    """Rates of each site, followed by those of its busiest indices."""
+    show_site = any(connection.site is not None for connection in connections)
+    rows = list()
+    for connection, site_rates in zip(connections, rates):
+        site_rates = dict(site_rates)
+        total = site_rates.pop("_all")
+        busiest = sorted(site_rates.items(), key=lambda i: i[1], reverse=True)
+        for index, values in [("_all", total)] + busiest[:top]:
+            row = [index] + ["{:.1f}".format(value) for value in values]
+            rows.append(([connection.site or "-"] if show_site else []) + row)
+
+    header = (["site"] if show_site else []) + ["index"] + WATCH_HEADER
+    return format_table(header, rows)
+
+
+def _path_value(stats, path):
+    for key in path.split("."):
+        stats = stats.get(key, dict())
+    return stats or 0
+
+
+def _summary_cell(column, value):
+    if column == "size":
+        return human_size(value)
+    if column.endswith("/s"):
+        return "{:.1f}".format(value)
+    return value
+
+
 @index.command()
 @click.argument("name", type=click.STRING)
 @click.argument("shard_count", type=click.INT)
@@ -171,69 +830,583 @@ def stats(client, name):
 @click.option(
     "-n", "--nodes", type=click.INT, help="Manually set node count of the cluster."
 )
+@click.option(
+    "-y", "--yes", is_flag=True, help="Apply the plan without asking for confirmation."
+)
+@click.option("--dry-run", is_flag=True, help="Only print the plan.")
 @per_connection()
-def shards(client, name, shard_count, absolute, nodes):
-    """Set the number of shards per machine."""
+def shards(client, name, shard_count, absolute, nodes, yes, dry_run):
+    """Set the number of shards per machine, of indices matching a pattern.
+
+    The replica counts of all matching indices are planned from one snapshot of
+    the cluster and printed as a table. Once confirmed, indices with the same new
+    replica count are updated together.
+
+    Examples:
+
+    \b
+    $ esok index shards index-name 2
+    $ esok index shards 'logs-*,metrics-*' 1 --dry-run
+    $ esok index shards -a 'logs-2021*' 0
+    """
     # TODO (haeger) Need to check if shard allocation and rebalancing is enabled
     if absolute:
-        replica_count = shard_count
+        data_node_count = None
         LOG.info("Using manually set replica count: {}".format(shard_count))
+    elif nodes:
+        LOG.debug("Using manually set node count: {}".format(nodes))
+        data_node_count = nodes
+    else:
+        data_node_count = cache.data_node_count(client)
+        LOG.debug("Resolved data node count from cluster: {}".format(data_node_count))
+    LOG.debug("Desired shard count per host: {}".format(shard_count))
+
+    indices = client.cat.indices(index=name, h="index,pri,rep", format="json")
+    plan = [
+        _replica_plan(
+            i["index"], int(i["pri"]), int(i["rep"]), shard_count, data_node_count
+        )
+        for i in sorted(indices, key=lambda i: i["index"])
+    ]
+    click.echo(
+        format_table(
+            ("index", "pri", "rep", "new rep", "note"),
+            [
+                (p.index, p.primaries, p.replicas, p.target, _replica_note(p))
+                for p in plan
+            ],
+        )
+    )
 
+    changes = [p for p in plan if p.target != p.replicas]
+    if not changes:
+        click.echo("No replica counts to change.")
+        return
+    if dry_run:
+        return
+
+    rounded = any(not p.exact.is_integer() for p in changes)
+    if not yes and (rounded or len(changes) > 1):
+        if rounded:
+            click.echo(
+                "The cluster configuration and desired shards per machine resulted "
+                "in fractional replica counts, which were rounded down."
+            )
+        if not click.confirm("Do you want to change {} indices?".format(len(changes))):
+            sys.exit()
+
+    by_target = dict()
+    for p in changes:
+        by_target.setdefault(p.target, list()).append(p.index)
+
+    request_count = 0
+    for target, names in sorted(by_target.items()):
+        LOG.info("Setting {} replicas on {} indices.".format(target, len(names)))
+        for batch in _url_batches(names):
+            body = {"index": {"number_of_replicas": target}}
+            r = client.indices.put_settings(
+                body, index=",".join(batch), filter_path=response_filter(ACKNOWLEDGED)
+            )
+            request_count += 1
+            LOG.info(json.dumps(r))
+            if not r.get("acknowledged"):
+                sys.exit(UNKNOWN_ERROR)
+
+    click.echo(
+        "Changed the replica count of {} indices in {} requests.".format(
+            len(changes), request_count
+        )
+    )
+
+
+def _replica_plan(index, primaries, replicas, shard_count, data_node_count):
+    """
+    Plans the replica count of an index.
+
+    :param shard_count: Desired number of shards per data node, or the absolute
+           replica count if data_node_count is None
+    """
+    if data_node_count is None:
+        exact = float(shard_count)
+    else:
+        exact = (shard_count * data_node_count - primaries) / float(primaries)
+        # For the edge case where replica count == -1
+        exact = max(exact, 0.0)
+    return ReplicaPlan(index, primaries, replicas, exact, int(exact))
+
+
+def _replica_note(plan):
+    if plan.target == plan.replicas:
+        return "unchanged"
+    if not plan.exact.is_integer():
+        return "rounded from {:.2f}".format(plan.exact)
+    return ""
+
+
+def _url_batches(names):
+    """Splits index names into batches that keep request URLs short."""
+    batch = list()
+    length = 0
+    for name in names:
+        if batch and length + len(name) + 1 > MAX_URL_INDICES_LENGTH:
+            yield batch
+            batch = list()
+            length = 0
+        batch.append(name)
+        length += len(name) + 1
+    if batch:
+        yield batch
+
+
+def _max_concurrent_option(f):
+    return click.option(
+        "-m",
+        "--max-concurrent",
+        type=click.IntRange(min=1),
+        default=2,
+        show_default=True,
+        help="Maximum number of indices processed at the same time, per cluster.",
+    )(f)
+
+
+def _poll_interval_option(f):
+    return click.option(
+        "-p",
+        "--poll-interval",
+        type=click.FloatRange(min=0.1),
+        default=5.0,
+        show_default=True,
+        help="Seconds between progress reports of running operations.",
+    )(f)
+
+
+def _max_wait_option(f):
+    return click.option(
+        "-w",
+        "--max-wait",
+        type=click.IntRange(min=1),
+        default=3600,
+        show_default=True,
+        metavar="SECONDS",
+        help="Maximum number of seconds to wait for each operation.",
+    )(f)
+
+
+@index.command()
+@click.argument("pattern", type=click.STRING)
+@click.option(
+    "-s",
+    "--max-segments",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of segments to merge each shard into.",
+)
+@click.option(
+    "--only-expunge-deletes",
+    is_flag=True,
+    help="Only merge away deleted documents, instead of merging into segments.",
+)
+@_max_concurrent_option
+@_poll_interval_option
+@_max_wait_option
+@per_connection()
+def forcemerge(
+    client,
+    pattern,
+    max_segments,
+    only_expunge_deletes,
+    max_concurrent,
+    poll_interval,
+    max_wait,
+):
+    """Force merge the indices matching PATTERN.
+
+    Indices are merged one request at a time each, with at most --max-concurrent
+    running at the same time. The segment counts of running merges are printed
+    every poll interval, and those of every index before and after merging at
+    the end.
+
+    \b
+    $ esok index forcemerge 'logs-2021.*' -m 4
+    """
+    indices = _matching_indices(client, pattern)
+    if not indices:
+        LOG.error("No indices match %s.", pattern)
+        sys.exit(USER_ERROR)
+
+    if only_expunge_deletes:
+        params = dict(only_expunge_deletes=True)
     else:
-        if not nodes:
-            # Fetch node count.
-            r = client.nodes.stats(
-                metric="process"
-            )  # Using this metric because payload is small
-            cluster_node_count = r.get("nodes").values()
-            # Figure out how many data nodes there are in this cluster
-            data_node_count = sum(
-                1 for item in cluster_node_count if "data" in item.get("roles")
+        params = dict(max_num_segments=max_segments)
+
+    def _merge(name):
+        client.indices.forcemerge(
+            index=name, request_timeout=max_wait, filter_path="_shards", **params
+        )
+
+    def _progress(name):
+        return "{} segments".format(_segment_counts(client, [name])[name])
+
+    before = _segment_counts(client, indices)
+    results = _run_bounded(indices, _merge, _progress, max_concurrent, poll_interval)
+    after = _segment_counts(client, indices)
+    _echo_optimizations({i: i for i in indices}, results, before, after)
+
+
+@index.command()
+@click.argument("pattern", type=click.STRING)
+@click.option(
+    "-t",
+    "--target-template",
+    type=click.STRING,
+    default="{index}-shrunk",
+    show_default=True,
+    help='Name of the shrunk index. "{index}" is replaced with the name of the '
+    "source index.",
+)
+@click.option(
+    "-s",
+    "--shards",
+    "shard_count",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of primary shards of the shrunk indices.",
+)
+@click.option(
+    "--node",
+    type=click.STRING,
+    help="Data node to gather the shards on. Defaults to the node that already "
+    "holds the most shards of each index.",
+)
+@_max_concurrent_option
+@_poll_interval_option
+@_max_wait_option
+@click.option(
+    "-y", "--yes", is_flag=True, help="Shrink without asking for confirmation."
+)
+@per_connection()
+def shrink(
+    client,
+    pattern,
+    target_template,
+    shard_count,
+    node,
+    max_concurrent,
+    poll_interval,
+    max_wait,
+    yes,
+):
+    """Shrink the indices matching PATTERN into fewer primary shards.
+
+    Every source index is made read-only and a copy of each of its shards is
+    moved to one node, before it is shrunk into a new index. The source indices
+    are left read-only, but their shards may move off that node again once done,
+    whether shrinking succeeded or not. The recovery of the new indices is
+    printed every poll interval, and segment counts before and after at the end.
+
+    \b
+    $ esok index shrink 'logs-2021.*' -s 1 -t '{index}-1'
+    """
+    targets = _target_indices(client, pattern, target_template)
+    if not yes:
+        _confirm_read_only(targets, "shrunk")
+
+    def _shrink(name):
+        target_node = node or _shrink_node(client, name)
+        if target_node is None:
+            return "No shard of {} is started.".format(name)
+
+        try:
+            error = _put_settings(
+                client,
+                name,
+                {
+                    "index.routing.allocation.require._name": target_node,
+                    "index.blocks.write": True,
+                },
             )
-            LOG.debug(
-                "Resolved data node count from cluster: {}".format(data_node_count)
+            if error is not None:
+                return error
+            return _shrink_on_node(name, target_node)
+        finally:
+            reset_error = _put_settings(
+                client, name, {"index.routing.allocation.require._name": None}
             )
-        else:
-            LOG.debug("Using manually set node count: {}".format(nodes))
-            data_node_count = nodes
+            if reset_error is not None:
+                LOG.error(reset_error)
 
-        # Fetch number of primary shards for this index.
-        r = client.indices.get(index=name)
-        primary_count = int(
-            r.get(name).get("settings").get("index").get("number_of_shards")
+    def _shrink_on_node(name, target_node):
+        health = client.cluster.health(
+            index=name,
+            wait_for_no_relocating_shards=True,
+            timeout="{}s".format(max_wait),
+            request_timeout=max_wait + 10,
         )
-        LOG.debug("Primary shard count: {}".format(primary_count))
-        LOG.debug("Desired shard count per host: {}".format(shard_count))
-        # Calculate the appropriate number of replicas
-        replica_count = (shard_count * data_node_count - primary_count) / primary_count
-        replica_count = max(
-            replica_count, 0.0
-        )  # For the edge case where replica_count == -1
-
-        if not replica_count.is_integer():
-            click.echo(
-                "The cluster configuration and desired shards per machine "
-                "resulted in {} total replicas.\n"
-                "This will be rounded to {} replicas in total.".format(
-                    replica_count, int(replica_count)
-                )
+        if health.get("timed_out") or not _has_all_shards(client, name, target_node):
+            return "Could not move a copy of every shard to {}.".format(target_node)
+
+        client.indices.shrink(
+            index=name,
+            target=targets[name],
+            body={
+                "settings": {
+                    "index.number_of_shards": shard_count,
+                    "index.routing.allocation.require._name": None,
+                    "index.blocks.write": None,
+                }
+            },
+            filter_path=response_filter(ACKNOWLEDGED),
+        )
+        return _wait_for_recovery(client, targets[name], max_wait)
+
+    _resize(client, targets, _shrink, max_concurrent, poll_interval)
+
+
+@index.command()
+@click.argument("pattern", type=click.STRING)
+@click.argument("shard_count", type=click.IntRange(min=2))
+@click.option(
+    "-t",
+    "--target-template",
+    type=click.STRING,
+    default="{index}-split",
+    show_default=True,
+    help='Name of the split index. "{index}" is replaced with the name of the '
+    "source index.",
+)
+@_max_concurrent_option
+@_poll_interval_option
+@_max_wait_option
+@click.option(
+    "-y", "--yes", is_flag=True, help="Split without asking for confirmation."
+)
+@per_connection()
+def split(
+    client,
+    pattern,
+    shard_count,
+    target_template,
+    max_concurrent,
+    poll_interval,
+    max_wait,
+    yes,
+):
+    """Split the indices matching PATTERN into SHARD_COUNT primary shards.
+
+    Every source index is made read-only, and split into a new index. The source
+    indices are left read-only. The recovery of the new indices is printed every
+    poll interval, and segment counts before and after at the end.
+
+    \b
+    $ esok index split 'logs-2021.*' 10 -t '{index}-10'
+    """
+    targets = _target_indices(client, pattern, target_template)
+    if not yes:
+        _confirm_read_only(targets, "split")
+
+    def _split(name):
+        error = _put_settings(client, name, {"index.blocks.write": True})
+        if error is not None:
+            return error
+        client.indices.split(
+            index=name,
+            target=targets[name],
+            body={
+                "settings": {
+                    "index.number_of_shards": shard_count,
+                    "index.blocks.write": None,
+                }
+            },
+            filter_path=response_filter(ACKNOWLEDGED),
+        )
+        return _wait_for_recovery(client, targets[name], max_wait)
+
+    _resize(client, targets, _split, max_concurrent, poll_interval)
+
+
+def _resize(client, targets, operation, max_concurrent, poll_interval):
+    """Shrinks or splits indices into targets, see _run_bounded."""
+
+    from elasticsearch import NotFoundError
+
+    def _progress(name):
+        try:
+            rows = client.cat.recovery(
+                index=targets[name], format="json", h="stage,bytes_percent"
             )
+        except NotFoundError:
+            rows = None
+        if not rows:
+            return "preparing"
+        percent = sum(float(r["bytes_percent"].rstrip("%")) for r in rows) / len(rows)
+        return "recovering {}, {:.1f}%".format(targets[name], percent)
 
-            if not click.confirm("Do you want to continue?"):
-                sys.exit()
+    indices = sorted(targets)
+    before = _segment_counts(client, indices)
+    results = _run_bounded(indices, operation, _progress, max_concurrent, poll_interval)
+    done = [targets[i] for i in indices if results[i][1] is None]
+    after = _segment_counts(client, done) if done else dict()
+    _echo_optimizations(targets, results, before, after)
 
-        LOG.info("Calculated replica count: {}".format(replica_count))
 
-    body = {"index": {"number_of_replicas": int(replica_count)}}
-    r = client.indices.put_settings(body, index=name)
+def _run_bounded(indices, operation, progress, max_concurrent, poll_interval):
+    """
+    Runs an operation on indices in threads, with at most max_concurrent at a
+    time, and prints the progress of running operations every poll interval.
 
-    ok = r.get("acknowledged")
-    LOG.info(json.dumps(r))
+    :param operation: Function of an index name, which blocks until done. It
+        returns an error message, or None if it succeeded.
+    :param progress: Function of an index name, which returns a progress text
+    :return: Dict of index name to (seconds, error message or None)
+    """
+    from elasticsearch import ElasticsearchException
 
-    if not ok:
+    def _timed(name):
+        start = time.monotonic()
+        try:
+            error = operation(name)
+        except ElasticsearchException as e:
+            error = str(e)
+        return time.monotonic() - start, error
+
+    results = dict()
+    with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+        futures = {executor.submit(_timed, name): name for name in indices}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(
+                pending, timeout=poll_interval, return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                name = futures[future]
+                results[name] = future.result()
+                if results[name][1] is None:
+                    click.echo("{}: done".format(name))
+                else:
+                    LOG.error("%s failed: %s", name, results[name][1])
+            if not done:
+                for name in sorted(futures[f] for f in pending if f.running()):
+                    click.echo("{}: {}".format(name, progress(name)))
+    return results
+
+
+def _echo_optimizations(targets, results, before, after):
+    """
+    Prints a table of the segment counts and durations of indices, and exits if
+    any of them failed.
+    """
+    rows = [
+        (
+            name,
+            before.get(name, "-"),
+            after.get(target, "-"),
+            "{:.1f}".format(results[name][0]),
+            "ok" if results[name][1] is None else "failed",
+        )
+        for name, target in sorted(targets.items())
+    ]
+    header = ["index", "segments", "new segments", "seconds", "status"]
+    if any(name != target for name, target in targets.items()):
+        header.insert(1, "target")
+        rows = [row[:1] + (targets[row[0]],) + row[1:] for row in rows]
+    click.echo()
+    click.echo(format_table(header, rows))
+
+    failed = [name for name in targets if results[name][1] is not None]
+    if failed:
         sys.exit(UNKNOWN_ERROR)
 
 
+def _matching_indices(client, pattern):
+    rows = client.cat.indices(index=pattern, h="index", format="json")
+    return sorted(r["index"] for r in rows)
+
+
+def _target_indices(client, pattern, target_template):
+    """Target index names of the indices matching a pattern, by source index."""
+    indices = _matching_indices(client, pattern)
+    targets = {i: target_template.format(index=i) for i in indices}
+    # Targets of an earlier run may match the pattern as well.
+    targets = {s: t for s, t in targets.items() if s not in targets.values()}
+    if not targets:
+        LOG.error("No indices match %s.", pattern)
+        sys.exit(USER_ERROR)
+    return targets
+
+
+def _confirm_read_only(targets, operation):
+    click.echo(format_table(("index", "target"), sorted(targets.items())), err=True)
+    click.confirm(
+        "These {} indices will be made read-only and {}.\n"
+        "Do you want to continue?".format(len(targets), operation),
+        abort=True,
+        err=True,
+    )
+
+
+def _put_settings(client, name, settings):
+    """Updates settings of an index, see _run_bounded.
+
+    :return: An error message if the update was not acknowledged, or None
+    """
+    r = client.indices.put_settings(
+        settings, index=name, filter_path=response_filter(ACKNOWLEDGED)
+    )
+    LOG.info(json.dumps(r))
+    if not r.get("acknowledged"):
+        return "Settings of {} were not acknowledged: {}".format(
+            name, json.dumps(settings)
+        )
+    return None
+
+
+def _segment_counts(client, indices):
+    """Number of segments of all shard copies, by index name."""
+    counts = Counter()
+    for batch in _url_batches(indices):
+        rows = client.cat.segments(index=",".join(batch), format="json", h="index")
+        counts.update(r["index"] for r in rows)
+    return counts
+
+
+def _shrink_node(client, name):
+    """
+    The data node that holds the most started shards of an index, or None if no
+    shard is started.
+    """
+    shards = client.cat.shards(index=name, format="json", h="state,node")
+    nodes = Counter(s["node"] for s in shards if s["state"] == "STARTED")
+    if not nodes:
+        return None
+    return min(nodes, key=lambda node: (-nodes[node], node))
+
+
+def _has_all_shards(client, name, node):
+    """Whether a node holds a started copy of every shard of an index."""
+    shards = client.cat.shards(index=name, format="json", h="shard,state,node")
+    numbers = {s["shard"] for s in shards}
+    on_node = {
+        s["shard"] for s in shards if s["state"] == "STARTED" and s["node"] == node
+    }
+    return numbers == on_node
+
+
+def _wait_for_recovery(client, name, max_wait):
+    """Waits until all primaries of a new index are started, see _run_bounded."""
+    health = client.cluster.health(
+        index=name,
+        wait_for_status="yellow",
+        wait_for_no_initializing_shards=True,
+        timeout="{}s".format(max_wait),
+        request_timeout=max_wait + 10,
+    )
+    if health.get("timed_out"):
+        return "Timed out waiting for {} to recover.".format(name)
+    return None
+
+
 @index.command()
 @click.argument("name", type=click.STRING)
 @click.option(
@@ -273,9 +1446,138 @@ def read(client, name, output_file, chunk_size, scroll_time):
     $ esok index read -o output.json index-name
     $ esok index read index-name | jq -c '{_id, _source}' > output.json
     """
+    from elasticsearch.helpers import scan
+
+    metrics.job("index_read")
     r = scan(client, index=name, size=chunk_size, scroll=scroll_time)
     for doc in r:
         click.echo(json.dumps(doc), output_file)
+        metrics.METRICS.count("docs")
+
+
+@index.command()
+@click.argument("name", type=click.STRING)
+@click.argument("ids", type=click.Path(allow_dash=True))
+@click.option(
+    "-o",
+    "--output-file",
+    type=click.File("w"),
+    default="-",
+    show_default=True,
+    help="Specify file to output to.",
+)
+@click.option(
+    "-c",
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    default=1000,
+    show_default=True,
+    help="Number of documents to fetch in each request.",
+)
+@click.option(
+    "-m",
+    "--max-concurrent",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Maximum number of requests running at the same time.",
+)
+@click.option(
+    "--unordered",
+    is_flag=True,
+    help="Print documents as soon as their request completes, instead of in the "
+    "order of IDS.",
+)
+@per_connection()
+def mget(client, name, ids, output_file, chunk_size, max_concurrent, unordered):
+    """Fetch documents by ID.
+
+    IDS is a file with one ID per line, or - to read from stdin. A line may also
+    be a JSON object, such as {"_id": "1", "routing": "a"}, which is passed on
+    as is. Found documents are printed in the same format as "index read", and
+    the number of missing ones to stderr. Documents that could not be fetched,
+    such as of a missing index, are logged as errors, and make the command exit
+    with a non-zero status.
+
+    Examples:
+
+    \b
+    $ esok index mget index-name ids.txt > docs.json
+    $ esok index diff a b | grep changed | cut -f2 \\
+         | esok index mget --unordered a -
+    """
+    metrics.job("index_mget")
+
+    def _fetch(docs):
+        r = client.mget(body=dict(docs=docs), index=name)
+        return r["docs"]
+
+    missing = failed = 0
+    batches = _read_id_batches(ids, chunk_size)
+    for docs in _concurrent_map(_fetch, batches, max_concurrent, not unordered):
+        for doc in docs:
+            if "error" in doc:
+                failed += 1
+                LOG.error(
+                    "Could not fetch %s/%s: %s",
+                    doc.get("_index"),
+                    doc.get("_id"),
+                    json.dumps(doc["error"]),
+                )
+            elif not doc.get("found"):
+                missing += 1
+            else:
+                click.echo(json.dumps(doc), output_file)
+        metrics.METRICS.count("docs", len(docs))
+
+    if missing:
+        # Not logged, as warnings are printed to stdout along with the documents.
+        click.echo("{} documents were not found.".format(missing), err=True)
+    if failed:
+        sys.exit(UNKNOWN_ERROR)
+
+
+def _read_id_batches(path, chunk_size):
+    """Yields lists of the mget docs of IDs in a file, see mget."""
+    batch = list()
+    with click.open_file(path, "r", "UTF-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            batch.append(json.loads(line) if line.startswith("{") else dict(_id=line))
+            if len(batch) == chunk_size:
+                yield batch
+                batch = list()
+    if batch:
+        yield batch
+
+
+def _concurrent_map(f, items, max_concurrent, ordered=True):
+    """
+    Like map(), but with up to max_concurrent calls of f running in threads.
+    Items are only taken from the iterable when a thread is free.
+
+    :param ordered: Yield results in the order of items, or else as they complete
+    """
+    with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(f, item))
+            while len(pending) >= max_concurrent:
+                yield from _completed(pending, ordered)
+        while pending:
+            yield from _completed(pending, ordered)
+
+
+def _completed(pending, ordered):
+    """Removes and returns the results of the next completed futures."""
+    if ordered:
+        return [pending.popleft().result()]
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        pending.remove(future)
+    return [future.result() for future in done]
 
 
 @index.command()
@@ -363,6 +1665,9 @@ def write(
     $ esok index read index-name | jq -c '{_id, stuff: ._source.title}' \\
          | esok index write -i index-name-1 -
     """
+    from elasticsearch.helpers import bulk
+
+    metrics.job("index_write")
     for actions in _read_actions(docs, max_chunk_bytes):
         for action in actions:
             if index_name is not None:
@@ -372,6 +1677,7 @@ def write(
                 "_doc" if "_type" not in action.keys() else action["_type"]
             )
 
+        metrics.METRICS.set("queue_depth", len(actions))
         successful_request_count, errors = bulk(
             client,
             actions,
@@ -384,6 +1690,9 @@ def write(
             refresh=refresh,
         )
 
+        metrics.METRICS.set("queue_depth", 0)
+        metrics.METRICS.count("docs", successful_request_count)
+
         chunk_count = len(actions)
         ok = successful_request_count == chunk_count
 
@@ -417,3 +1726,81 @@ def _read_actions(path, max_chunk_bytes):
         while chunk:
             yield chunk
             chunk = _stripped_lines()
+
+
+def _sorted_id_hashes(client, index, chunk_size, slices):
+    """
+    (_id, content hash) tuples of an index, sorted by _id and fetched in
+    background threads, with one thread per slice.
+    """
+    if slices == 1:
+        return prefetched(_id_hashes(client, index, chunk_size))
+    # Every slice is sorted by _id, and an _id belongs to one slice only.
+    return heapq.merge(
+        *(
+            prefetched(_sliced_id_hashes(client, index, chunk_size, i, slices))
+            for i in range(slices)
+        )
+    )
+
+
+def _sliced_id_hashes(client, index, chunk_size, slice_id, slices):
+    """Yields pages of (_id, content hash) tuples of a slice, sorted by _id."""
+    from elasticsearch.helpers import scan
+
+    hits = scan(
+        client,
+        index=index,
+        query={"sort": ["_id"], "slice": {"id": slice_id, "max": slices}},
+        size=chunk_size,
+        preserve_order=True,
+    )
+    while True:
+        page = list(itertools.islice(hits, chunk_size))
+        if not page:
+            return
+        yield [(hit["_id"], _content_hash(hit.get("_source"))) for hit in page]
+
+
+def _id_hashes(client, index, chunk_size):
+    """Yields pages of (_id, content hash) tuples of an index, sorted by _id."""
+    body = {"sort": ["_id"], "size": chunk_size}
+    while True:
+        r = client.search(
+            index=index,
+            body=body,
+            filter_path="hits.hits._id,hits.hits._source,hits.hits.sort",
+        )
+        hits = r.get("hits", dict()).get("hits", [])
+        if not hits:
+            return
+
+        yield [(hit["_id"], _content_hash(hit.get("_source"))) for hit in hits]
+        body["search_after"] = hits[-1]["sort"]
+
+
+def _content_hash(source):
+    content = json.dumps(source or dict(), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(content.encode("UTF-8")).hexdigest()
+
+
+def _merge_join(source, target):
+    """Compares two streams of (_id, hash) tuples, both sorted by _id.
+
+    Yields ("missing" | "extra" | "changed", _id) tuples for every difference.
+    """
+    source, target = iter(source), iter(target)
+    source_doc, target_doc = next(source, None), next(target, None)
+    while source_doc is not None or target_doc is not None:
+        if target_doc is None or (
+            source_doc is not None and source_doc[0] < target_doc[0]
+        ):
+            yield "missing", source_doc[0]
+            source_doc = next(source, None)
+        elif source_doc is None or target_doc[0] < source_doc[0]:
+            yield "extra", target_doc[0]
+            target_doc = next(target, None)
+        else:
+            if source_doc[1] != target_doc[1]:
+                yield "changed", source_doc[0]
+            source_doc, target_doc = next(source, None), next(target, None)
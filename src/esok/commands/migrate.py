@@ -0,0 +1,326 @@
+import json
+import logging
+import sys
+import time
+from os import path
+
+import click
+
+from esok.config.connection_options import (
+    ACKNOWLEDGED,
+    per_connection,
+    resolve_remote,
+    response_filter,
+)
+from esok.constants import STATE_DIR_NAME, UNKNOWN_ERROR
+from esok.util import (
+    create_target_index,
+    max_field_value,
+    read_state,
+    task_errors,
+    wait_for_task,
+    write_state,
+)
+
+LOG = logging.getLogger(__name__)
+
+_HEALTH_RANKS = dict(red=0, yellow=1, green=2)
+
+
+@click.command()
+@click.argument("source_index", type=click.STRING)
+@click.argument("target_index", type=click.STRING)
+@click.argument("alias", type=click.STRING)
+@click.option(
+    "-R",
+    "--remote",
+    type=click.STRING,
+    metavar="NAME",
+    help="Remote cluster or hostname of the source index.",
+)
+@click.option(
+    "--since-field",
+    type=click.STRING,
+    metavar="FIELD",
+    help="Field holding the last modification time of documents. Enables the "
+    "catch-up step, which copies documents written while reindexing.",
+)
+@click.option(
+    "-i",
+    "--slices",
+    type=click.INT,
+    default=0,
+    show_default=True,
+    help='Count of slices to reindex with. 0 means "auto". If reindexing from '
+    "remote (using -R) slices will be set to 1.",
+)
+@click.option(
+    "-w",
+    "--wait-for-status",
+    type=click.Choice(["green", "yellow"]),
+    default="green",
+    show_default=True,
+    help="Health the target index must reach before the alias is swapped.",
+)
+@click.option(
+    "-p",
+    "--poll-interval",
+    type=click.FLOAT,
+    default=5.0,
+    show_default=True,
+    help="Seconds to wait between checking on tasks and index health.",
+)
+@click.option(
+    "-S",
+    "--state-file",
+    type=click.Path(dir_okay=False, writable=True),
+    help="File in which migration progress is persisted. Defaults to a file in the "
+    "app directory.",
+)
+@click.option(
+    "--restart",
+    is_flag=True,
+    help="Discard previously persisted progress and start the migration over. The "
+    "original settings of an existing TARGET_INDEX are kept, to be restored.",
+)
+@per_connection(include_site=True)
+def migrate(
+    client,
+    site,
+    source_index,
+    target_index,
+    alias,
+    remote,
+    since_field,
+    slices,
+    wait_for_status,
+    poll_interval,
+    state_file,
+    restart,
+):
+    """Move an alias to a new copy of its index, without downtime.
+
+    The migration runs as a sequence of steps. Progress is persisted after each
+    step, so if one fails, running the same command again resumes from it.
+
+    \b
+    copy      Create TARGET_INDEX from the mapping and settings of SOURCE_INDEX.
+    tune      Disable refreshes and replicas of TARGET_INDEX while indexing.
+    reindex   Copy all documents of SOURCE_INDEX into TARGET_INDEX.
+    catch-up  Copy documents written during the reindex step (see --since-field).
+    restore   Restore the refresh interval and replicas of TARGET_INDEX.
+    warm      Refresh TARGET_INDEX and wait for its shards to be allocated.
+    swap      Atomically move ALIAS from its current indices to TARGET_INDEX.
+
+    Examples:
+
+    \b
+    $ esok migrate --since-field updated_at products-v1 products-v2 products
+    $ esok -c new-cluster migrate -R old-cluster products-v1 products-v1 products
+    """
+    if remote is not None:
+        source_client = resolve_remote(remote, site)
+        source = {
+            "remote": {"host": source_client.transport.get_connection().host},
+            "index": source_index,
+        }
+        # Reindex from remote only supports slices == 1
+        slices = 1
+    else:
+        source_client = client
+        source = dict(index=source_index)
+
+    if state_file is None:
+        app_dir = click.get_current_context().obj["app_dir"]
+        state_file = path.join(app_dir, STATE_DIR_NAME, "migrate.json")
+
+    key = "{}/{} -> {}/{}".format(
+        source_client.transport.get_connection().host,
+        source_index,
+        client.transport.get_connection().host,
+        target_index,
+    )
+    state = read_state(state_file)
+    if restart:
+        previous = state.pop(key, None) or dict()
+        job = state[key] = dict(done=[])
+        if "settings" in previous and client.indices.exists(index=target_index):
+            # The target may already be tuned, so its current settings aren't the
+            # ones to restore.
+            job["settings"] = previous["settings"]
+    job = state.setdefault(key, dict(done=[]))
+
+    def save():
+        write_state(state_file, state)
+
+    reindex_options = dict(
+        slices="auto" if slices == 0 else slices,
+        poll_interval=poll_interval,
+        job=job,
+        save=save,
+    )
+    steps = [
+        ("copy", lambda: _copy(client, source_client, source_index, target_index)),
+        ("tune", lambda: _tune(client, target_index, job, save)),
+        (
+            "reindex",
+            lambda: _reindex(
+                client,
+                source_client,
+                source,
+                target_index,
+                since_field,
+                **reindex_options
+            ),
+        ),
+        (
+            "catch-up",
+            lambda: _catch_up(
+                client, source, target_index, since_field, **reindex_options
+            ),
+        ),
+        ("restore", lambda: _restore(client, target_index, job)),
+        ("warm", lambda: _warm(client, target_index, wait_for_status, poll_interval)),
+        ("swap", lambda: _swap(client, alias, target_index)),
+    ]
+
+    for number, (name, step) in enumerate(steps, start=1):
+        progress = "[{}/{}] {}".format(number, len(steps), name)
+        if name in job["done"]:
+            click.echo("{}: already done".format(progress))
+            continue
+
+        click.echo(progress)
+        step()
+        job["done"].append(name)
+        save()
+
+    click.echo("Alias {} now points to {}.".format(alias, target_index))
+
+
+def _copy(client, source_client, source_index, target_index):
+    if client.indices.exists(index=target_index):
+        LOG.info("Target index %s already exists.", target_index)
+        return
+
+    source = source_client.indices.get(index=source_index)
+    create_target_index(client, source, target_index)
+
+
+def _tune(client, target_index, job, save):
+    if "settings" not in job:
+        r = client.indices.get_settings(
+            index=target_index, name="index.refresh_interval,index.number_of_replicas"
+        )
+        index_settings = r[target_index]["settings"]["index"]
+        # Unset values are restored as None, which resets them to their defaults.
+        job["settings"] = dict(
+            refresh_interval=index_settings.get("refresh_interval"),
+            number_of_replicas=index_settings.get("number_of_replicas"),
+        )
+        save()
+
+    body = {"index": {"refresh_interval": "-1", "number_of_replicas": 0}}
+    _put_settings(client, target_index, body)
+
+
+def _reindex(
+    client, source_client, source, target_index, since_field, job, save, **kwargs
+):
+    if since_field is not None and "watermark" not in job:
+        # Captured before reindexing, so the catch-up includes writes made meanwhile.
+        job["watermark"] = max_field_value(source_client, source["index"], since_field)
+        save()
+
+    body = {"source": source, "dest": {"index": target_index}}
+    _run_reindex(client, body, "task", job=job, save=save, **kwargs)
+
+
+def _catch_up(client, source, target_index, since_field, job, **kwargs):
+    if since_field is None:
+        LOG.info("Skipping catch-up, as no --since-field is given.")
+        return
+
+    source = dict(source)
+    if job.get("watermark") is not None:
+        source["query"] = {"range": {since_field: {"gte": job["watermark"]}}}
+
+    body = {"source": source, "dest": {"index": target_index}}
+    _run_reindex(client, body, "catch_up_task", job=job, **kwargs)
+
+
+def _run_reindex(client, body, task_key, slices, poll_interval, job, save):
+    """Runs a reindex task, or resumes waiting for one started by an earlier run."""
+    from elasticsearch import NotFoundError
+
+    task_id = job.get(task_key)
+    if task_id is not None:
+        try:
+            task_info = client.tasks.get(task_id=task_id)
+        except NotFoundError:
+            task_info = None
+
+        if task_info is None or (task_info.get("completed") and task_errors(task_info)):
+            task_id = None
+
+    if task_id is None:
+        r = client.reindex(body, wait_for_completion=False, slices=slices)
+        task_id = job[task_key] = r.get("task")
+        save()
+        LOG.info("Started reindex task: %s", task_id)
+
+    task_info = wait_for_task(client, task_id, poll_interval)
+    errors = task_errors(task_info)
+    if errors:
+        LOG.error("Reindexing failed: %s", json.dumps(errors))
+        sys.exit(UNKNOWN_ERROR)
+
+    LOG.info(json.dumps(task_info.get("response")))
+
+
+def _restore(client, target_index, job):
+    _put_settings(client, target_index, {"index": job["settings"]})
+
+
+def _warm(client, target_index, wait_for_status, poll_interval):
+    client.indices.refresh(index=target_index)
+
+    while True:
+        r = client.cluster.health(index=target_index)
+        status = r.get("status")
+        if _HEALTH_RANKS[status] >= _HEALTH_RANKS[wait_for_status]:
+            return
+        LOG.info("Index health is %s, waiting for %s.", status, wait_for_status)
+        time.sleep(poll_interval)
+
+
+def _swap(client, alias, target_index):
+    from elasticsearch import NotFoundError
+
+    try:
+        current = client.indices.get_alias(name=alias)
+    except NotFoundError:
+        current = dict()
+
+    actions = [
+        {"remove": {"index": index, "alias": alias}}
+        for index in current.keys()
+        if index != target_index
+    ]
+    actions.insert(0, {"add": {"index": target_index, "alias": alias}})
+
+    r = client.indices.update_aliases(
+        {"actions": actions}, filter_path=response_filter(ACKNOWLEDGED)
+    )
+    LOG.info(json.dumps(r))
+    if not r.get("acknowledged"):
+        sys.exit(UNKNOWN_ERROR)
+
+
+def _put_settings(client, index, body):
+    r = client.indices.put_settings(
+        body, index=index, filter_path=response_filter(ACKNOWLEDGED)
+    )
+    LOG.info(json.dumps(r))
+    if not r.get("acknowledged"):
+        sys.exit(UNKNOWN_ERROR)
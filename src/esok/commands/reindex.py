@@ -1,14 +1,25 @@
 import json
 import logging
 import sys
+import time
+from os import path
 
 import click
 from click_didyoumean import DYMGroup
-from elasticsearch import NotFoundError, TransportError
 
+from esok import metrics
 from esok.config.connection_options import per_connection, resolve_remote
-from esok.constants import UNKNOWN_ERROR, USER_ERROR
-from esok.util import clean_index
+from esok.constants import STATE_DIR_NAME, UNKNOWN_ERROR, USER_ERROR
+from esok.util import (
+    TASK_PATHS,
+    create_target_index,
+    max_field_value,
+    read_state,
+    task_errors,
+    task_progress,
+    wait_for_task,
+    write_state,
+)
 
 LOG = logging.getLogger(__name__)
 
@@ -77,6 +88,21 @@ def reindex():
     "works when reindexing indices on the same cluster. If reindexing from remote "
     "(using -R) slices will be set to 1.",
 )
+@click.option(
+    "--since-field",
+    type=click.STRING,
+    metavar="FIELD",
+    help="Only reindex documents where FIELD is at or above the high-water mark of "
+    "the last successful run with this option. Implies --wait.",
+)
+@click.option(
+    "-p",
+    "--poll-interval",
+    type=click.FLOAT,
+    default=5.0,
+    show_default=True,
+    help="Seconds to wait between checking on the task, when waiting for it.",
+)
 @per_connection(include_site=True)
 def start(
     client,
@@ -90,6 +116,8 @@ def start(
     connection_timeout,
     batch_size,
     slices,
+    since_field,
+    poll_interval,
 ):
     """Start a reindex task.
 
@@ -107,7 +135,14 @@ def start(
     $ esok -H target.example.com reindex start -R source.example.com \\
            source-index target-index
 
+    Use --since-field to catch up on writes made since the last run, e.g. after a
+    bulk reindex. The high-water mark of the field is kept in the app directory.
+
+    \b
+    $ esok reindex start --since-field updated_at source-index target-index
     """
+    from elasticsearch import TransportError
+
     # Resolve which hostname and clients to use
     if remote is not None:
         source_client = resolve_remote(remote, site)
@@ -144,15 +179,7 @@ def start(
             abort=True,
         )
 
-        cleaned_index = clean_index(source, False, False)
-
-        r = client.indices.create(index=target_index, body=cleaned_index)
-        ok = r.get("acknowledged")
-        LOG.debug(json.dumps(r))
-        if not ok:
-            sys.exit(UNKNOWN_ERROR)
-
-        LOG.info("Index created: %s", target_index)
+        create_target_index(client, source, target_index)
 
     if remote is not None:
         source = {
@@ -176,18 +203,265 @@ def start(
     if batch_size is not None:
         source["size"] = batch_size
 
+    if since_field is not None:
+        wait = True
+        watermark_key = "{}/{} -> {}/{} ({})".format(
+            source_client.transport.get_connection().host,
+            source_index,
+            client.transport.get_connection().host,
+            target_index,
+            since_field,
+        )
+        state_file = _watermark_file()
+        previous_mark = read_state(state_file).get(watermark_key)
+        # Captured before reindexing, so that writes during the run are included
+        # in the next one.
+        new_mark = max_field_value(source_client, source_index, since_field)
+
+        if previous_mark is not None:
+            source["query"] = {"range": {since_field: {"gte": previous_mark}}}
+            LOG.info("Reindexing documents with %s >= %s", since_field, previous_mark)
+        else:
+            LOG.info("No previous high-water mark found, reindexing all documents.")
+
     body = {"source": source, "dest": {"index": target_index}}
 
     slices = "auto" if slices == 0 else slices
     if size:
         body["size"] = size
 
-    r = client.reindex(body, wait_for_completion=wait, slices=slices)
-    if wait:
-        click.echo(json.dumps(r))
+    r = client.reindex(body, wait_for_completion=False, slices=slices)
+    task_id = r.get("task")
+    if not wait:
+        click.echo("Task ID: {}".format(task_id))
+        return
+
+    metrics.job("reindex")
+    task_info = wait_for_task(client, task_id, poll_interval, metrics.measure_task)
+    response = task_info.get("response", dict())
+    click.echo(json.dumps(response))
+    errors = task_errors(task_info)
+    if errors:
+        LOG.error("Reindexing failed: %s", json.dumps(errors))
+        sys.exit(UNKNOWN_ERROR)
+
+    if since_field is not None and new_mark is not None:
+        state = read_state(state_file)
+        state[watermark_key] = new_mark
+        write_state(state_file, state)
+        LOG.info("Stored high-water mark for %s: %s", since_field, new_mark)
+
+
+def _watermark_file():
+    app_dir = click.get_current_context().obj["app_dir"]
+    return path.join(app_dir, STATE_DIR_NAME, "watermarks.json")
+
+
+@reindex.command()
+@click.argument("pattern", type=click.STRING, required=False)
+@click.option(
+    "-f",
+    "--mapping-file",
+    type=click.Path(exists=True, dir_okay=False, readable=True),
+    help="JSON file with an object mapping source index names to target index names.",
+)
+@click.option(
+    "-t",
+    "--target-template",
+    type=click.STRING,
+    default="{index}-reindexed",
+    show_default=True,
+    help='Target index name for indices matched by PATTERN. "{index}" is replaced '
+    "with the name of the source index.",
+)
+@click.option(
+    "-m",
+    "--max-concurrent",
+    type=click.IntRange(min=1),
+    default=2,
+    show_default=True,
+    help="Maximum number of concurrently running reindex tasks per cluster.",
+)
+@click.option(
+    "-i",
+    "--slices",
+    type=click.INT,
+    default=0,
+    show_default=True,
+    help='Count of slices to use for each reindex task. 0 means "auto".',
+)
+@click.option(
+    "-p",
+    "--poll-interval",
+    type=click.FLOAT,
+    default=5.0,
+    show_default=True,
+    help="Seconds to wait between checking on running tasks.",
+)
+@click.option(
+    "-S",
+    "--state-file",
+    type=click.Path(dir_okay=False, writable=True),
+    help="File in which batch progress is persisted. Defaults to a file in the app "
+    "directory.",
+)
+@click.option(
+    "--restart",
+    is_flag=True,
+    help="Discard previously persisted progress and start the batch over.",
+)
+@click.option(
+    "-y",
+    "--yes",
+    is_flag=True,
+    help="Create missing target indices without asking for confirmation.",
+)
+@per_connection()
+def batch(
+    client,
+    pattern,
+    mapping_file,
+    target_template,
+    max_concurrent,
+    slices,
+    poll_interval,
+    state_file,
+    restart,
+    yes,
+):
+    """Reindex many indices, with a bounded number of concurrent tasks.
+
+    Indices are given either as a PATTERN, in which case target names are derived
+    with --target-template, or as a mapping file of source to target names.
+    Missing target indices are created from the source's mapping.
+
+    Progress is persisted, so an interrupted batch continues where it left off
+    when the same command is run again.
+
+    \b
+    $ esok reindex batch 'logs-2021.*' -t '{index}-v2'
+    $ esok reindex batch -f pairs.json -m 4
+    """
+    from elasticsearch import NotFoundError
+
+    if (pattern is None) == (mapping_file is None):
+        LOG.error("Provide either an index pattern or a mapping file.")
+        sys.exit(USER_ERROR)
+
+    if state_file is None:
+        app_dir = click.get_current_context().obj["app_dir"]
+        state_file = path.join(app_dir, STATE_DIR_NAME, "reindex-batch.json")
+
+    if mapping_file is not None:
+        with open(mapping_file, "r") as f:
+            pairs = json.load(f)
     else:
-        taskId = r.get("task")
-        click.echo("Task ID: {}".format(taskId))
+        pairs = _pattern_pairs(client, pattern, target_template)
+
+    if not pairs:
+        LOG.warning("No indices to reindex.")
+        return
+
+    # Progress is kept per cluster, so the same state file can serve several sites.
+    host = client.transport.get_connection().host
+    state = read_state(state_file)
+    if restart:
+        state.pop(host, None)
+    tasks = state.setdefault(host, dict())
+    for source_index, target_index in pairs.items():
+        tasks.setdefault(source_index, dict(target=target_index, status="pending"))
+    write_state(state_file, state)
+
+    existing = {i["index"] for i in client.cat.indices(h="index", format="json")}
+    missing = {
+        t["target"]
+        for t in tasks.values()
+        if t["status"] != "done" and t["target"] not in existing
+    }
+    if missing and not yes:
+        click.confirm(
+            "{} target indices do not exist and will be created from their source's "
+            "mapping.\nDo you want to continue?".format(len(missing)),
+            default=True,
+            abort=True,
+        )
+
+    queue = [s for s, t in tasks.items() if t["status"] in ("pending", "failed")]
+    running = {s: t["task"] for s, t in tasks.items() if t["status"] == "running"}
+    slices = "auto" if slices == 0 else slices
+
+    while queue or running:
+        while queue and len(running) < max_concurrent:
+            source_index = queue.pop(0)
+            task = tasks[source_index]
+            if task["target"] in missing:
+                source = client.indices.get(index=source_index)
+                create_target_index(client, source, task["target"])
+                # Several sources may share a target, which is only created once.
+                missing.discard(task["target"])
+
+            body = {
+                "source": {"index": source_index},
+                "dest": {"index": task["target"]},
+            }
+            r = client.reindex(body, wait_for_completion=False, slices=slices)
+            task.update(status="running", task=r.get("task"))
+            running[source_index] = task["task"]
+            write_state(state_file, state)
+            LOG.info("Started reindexing %s -> %s", source_index, task["target"])
+
+        time.sleep(poll_interval)
+
+        for source_index, task_id in list(running.items()):
+            task = tasks[source_index]
+            try:
+                task_info = client.tasks.get(
+                    task_id=task_id, filter_path=",".join(TASK_PATHS)
+                )
+            except NotFoundError:
+                # The task is gone without a stored result. Reindexing is
+                # idempotent, so it is safe to just run it again.
+                LOG.warning(
+                    "Task %s for %s was lost, requeueing.", task_id, source_index
+                )
+                task.update(status="pending", task=None)
+                queue.append(source_index)
+                del running[source_index]
+                continue
+
+            if not task_info.get("completed"):
+                continue
+
+            del running[source_index]
+            errors = task_errors(task_info)
+            if errors:
+                LOG.error("Reindexing %s failed: %s", source_index, json.dumps(errors))
+                task["status"] = "failed"
+            else:
+                task["status"] = "done"
+            click.echo(
+                "{} -> {}: {}".format(source_index, task["target"], task["status"])
+            )
+
+        write_state(state_file, state)
+
+    failed = [s for s, t in tasks.items() if t["status"] == "failed"]
+    done_count = sum(1 for t in tasks.values() if t["status"] == "done")
+    click.echo("{} / {} indices reindexed.".format(done_count, len(tasks)))
+    if failed:
+        LOG.error("Failed indices: %s", ", ".join(failed))
+        sys.exit(UNKNOWN_ERROR)
+
+
+def _pattern_pairs(client, pattern, target_template):
+    indices = sorted(
+        i["index"] for i in client.cat.indices(index=pattern, h="index", format="json")
+    )
+    pairs = {i: target_template.format(index=i) for i in indices}
+
+    # When resuming, targets of an earlier run may match the pattern as well.
+    targets = set(pairs.values())
+    return {s: t for s, t in pairs.items() if s not in targets and s != t}
 
 
 @reindex.command(name="list")
@@ -219,19 +493,14 @@ def cancel(client, task_id):
 @per_connection()
 def progress(client, task_id):
     """Print the progress of a given reindex task."""
+    from elasticsearch import NotFoundError
+
     try:
-        task_info = client.tasks.get(task_id=task_id)
+        task_info = client.tasks.get(task_id=task_id, filter_path="task.status")
     except NotFoundError:
         click.echo("Task with id {} not found!".format(task_id))
         sys.exit(USER_ERROR)
 
     reindex_status = task_info["task"]["status"]
     LOG.debug(json.dumps(reindex_status))
-    modified = (
-        reindex_status["created"]
-        + reindex_status["updated"]
-        + reindex_status["deleted"]
-    )
-
-    total = reindex_status["total"]
-    click.echo("{:.1f}%".format((float(modified) / total) * 100))
+    click.echo("{:.1f}%".format(task_progress(reindex_status) * 100))
@@ -0,0 +1,245 @@
+import copy
+import itertools
+import json
+import logging
+import sys
+
+import click
+
+from esok import metrics
+from esok.config.connection_options import per_connection
+from esok.constants import USER_ERROR
+from esok.util import prefetched
+
+LOG = logging.getLogger(__name__)
+
+
+@click.command()
+@click.argument("name", type=click.STRING)
+@click.argument("query", type=click.Path(allow_dash=True))
+@click.option(
+    "-o",
+    "--output-file",
+    type=click.File("w"),
+    default="-",
+    show_default=True,
+    help="Specify file to output to.",
+)
+@click.option(
+    "-c",
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    default=1000,
+    show_default=True,
+    help="Number of hits or buckets to fetch in each request.",
+)
+@click.option(
+    "-n",
+    "--limit",
+    type=click.IntRange(min=1),
+    help="Maximum number of hits or buckets to print.",
+)
+@click.option(
+    "-P",
+    "--partitions",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of partitions fetched with concurrent requests. Their results "
+    "are interleaved.",
+)
+@click.option(
+    "-s",
+    "--scroll-time",
+    type=click.STRING,
+    default="5m",
+    show_default=True,
+    help="The duration the cluster shall maintain a consistent view of hits.",
+)
+@per_connection()
+def search(
+    client, name, query, output_file, chunk_size, limit, partitions, scroll_time
+):
+    """Search an index, printing hits or aggregation buckets as JSON lines.
+
+    QUERY is a JSON file with the body of the search, or - to read from stdin.
+
+    If the body has one composite aggregation, its buckets are printed, and all
+    pages of buckets are followed. A composite aggregation next to other
+    aggregations is refused, as only its first page would be returned. Other
+    aggregations are printed as one object, without hits. Without aggregations,
+    all hits are printed in the same format as "index read". Only one page of
+    hits or buckets per partition is kept in memory.
+
+    With --partitions, hits are fetched with sliced scrolls. Buckets are split
+    into ranges of the field of the first source of the composite aggregation,
+    which must then be a terms source of a numeric or date field, without
+    missing_bucket.
+
+    Examples:
+
+    \b
+    $ esok search logs-* errors.json | jq -c ._source.message
+    $ esok search -P 4 logs-* bytes-per-user-id.json > buckets.json
+    """
+    with click.open_file(query, "r", "UTF-8") as f:
+        body = json.load(f)
+
+    aggregations = body.get("aggs", body.get("aggregations"))
+    composite = _composite_name(aggregations)
+    if composite is None and any(
+        "composite" in aggregation for aggregation in (aggregations or dict()).values()
+    ):
+        LOG.error(
+            "A composite aggregation is only paged if it is the only aggregation."
+        )
+        sys.exit(USER_ERROR)
+    if composite is not None:
+        metrics.job("search_buckets")
+        bodies = _partitioned(client, name, body, composite, partitions)
+        pages = [_bucket_pages(client, name, b, composite, chunk_size) for b in bodies]
+    elif aggregations:
+        r = client.search(index=name, body=dict(body, size=0))
+        click.echo(json.dumps(r.get("aggregations")), output_file)
+        return
+    else:
+        metrics.job("search_hits")
+        pages = [
+            _hit_pages(client, name, b, chunk_size, scroll_time)
+            for b in _sliced(body, partitions)
+        ]
+
+    if len(pages) == 1:
+        rows = itertools.chain.from_iterable(pages[0])
+    else:
+        rows = prefetched(*pages)
+    for row in itertools.islice(rows, limit):
+        click.echo(json.dumps(row), output_file)
+        metrics.METRICS.count("docs")
+
+
+def _composite_name(aggregations):
+    """Name of the aggregation, if it is the only one and a composite one."""
+    if aggregations and len(aggregations) == 1:
+        ((name, aggregation),) = aggregations.items()
+        if "composite" in aggregation:
+            return name
+    return None
+
+
+def _bucket_pages(client, index, body, name, chunk_size):
+    """Yields the pages of buckets of a composite aggregation, following after_key."""
+    body = copy.deepcopy(body)
+    body["size"] = 0
+    aggregations = body.get("aggs", body.get("aggregations"))
+    composite = aggregations[name]["composite"]
+    composite.setdefault("size", chunk_size)
+
+    filter_path = "aggregations.{0}.buckets,aggregations.{0}.after_key".format(name)
+    while True:
+        r = client.search(index=index, body=body, filter_path=filter_path)
+        aggregation = r.get("aggregations", dict()).get(name, dict())
+        buckets = aggregation.get("buckets", [])
+        if buckets:
+            yield buckets
+        if not buckets or "after_key" not in aggregation:
+            return
+        composite["after"] = aggregation["after_key"]
+
+
+def _hit_pages(client, index, body, chunk_size, scroll_time):
+    """Yields the pages of hits of a search, with a scroll."""
+    from elasticsearch.helpers import scan
+
+    hits = scan(
+        client,
+        index=index,
+        query=body,
+        size=chunk_size,
+        scroll=scroll_time,
+        preserve_order="sort" in body,
+    )
+    while True:
+        page = list(itertools.islice(hits, chunk_size))
+        if not page:
+            return
+        yield page
+
+
+def _sliced(body, partitions):
+    """Bodies of the slices of a scroll."""
+    if partitions == 1:
+        return [body]
+    return [dict(body, slice=dict(id=i, max=partitions)) for i in range(partitions)]
+
+
+def _partitioned(client, index, body, name, partitions):
+    """
+    Bodies of a composite aggregation, split into ranges of the field of its
+    first source.
+    """
+    from elasticsearch import RequestError
+
+    if partitions == 1:
+        return [body]
+
+    aggregations = body.get("aggs", body.get("aggregations"))
+    first_source = aggregations[name]["composite"]["sources"][0]
+    ((_, source),) = first_source.items()
+    ((source_type, params),) = source.items()
+    field = params.get("field")
+    # A histogram bucket could straddle the bounds of two partitions, and
+    # documents without the field would fall outside all of them.
+    if source_type != "terms" or field is None or params.get("missing_bucket"):
+        LOG.error(
+            "Partitions need a terms source of a field, without missing_bucket, "
+            "first in %s.",
+            name,
+        )
+        sys.exit(USER_ERROR)
+
+    query = body.get("query", {"match_all": {}})
+    try:
+        r = client.search(
+            index=index,
+            body={
+                "size": 0,
+                "query": query,
+                "aggs": {
+                    "min": {"min": {"field": field}},
+                    "max": {"max": {"field": field}},
+                },
+            },
+            filter_path="aggregations.*.value",
+        )
+    except RequestError:
+        LOG.exception("Partitions need a numeric or date field: %s", field)
+        sys.exit(USER_ERROR)
+
+    low = r.get("aggregations", dict()).get("min", dict()).get("value")
+    high = r.get("aggregations", dict()).get("max", dict()).get("value")
+    if low is None or high is None:
+        return [body]
+
+    bodies = list()
+    for lower, upper in _ranges(low, high, partitions):
+        bounds = {"gte": lower, "lt": upper} if upper < high else {"gte": lower}
+        partition = copy.deepcopy(body)
+        partition["query"] = {
+            "bool": {"must": [query], "filter": [{"range": {field: bounds}}]}
+        }
+        bodies.append(partition)
+    return bodies
+
+
+def _ranges(low, high, count):
+    """Splits [low, high] into count contiguous (lower, upper) ranges."""
+    if float(low).is_integer() and float(high).is_integer():
+        low, high = int(low), int(high)
+        step = max((high - low) // count, 1)
+    else:
+        step = (high - low) / float(count)
+    bounds = [min(low + step * i, high) for i in range(count)] + [high]
+    return [
+        (lower, upper) for lower, upper in zip(bounds, bounds[1:]) if lower < upper
+    ] or [(low, high)]
@@ -0,0 +1,85 @@
+import logging
+import shlex
+import sys
+
+import click
+
+from esok.constants import USER_ERROR
+from esok.session import Session
+
+LOG = logging.getLogger(__name__)
+
+EXIT_COMMANDS = ("exit", "quit")
+
+
+@click.command()
+@click.option(
+    "-x",
+    "--exit-on-error",
+    is_flag=True,
+    help="Stop at the first command that fails.",
+)
+@click.pass_context
+def shell(ctx, exit_on_error):
+    """Run many commands in one session.
+
+    Commands are read from a prompt, or from stdin if it is not a terminal. They
+    are written as on the command line, without the leading "esok". Options given
+    to esok before "shell" are the defaults of every command.
+
+    The configuration is read once, and connections to Elasticsearch are kept open
+    between commands. Exits with the code of the last command that failed.
+
+    Examples:
+
+        \b
+        $ esok -c my-cluster shell
+        esok> index list
+        esok> -s ew alias list
+        esok> exit
+
+        \b
+        $ printf 'index touch my-index\\nalias create my-alias my-index' | esok shell
+    """
+    session = Session(ctx)
+    exit_code = 0
+    try:
+        for line in _lines():
+            try:
+                args = shlex.split(line, comments=True)
+            except ValueError as e:
+                LOG.error("Could not parse command: {}".format(e))
+                code = USER_ERROR
+            else:
+                if not args:
+                    continue
+                if args[0] in EXIT_COMMANDS:
+                    break
+                code = session.run(args)
+
+            if code:
+                exit_code = code
+                if exit_on_error:
+                    break
+    finally:
+        session.close()
+
+    if exit_code:
+        sys.exit(exit_code)
+
+
+def _lines():
+    stdin = click.get_text_stream("stdin")
+    if not stdin.isatty():
+        yield from stdin
+        return
+
+    while True:
+        try:
+            yield click.prompt(
+                "esok", prompt_suffix="> ", default="", show_default=False
+            )
+        except click.Abort:
+            # Ctrl-C or Ctrl-D
+            click.echo()
+            return
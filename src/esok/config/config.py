@@ -4,11 +4,19 @@ from configparser import ConfigParser
 LOG = logging.getLogger(__name__)
 
 
-def read_config_files(user_config_path, default_config_path):
+def read_config_files(user_config_path, default_config_path, restore=None):
+    """
+    Reads the default and the user's config files.
+
+    :param restore: Function that restores a missing user config file, and returns
+        whether it did, after which the file is read again
+    """
     configParser = ConfigParser()
 
     # TODO (haeger) More sophisticated error checking and handling.
     paths = configParser.read([default_config_path, user_config_path])
+    if user_config_path not in paths and restore is not None and restore():
+        paths += configParser.read(user_config_path)
     if user_config_path not in paths:
         LOG.warning("Could not read user's config file at: {}".format(user_config_path))
 
@@ -26,6 +34,16 @@ def read_config_files(user_config_path, default_config_path):
     else:
         config["cluster_pattern_default_sites"] = None
 
+    config["metadata_cache_ttl"] = configParser.getint(
+        "general", "metadata_cache_ttl", fallback=0
+    )
+    if configParser.has_section("metadata_cache_ttl"):
+        config["metadata_cache_ttls"] = {
+            name: int(ttl) for name, ttl in configParser["metadata_cache_ttl"].items()
+        }
+    else:
+        config["metadata_cache_ttls"] = dict()
+
     # Create a mapping between cluster and sites
     cluster_sections = [
         section for section in configParser.sections() if section.startswith("cluster:")
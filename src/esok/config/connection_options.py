@@ -1,16 +1,22 @@
 import functools
 import logging
 import sys
-from ssl import create_default_context
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 import click
-from elasticsearch import Elasticsearch
-from urllib3.exceptions import HTTPError
 
+from esok import metrics, profiling, trace
 from esok.constants import CLI_ERROR, CONFIGURATION_ERROR, USER_ERROR
 
 LOG = logging.getLogger(__name__)
 _CONNECTIONS_KEY = "{}.connections".format(__name__)
+_CURRENT_CONNECTION_KEY = "{}.current_connection".format(__name__)
+_FILTER_PATH_KEY = "{}.filter_path".format(__name__)
+
+# filter_path of requests that only check if they were acknowledged.
+ACKNOWLEDGED = "acknowledged"
 
 
 def connection_options(f):
@@ -72,9 +78,7 @@ def connection_options(f):
     ):
         ctx = click.get_current_context()
         if user:
-            password_option = click.prompt(
-                f'Password for user "{user}"', hide_input=True
-            )
+            password_option = _password(ctx.obj, user)
         else:
             password_option = None
 
@@ -93,35 +97,75 @@ def connection_options(f):
     return decorator
 
 
+def _password(obj, user):
+    # Sessions (esok shell) only prompt once per user.
+    passwords = obj.get("passwords") if obj is not None else None
+    if passwords is None:
+        return click.prompt(f'Password for user "{user}"', hide_input=True)
+
+    if user not in passwords:
+        passwords[user] = click.prompt(f'Password for user "{user}"', hide_input=True)
+    return passwords[user]
+
+
+def session_obj(ctx):
+    """
+    Context object for running several commands in one process, which keeps
+    clients open and remembers passwords between commands.
+
+    :param ctx: Context of the command that starts the session
+    """
+    root = ctx.find_root()
+    passwords = dict()
+    options = root.meta.get(_CONNECTIONS_KEY)
+    if options is not None and options["user_option"]:
+        passwords[options["user_option"]] = options["password_option"]
+
+    return dict(root.obj, client_pool=ClientPool(), passwords=passwords)
+
+
+class ClientPool(object):
+    def __init__(self):
+        """Elasticsearch clients that are kept open, keyed by connection options."""
+        self._clients = dict()
+        self._lock = threading.Lock()
+
+    def get(self, key, create):
+        """
+        Returns the client of the given key, creating it if it does not exist.
+
+        :param key: Hashable connection options of the client
+        :param create: Function that creates the client
+        """
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = create()
+                self._clients[key] = client
+        return client
+
+    def close(self):
+        """Closes the connections of all clients in the pool."""
+        with self._lock:
+            for client in self._clients.values():
+                client.transport.close()
+            self._clients.clear()
+
+
+Connection = namedtuple("Connection", ["client", "cluster", "site"])
+
+
 def per_connection(include_site=False):
     def wrapper(f):
         @functools.wraps(f)
         def decorator(*args, **kwargs):
             ctx = click.get_current_context().find_root()
-
-            # A bit of an ugly dependency on the ctx.obj having to be set up
-            # externally, with a dictionary structure that is assumed in this file.
-            if (
-                _CONNECTIONS_KEY not in ctx.meta
-                or ctx.obj is None
-                or "config" not in ctx.obj
-            ):
-                LOG.error(
-                    "Connection options mismatch. This is a bug. "
-                    "Would you please file a bug report? Thanks!"
-                )
-                sys.exit(CLI_ERROR)
-
-            cli_options = ctx.meta[_CONNECTIONS_KEY]
-            config = ctx.obj["config"]
-            config.update(cli_options)
-            clients = _create_clients(config)
+            clients = _create_clients(_command_config(ctx))
 
             for client, site, cluster in clients:
+                ctx.meta[_CURRENT_CONNECTION_KEY] = (cluster, site)
                 if len(clients) > 1:
-                    click.secho(
-                        "{} - {}:".format(cluster, site), bold=True, underline=True
-                    )
+                    echo_connection_header(cluster, site)
 
                 if include_site:
                     r = f(client, site, *args, **kwargs)
@@ -146,17 +190,109 @@ def per_connection(include_site=False):
     return wrapper
 
 
+def all_connections():
+    """
+    Like per_connection(), but calls the command once, with a list of all
+    connections as its first argument. Suitable for commands that merge the
+    responses of several sites, see fan_out().
+    """
+
+    def wrapper(f):
+        @functools.wraps(f)
+        def decorator(*args, **kwargs):
+            ctx = click.get_current_context().find_root()
+            connections = [
+                Connection(client, cluster, site)
+                for client, site, cluster in _create_clients(_command_config(ctx))
+            ]
+            return f(connections, *args, **kwargs)
+
+        return decorator
+
+    return wrapper
+
+
+def echo_connection_header(cluster, site):
+    """Prints the header of the output of one of several connections."""
+    click.secho("{} - {}:".format(cluster, site), bold=True, underline=True)
+
+
+def fan_out(connections, f):
+    """
+    Calls ``f(client)`` for all connections concurrently.
+
+    :param connections: Connections given by @all_connections
+    :param f: Function of an Elasticsearch client
+    :return: List of the results, in the order of the connections
+    """
+    if len(connections) == 1:
+        return [f(connections[0].client)]
+
+    with ThreadPoolExecutor(max_workers=len(connections)) as executor:
+        futures = [executor.submit(f, connection.client) for connection in connections]
+        return [future.result() for future in futures]
+
+
+def _command_config(ctx):
+    """Configuration merged with the connection options of the current command."""
+    # A bit of an ugly dependency on the ctx.obj having to be set up
+    # externally, with a dictionary structure that is assumed in this file.
+    if _CONNECTIONS_KEY not in ctx.meta or ctx.obj is None or "config" not in ctx.obj:
+        LOG.error(
+            "Connection options mismatch. This is a bug. "
+            "Would you please file a bug report? Thanks!"
+        )
+        sys.exit(CLI_ERROR)
+
+    # The shared config is not changed, as commands of a session (esok batch)
+    # may run concurrently with other connection options.
+    return dict(ctx.obj["config"], **ctx.meta[_CONNECTIONS_KEY])
+
+
+def set_response_filter(ctx, filter_path):
+    """Sets the --filter-path of a command, see response_filter()."""
+    ctx.find_root().meta[_FILTER_PATH_KEY] = filter_path
+
+
+def response_filter(*required, default=None):
+    """
+    filter_path of a request: the --filter-path given to esok, along with paths of
+    the response that the command needs.
+
+    :param required: Paths that the command needs, such as ACKNOWLEDGED
+    :param default: Paths used if no --filter-path is given, None for all
+    :return: Comma-separated paths, or None for the full response
+    """
+    ctx = click.get_current_context(silent=True)
+    filter_path = ctx.find_root().meta.get(_FILTER_PATH_KEY) if ctx else None
+    filter_path = filter_path or default
+    paths = ([filter_path] if filter_path else []) + list(required)
+    return ",".join(paths) if paths else None
+
+
+def current_connection():
+    """Cluster and site of the connection a @per_connection command is running for.
+
+    :return: Tuple of cluster and site names, both of which may be None.
+    """
+    ctx = click.get_current_context().find_root()
+    return ctx.meta.get(_CURRENT_CONNECTION_KEY, (None, None))
+
+
 def resolve_remote(remote, site):
     """Resolve remote's hostname, if exists.
 
     :param remote: Remote name given by user.
     :param site: Site given by @per_connection decorator.
     """
-    config = click.get_current_context().obj["config"]
-    if site is None and "{site}" in config["cluster_hostname_pattern"]:
-        client = _make_client(remote)
+    ctx = click.get_current_context().find_root()
+    config = dict(ctx.obj["config"], **ctx.meta[_CONNECTIONS_KEY])
+    pattern = config["cluster_hostname_pattern"]
+    if remote not in config["connections"] and (
+        pattern is None or (site is None and "{site}" in pattern)
+    ):
+        client = _make_client(remote, config)
     else:
-        config = config.copy()
         config.update(host_option=None, cluster_option=remote, sites_option=site)
         client = _create_clients(config).pop()[0]
     return client
@@ -229,7 +365,7 @@ def _cluster_clients(connections, cluster_option, sites_option, config):
             )
             sys.exit(USER_ERROR)
 
-        client = _make_client(hostname, config)
+        client = _make_client(hostname, config, cluster_option, site)
         clients.append((client, site, cluster_option))
 
     return clients
@@ -282,11 +418,15 @@ def _patterned_hostname(config, cluster_option, sites_option):
                 client = _make_client(
                     cluster_hostname_pattern.format(cluster=cluster_option, site=site),
                     config,
+                    cluster_option,
+                    site,
                 )
                 clients.append((client, site, cluster_option))
         else:
             client = _make_client(
-                cluster_hostname_pattern.format(cluster=cluster_option), config
+                cluster_hostname_pattern.format(cluster=cluster_option),
+                config,
+                cluster_option,
             )
             clients.append((client, None, cluster_option))
 
@@ -306,7 +446,40 @@ def _parse_sites(sites):
     return [site.strip() for site in sites.split(",")] if sites is not None else None
 
 
-def _make_client(hostname, config):
+def _make_client(hostname, config, cluster=None, site=None):
+    pool = _client_pool()
+    if pool is None:
+        with profiling.phase("client"):
+            return _new_client(hostname, config, cluster, site)
+
+    key = (hostname,) + tuple(
+        config[option]
+        for option in (
+            "user_option",
+            "password_option",
+            "ca_certificate_option",
+            "tls_option",
+            "timeout_option",
+        )
+    )
+    with profiling.phase("client"):
+        return pool.get(key, lambda: _new_client(hostname, config, cluster, site))
+
+
+def _client_pool():
+    ctx = click.get_current_context(silent=True)
+    obj = ctx.find_root().obj if ctx is not None else None
+    return obj.get("client_pool") if isinstance(obj, dict) else None
+
+
+def _new_client(hostname, config, cluster, site):
+    # Elasticsearch and ssl are slow to import, so they are imported first when a
+    # client is actually created.
+    from ssl import create_default_context
+
+    from elasticsearch import Elasticsearch
+    from urllib3.exceptions import HTTPError
+
     ssl_context = create_default_context(cafile=config["ca_certificate_option"])
     user = config["user_option"]
     password = config["password_option"]
@@ -322,6 +495,7 @@ def _make_client(hostname, config):
             http_auth=http_auth,
             use_ssl=config["tls_option"] or config["ca_certificate_option"] is not None,
             ssl_context=ssl_context,
+            **_instrumentation(cluster, site),
         )
     except HTTPError:
         LOG.exception(
@@ -330,3 +504,23 @@ def _make_client(hostname, config):
             )
         )
         sys.exit(USER_ERROR)
+
+
+def _instrumentation(cluster, site):
+    """Client options which instrument requests, if profiling, tracing or measuring."""
+    listeners = list()
+    if profiling.PROFILE.enabled:
+        listeners.append(profiling.PROFILE)
+    if trace.enabled():
+        listeners.append(trace.Tracer(cluster, site))
+    if metrics.METRICS.enabled:
+        listeners.append(metrics.METRICS)
+    if not listeners:
+        return dict()
+
+    from esok.transport import InstrumentedConnection, ProfiledSerializer
+
+    options = dict(connection_class=InstrumentedConnection, listeners=listeners)
+    if profiling.PROFILE.enabled:
+        options.update(serializer=ProfiledSerializer())
+    return options
@@ -11,6 +11,8 @@ ROOT_DIR = path.dirname(path.realpath(__file__))
 RESOURCE_DIR = path.join(ROOT_DIR, "resources")
 DEFAULT_CONFIG = path.join(RESOURCE_DIR, APP_CONFIG_BASENAME)
 
+STATE_DIR_NAME = "state"  # Subdirectory of the app directory for persisted state
+
 
 #########################
 # Exit codes            #
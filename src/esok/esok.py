@@ -4,15 +4,10 @@ from json import JSONDecodeError
 from os import path
 
 import click
-from click_didyoumean import DYMGroup
-from elasticsearch import TransportError
 
-from esok.commands.alias import alias
-from esok.commands.config import config as config_command
-from esok.commands.index import index
-from esok.commands.reindex import reindex
+from esok import metrics, profiling, trace
 from esok.config.config import read_config_files
-from esok.config.connection_options import connection_options
+from esok.config.connection_options import connection_options, set_response_filter
 from esok.constants import (
     APP_CONFIG_BASENAME,
     APP_NAME,
@@ -21,7 +16,8 @@ from esok.constants import (
     UNKNOWN_ERROR,
     USER_ERROR,
 )
-from esok.init import app_init
+from esok.init import app_init, restore_app_config
+from esok.lazy_group import LazyGroup
 from esok.log.decorator import (
     critical,
     debug,
@@ -36,16 +32,55 @@ LOG = logging.getLogger(__name__)
 
 CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
 
+# Sub-commands are imported first when invoked, to keep start-up fast.
+SUBCOMMANDS = dict(
+    alias="esok.commands.alias:alias",
+    batch="esok.commands.batch:batch",
+    cache="esok.commands.cache:cache",
+    cluster="esok.commands.cluster:cluster",
+    config="esok.commands.config:config",
+    index="esok.commands.index:index",
+    migrate="esok.commands.migrate:migrate",
+    reindex="esok.commands.reindex:reindex",
+    search="esok.commands.search:search",
+    shell="esok.commands.shell:shell",
+)
+
 
 def app_dir_callback(ctx, param, value):
     if value is None:
         value = click.get_app_dir(APP_NAME, force_posix=True)
-    app_init(value)
+    # Commands run in a session (esok shell) share an initialized app directory.
+    if ctx.obj is None or ctx.obj.get("app_dir") != value:
+        with profiling.phase("init"):
+            app_init(value)
     return value
 
 
+def profile_callback(ctx, _, enabled):
+    if enabled:
+        profiling.start(ctx)
+
+
+def profile_dump_callback(ctx, _, enabled):
+    if enabled:
+        profiling.start(ctx, dump=True)
+
+
+def trace_callback(ctx, _, enabled):
+    if enabled:
+        trace.enable()
+
+
+def filter_path_callback(ctx, _, filter_path):
+    set_response_filter(ctx, filter_path)
+
+
 @click.group(
-    context_settings=CONTEXT_SETTINGS, cls=DYMGroup, invoke_without_command=True
+    context_settings=CONTEXT_SETTINGS,
+    cls=LazyGroup,
+    lazy_subcommands=SUBCOMMANDS,
+    invoke_without_command=True,
 )
 @click.option(
     "-a",
@@ -110,8 +145,57 @@ def app_dir_callback(ctx, param, value):
     callback=silence,
     help="I'll shut up.",
 )
+@click.option(
+    "--profile",
+    is_flag=True,
+    expose_value=False,
+    callback=profile_callback,
+    help="Print the time spent in each phase of the command to stderr.",
+)
+@click.option(
+    "--profile-dump",
+    is_flag=True,
+    expose_value=False,
+    callback=profile_dump_callback,
+    help="Same as --profile, but also write a cProfile dump to the logs directory.",
+)
+@click.option(
+    "--trace",
+    is_flag=True,
+    expose_value=False,
+    callback=trace_callback,
+    help="Write every request to Elasticsearch as a line of JSON to trace.jsonl "
+    "in the logs directory.",
+)
+@click.option(
+    "-F",
+    "--filter-path",
+    expose_value=False,
+    callback=filter_path_callback,
+    metavar="PATH",
+    help="Comma-separated list of paths of responses to keep, e.g. "
+    "'*.settings.index.number_of_shards'. Passed as filter_path to requests "
+    "whose responses are printed.",
+)
+@click.option(
+    "--metrics",
+    "metrics_targets",
+    multiple=True,
+    metavar="TARGET",
+    help="Emit metrics, such as documents and bytes per second, periodically to "
+    "TARGET: a file for the textfile collector of the Prometheus node exporter, "
+    "or statsd://HOST:PORT. Can be given several times.",
+)
+@click.option(
+    "--metrics-interval",
+    type=click.FloatRange(min=0.1),
+    default=10,
+    show_default=True,
+    metavar="SECONDS",
+    help="Number of seconds between emitted metrics.",
+)
 @click.pass_context
-def esok(ctx, app_dir):
+def esok(ctx, app_dir, metrics_targets, metrics_interval):
     """A CLI for Elasticsearch.
 
     Configure your Elasticsearch connections in the config file.
@@ -126,10 +210,22 @@ def esok(ctx, app_dir):
         $ esok -c my-cluster -s ew,ae alias swap prod prod-v1 prod-v2
     """
     LOG.debug("Using app directory: %s", app_dir)
-    user_config_file = path.join(app_dir, APP_CONFIG_BASENAME)
-    config = read_config_files(user_config_file, DEFAULT_CONFIG)
     ctx.ensure_object(dict)
-    ctx.obj.update(dict(config=config, user_config_file=user_config_file))
+    if ctx.obj.get("app_dir") != app_dir:
+        user_config_file = path.join(app_dir, APP_CONFIG_BASENAME)
+        with profiling.phase("config"):
+            config = read_config_files(
+                user_config_file,
+                DEFAULT_CONFIG,
+                restore=lambda: restore_app_config(app_dir),
+            )
+        ctx.obj.update(
+            dict(config=config, user_config_file=user_config_file, app_dir=app_dir)
+        )
+
+    # Commands of a session (esok shell) are measured by the session's metrics.
+    if metrics_targets and not metrics.METRICS.enabled:
+        metrics.start(ctx, metrics_targets, metrics_interval)
 
     # This group-command is invoked even without supplying sub-commands,
     # in order to set up the app directory. But we still want to present help
@@ -142,46 +238,61 @@ def entry_point():
     try:
         return esok()
 
-    except TransportError as e:
-        LOG.exception("Transport Error")
+    except Exception as e:
+        sys.exit(handle_error(e))
 
-        status = click.style(f"[{e.status_code}]", fg="red", bold=True)
-        error_msg = e.error.replace("_", " ").capitalize()
-        LOG.error(f"{status} {error_msg}")
-
-        if e.status_code != "N/A" and isinstance(e.info, dict):
-            reason = e.info.get("error", dict()).get("reason")
-        else:
-            reason = None
+    finally:
+        logging.shutdown()
 
-        if reason is not None:
-            LOG.error(reason)
 
-        status_code_family = str(e.status_code)[0]
-        if status_code_family == "4":
-            sys.exit(USER_ERROR)
-        elif status_code_family == "5":
-            sys.exit(CLUSTER_ERROR)
-        else:
-            sys.exit(UNKNOWN_ERROR)
+def handle_error(e):
+    """
+    Logs an error that a command failed with.
 
-    except FileNotFoundError as e:
+    :param e: The raised exception
+    :return: The exit code for the error
+    """
+    if isinstance(e, FileNotFoundError):
         LOG.exception("File could not be found: {}".format(e.filename))
-        sys.exit(USER_ERROR)
+        return USER_ERROR
 
-    except JSONDecodeError as e:
+    if isinstance(e, JSONDecodeError):
         LOG.exception("Could not decode JSON document:\n%s", e.doc)
-        sys.exit(USER_ERROR)
+        return USER_ERROR
 
-    except Exception:
-        LOG.exception("Something got borked. Check the logs.")
-        sys.exit(UNKNOWN_ERROR)
+    if _is_transport_error(e):
+        return _transport_error(e)
 
-    finally:
-        logging.shutdown()
+    LOG.exception("Something got borked. Check the logs.")
+    return UNKNOWN_ERROR
+
+
+def _is_transport_error(e):
+    # Elasticsearch is imported lazily. If it is not imported yet, the error
+    # cannot have come from it.
+    elasticsearch = sys.modules.get("elasticsearch")
+    return elasticsearch is not None and isinstance(e, elasticsearch.TransportError)
+
+
+def _transport_error(e):
+    LOG.exception("Transport Error")
+
+    status = click.style(f"[{e.status_code}]", fg="red", bold=True)
+    error_msg = e.error.replace("_", " ").capitalize()
+    LOG.error(f"{status} {error_msg}")
+
+    if e.status_code != "N/A" and isinstance(e.info, dict):
+        reason = e.info.get("error", dict()).get("reason")
+    else:
+        reason = None
 
+    if reason is not None:
+        LOG.error(reason)
 
-esok.add_command(alias)
-esok.add_command(index)
-esok.add_command(config_command)
-esok.add_command(reindex)
+    status_code_family = str(e.status_code)[0]
+    if status_code_family == "4":
+        return USER_ERROR
+    elif status_code_family == "5":
+        return CLUSTER_ERROR
+    else:
+        return UNKNOWN_ERROR
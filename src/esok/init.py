@@ -1,12 +1,15 @@
+import json
 import logging.config
 import shutil
 from os import makedirs, path
 
 import click
-import yaml
 
+from esok import __version__
 from esok.constants import APP_CONFIG_BASENAME, DEFAULT_CONFIG
 
+INIT_CACHE_BASENAME = u".init-cache.json"
+
 LOG = logging.getLogger(__name__)
 
 
@@ -14,13 +17,34 @@ def app_init(app_dir, log_dir_name="logs"):
     """
     Initialize app directories and configurations.
 
+    The resulting logging configuration is cached in the log directory, so that
+    subsequent runs can skip setting up directories and parsing YAML.
+
     :param app_dir: File path to the app's directory
     :param log_dir_name: Name of the subdirectory of ``app_dir``
            in which logs should be placed
     """
-    _init_dirs(app_dir, log_dir_name)
-    _init_logging(path.join(app_dir, log_dir_name))
-    _copy_default_app_config(app_dir)
+    log_dir = path.join(app_dir, log_dir_name)
+    logging_config = _read_init_cache(log_dir)
+
+    if logging_config is None:
+        dirs_ok = _init_dirs(app_dir, log_dir_name)
+        config_ok = _copy_default_app_config(app_dir)
+        logging_config = _load_logging_config(log_dir)
+        if dirs_ok and config_ok:
+            _write_init_cache(log_dir, logging_config)
+
+    _init_logging(logging_config)
+
+
+def restore_app_config(app_dir):
+    """
+    Places the default configuration file in the app directory, if it is missing.
+    As a warm start skips that, it is done when the config file could not be read.
+
+    :return: Whether the configuration file exists
+    """
+    return _copy_default_app_config(app_dir)
 
 
 def _init_dirs(app_dir, log_dir_name):
@@ -37,16 +61,19 @@ def _init_dirs(app_dir, log_dir_name):
             err=True,
             fg=u"red",
         )
+        return False
+
+    return True
 
 
-def _init_logging(log_dir):
+def _load_logging_config(log_dir):
     """
     Load logging configuration.
 
-    :param app_dir: File path to the app's directory
-    :param log_dir_name: Name of the subdirectory of ``app_dir``
-           in which logs should be placed
+    :param log_dir: Directory in which logs should be placed
     """
+    import yaml
+
     this_file = path.dirname(path.abspath(__file__))
     with open(path.join(this_file, u"resources", u"logging.yaml"), u"r") as f:
         logging_config = yaml.safe_load(f)
@@ -58,10 +85,57 @@ def _init_logging(log_dir):
             full_log_path = path.join(log_dir, handler.get(handler_filename_key))
             handler[handler_filename_key] = full_log_path
 
+    return logging_config
+
+
+def _init_logging(logging_config):
     try:
         logging.config.dictConfig(logging_config)
     except ValueError:
         click.secho(u"Could not setup logging configuration.", err=True, fg=u"red")
+        return
+
+    background = logging_config.get(u"background")
+    if background is not None:
+        _init_background_logging(**background)
+
+
+def _init_background_logging(loggers, queue_size):
+    """Moves the handlers of the given loggers behind a BackgroundHandler."""
+    from esok.log.BackgroundHandler import BackgroundHandler
+
+    for name in loggers:
+        logger = logging.getLogger(None if name == u"root" else name)
+        handlers = list(logger.handlers)
+        if not handlers:
+            continue
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(BackgroundHandler(handlers, queue_size=queue_size))
+
+
+def _read_init_cache(log_dir):
+    """Returns the cached logging configuration, if it is valid for this version."""
+    try:
+        with open(path.join(log_dir, INIT_CACHE_BASENAME), u"r") as f:
+            cache = json.load(f)
+    except (OSError, IOError, ValueError):
+        return None
+
+    if cache.get(u"version") != __version__ or cache.get(u"log_dir") != log_dir:
+        return None
+
+    return cache.get(u"logging")
+
+
+def _write_init_cache(log_dir, logging_config):
+    cache = dict(version=__version__, log_dir=log_dir, logging=logging_config)
+    try:
+        with open(path.join(log_dir, INIT_CACHE_BASENAME), u"w") as f:
+            json.dump(cache, f)
+    except (OSError, IOError):
+        # Not being able to cache only makes the next start slower.
+        LOG.debug(u"Could not write initialization cache to: %s", log_dir)
 
 
 def _copy_default_app_config(
@@ -81,3 +155,6 @@ def _copy_default_app_config(
                 err=True,
                 fg=u"red",
             )
+            return False
+
+    return True
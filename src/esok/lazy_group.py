@@ -0,0 +1,29 @@
+import importlib
+
+from click_didyoumean import DYMGroup
+
+
+class LazyGroup(DYMGroup):
+    def __init__(self, *args, lazy_subcommands=None, **kwargs):
+        """
+        A command group which imports its sub-commands first when they are used.
+
+        :param lazy_subcommands: Mapping of command names to import paths of the
+               commands, in the form of ``"package.module:command"``
+        """
+        super(LazyGroup, self).__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands or dict()
+
+    def list_commands(self, ctx):
+        commands = super(LazyGroup, self).list_commands(ctx)
+        return sorted(set(commands) | set(self.lazy_subcommands.keys()))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_subcommands:
+            return self._load(cmd_name)
+        return super(LazyGroup, self).get_command(ctx, cmd_name)
+
+    def _load(self, cmd_name):
+        module_name, command_name = self.lazy_subcommands[cmd_name].split(":")
+        module = importlib.import_module(module_name)
+        return getattr(module, command_name)
@@ -0,0 +1,64 @@
+import copy
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+
+class BackgroundHandler(QueueHandler):
+    def __init__(self, handlers, queue_size=10000):
+        """
+        A log handler that passes records on to other handlers in a background
+        thread, so that formatting and writing them never blocks the caller.
+
+        If more than ``queue_size`` records are waiting to be handled, new records
+        are dropped. The number of dropped records is logged as soon as there is room
+        in the queue again.
+
+        :param handlers: The handlers that records are passed on to
+        :param queue_size: Maximum number of records waiting to be handled
+        """
+        # The queue itself is unbounded, so that there is always room to report
+        # dropped records.
+        super(BackgroundHandler, self).__init__(queue.Queue())
+        self.queue_size = queue_size
+        self.dropped = 0
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def prepare(self, record):
+        # Arguments are merged into the message right away, as the caller may change
+        # them after logging. Everything else is left to the background thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        # Called with the handler's lock held, so the dropped count is safe.
+        if self.queue.qsize() >= self.queue_size:
+            self.dropped += 1
+            return
+
+        if self.dropped:
+            self.queue.put_nowait(self._dropped_record())
+            self.dropped = 0
+        self.queue.put_nowait(record)
+
+    def close(self):
+        if self.dropped:
+            self.queue.put_nowait(self._dropped_record())
+            self.dropped = 0
+        if self.listener._thread is not None:
+            self.listener.stop()  # Handles all records left in the queue.
+        super(BackgroundHandler, self).close()
+
+    def _dropped_record(self):
+        return logging.LogRecord(
+            name=__name__,
+            level=logging.WARNING,
+            pathname=__file__,
+            lineno=0,
+            msg="%d log records were dropped, as logging could not keep up.",
+            args=(self.dropped,),
+            exc_info=None,
+        )
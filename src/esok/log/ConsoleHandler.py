@@ -38,6 +38,8 @@ class ConsoleHandler(logging.Handler):
     def _check_level(self, level):
         if isinstance(level, str):
             level = level.upper()
+            if level.isdigit():
+                level = int(level)
 
             if level == "EXCEPTION":
                 level = logging.ERROR
@@ -50,6 +50,20 @@ def verbosity(logger, *names, **kwargs):
     return decorator
 
 
+def current_verbosity(ctx):
+    """
+    The verbosity level of the context, as a value of the verbosity option.
+
+    :return: The level, or None if no verbosity option has been processed
+    """
+    handler = ctx.meta.get(_META_HANDLER_KEY)
+    if handler is None:
+        return None
+    if handler.formatter.show_traceback:
+        return "EXCEPTION"
+    return str(handler.level)
+
+
 def debug(ctx, _, enabled):
     _set_level(ctx, enabled, logging.DEBUG)
 
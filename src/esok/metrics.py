@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from esok.util import byte_size
+
+LOG = logging.getLogger(__name__)
+
+# Statuses on which requests are retried, by the client or by the bulk helpers.
+RETRY_STATUSES = (429, 502, 503, 504)
+# Bulk responses with failed items, which are parsed to count rejections.
+BULK_ERRORS = re.compile(r'"errors"\s*:\s*true')
+# Percentiles of request latency, emitted per interval.
+PERCENTILES = (50, 90, 99)
+MAX_LATENCY_SAMPLES = 10000
+
+COUNTERS = (
+    "docs",
+    "requests",
+    "request_bytes",
+    "response_bytes",
+    "retryable_responses",
+    "rejected_items",
+)
+GAUGES = ("in_flight_requests", "queue_depth")
+
+
+class Metrics(object):
+    def __init__(self):
+        """
+        Counters and gauges of a running job, which are emitted periodically to
+        sinks, such as a Prometheus textfile or StatsD. Requests are measured as a
+        listener of esok.transport.InstrumentedConnection.
+        """
+        self.enabled = False
+        self.job_name = "esok"
+        self.values = dict.fromkeys(COUNTERS + GAUGES, 0)
+        self.sinks = list()
+        self._latencies = deque(maxlen=MAX_LATENCY_SAMPLES)
+        self._latency_sum = 0.0
+        self._latency_count = 0
+        self._last_emit = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def count(self, name, value=1):
+        """Increases a counter."""
+        if self.enabled:
+            with self._lock:
+                self.values[name] += value
+
+    def set(self, name, value):
+        """Sets a gauge, or a counter that is tracked elsewhere, such as in a task."""
+        if self.enabled:
+            with self._lock:
+                self.values[name] = value
+
+    def on_request_start(self, connection, method, url):
+        self.count("in_flight_requests")
+
+    def on_request(
+        self, connection, method, url, params, body, status, response, seconds
+    ):
+        """Listener of esok.transport.InstrumentedConnection."""
+        if not self.enabled:
+            return
+        rejected_items = 0
+        if status == 200 and url.endswith("/_bulk") and BULK_ERRORS.search(response):
+            # Rejected items are retried by the bulk helpers, as backpressure.
+            rejected_items = sum(
+                1
+                for item in json.loads(response)["items"]
+                for result in item.values()
+                if result.get("status") == 429
+            )
+        with self._lock:
+            self.values["in_flight_requests"] -= 1
+            self.values["requests"] += 1
+            self.values["request_bytes"] += byte_size(body)
+            self.values["response_bytes"] += byte_size(response)
+            if status is None or status in RETRY_STATUSES:
+                self.values["retryable_responses"] += 1
+            self.values["rejected_items"] += rejected_items
+            self._latencies.append(seconds)
+            self._latency_sum += seconds
+            self._latency_count += 1
+
+    def samples(self):
+        """
+        Current values, rates since the previous call, and latency percentiles of
+        the requests made since then.
+
+        :return: List of (name, labels, value, type) tuples
+        """
+        now = time.monotonic()
+        with self._lock:
+            values = dict(self.values)
+            latencies = sorted(self._latencies)
+            self._latencies.clear()
+            latency_sum, latency_count = self._latency_sum, self._latency_count
+            last_time, last_values = self._last_emit or (now, values)
+            self._last_emit = (now, values)
+
+        samples = [
+            (name + "_total", dict(), values[name], "counter") for name in COUNTERS
+        ]
+        samples += [(name, dict(), values[name], "gauge") for name in GAUGES]
+
+        elapsed = now - last_time
+        if elapsed > 0:
+            byte_count = values["request_bytes"] + values["response_bytes"]
+            last_byte_count = (
+                last_values["request_bytes"] + last_values["response_bytes"]
+            )
+            samples += [
+                (
+                    "docs_per_second",
+                    dict(),
+                    (values["docs"] - last_values["docs"]) / elapsed,
+                    "gauge",
+                ),
+                (
+                    "bytes_per_second",
+                    dict(),
+                    (byte_count - last_byte_count) / elapsed,
+                    "gauge",
+                ),
+            ]
+
+        # Quantiles are of the requests made since the previous call, while the
+        # sum and count of the summary are totals.
+        if latencies:
+            for percentile in PERCENTILES:
+                i = min(len(latencies) - 1, len(latencies) * percentile // 100)
+                labels = dict(quantile=str(percentile / 100.0))
+                samples.append(
+                    ("request_latency_seconds", labels, latencies[i], "summary")
+                )
+        samples += [
+            ("request_latency_seconds_sum", dict(), latency_sum, "summary"),
+            ("request_latency_seconds_count", dict(), latency_count, "summary"),
+        ]
+
+        return samples
+
+    def emit(self):
+        samples = self.samples()
+        for sink in self.sinks:
+            try:
+                sink.write(self.job_name, samples)
+            except (OSError, IOError):
+                LOG.warning("Could not emit metrics to: %s", sink, exc_info=True)
+
+    def start(self, sinks, interval):
+        """Starts emitting metrics to the given sinks every interval seconds."""
+        self.sinks = list(sinks)
+        self.job_name = "esok"
+        self.values = dict.fromkeys(COUNTERS + GAUGES, 0)
+        self._latencies.clear()
+        self._latency_sum = 0.0
+        self._latency_count = 0
+        self.enabled = True
+        self._stop.clear()
+        self.samples()  # Starts the first interval.
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), name="metrics", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stops emitting metrics, after emitting them a last time."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.emit()
+        self.enabled = False
+        for sink in self.sinks:
+            sink.close()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self.emit()
+
+
+METRICS = Metrics()
+
+
+def job(name):
+    """Labels the metrics emitted from now on with the given job name."""
+    METRICS.job_name = name
+
+
+def measure_task(status):
+    """Sets the documents and queue depth from the status of a reindex-like task."""
+    modified = status["created"] + status["updated"] + status["deleted"]
+    METRICS.set("docs", modified)
+    METRICS.set("queue_depth", status["total"] - modified)
+
+
+def start(ctx, targets, interval):
+    """
+    Starts emitting METRICS, until ``ctx`` is closed.
+
+    :param ctx: Context of the measured command
+    :param targets: Files for the Prometheus textfile collector, or statsd:// URLs
+    :param interval: Number of seconds between emissions
+    """
+    METRICS.start([sink(target) for target in targets], interval)
+    ctx.call_on_close(METRICS.stop)
+
+
+def sink(target):
+    """The sink of a --metrics target."""
+    if target.startswith("statsd://"):
+        url = urlparse(target)
+        return StatsD(url.hostname or "localhost", url.port or 8125)
+    return PrometheusTextfile(target)
+
+
+class PrometheusTextfile(object):
+    def __init__(self, file_path):
+        """
+        Writes metrics in the text format of Prometheus, for the textfile collector
+        of the node exporter. The file is replaced atomically.
+        """
+        self.file_path = file_path
+
+    def write(self, job_name, samples):
+        lines = list()
+        typed = set()
+        for name, labels, value, metric_type in samples:
+            metric = "esok_" + name
+            # The sum and count of a summary are typed by the summary itself.
+            typed_metric = metric
+            if metric_type == "summary":
+                typed_metric = re.sub("_(sum|count)$", "", metric)
+            if typed_metric not in typed:
+                lines.append("# TYPE {} {}".format(typed_metric, metric_type))
+                typed.add(typed_metric)
+            labels = dict(labels, job=job_name)
+            label_text = ",".join(
+                '{}="{}"'.format(key, labels[key]) for key in sorted(labels)
+            )
+            lines.append("{}{{{}}} {}".format(metric, label_text, value))
+
+        tmp_file = self.file_path + ".tmp"
+        with open(tmp_file, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_file, self.file_path)
+
+    def close(self):
+        pass
+
+    def __str__(self):
+        return self.file_path
+
+
+class StatsD(object):
+    def __init__(self, host, port, prefix="esok"):
+        """Sends metrics as StatsD counters and gauges over UDP."""
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sent = dict()
+
+    def write(self, job_name, samples):
+        for name, labels, value, metric_type in samples:
+            parts = [self.prefix, job_name, name]
+            if "quantile" in labels:
+                parts.append("p{}".format(round(float(labels["quantile"]) * 100)))
+            key = ".".join(_statsd_name(part) for part in parts)
+
+            if metric_type == "counter":
+                # StatsD counters are sent as increments.
+                value, self._sent[key] = value - self._sent.get(key, 0), value
+                line = "{}:{}|c".format(key, value)
+            else:
+                line = "{}:{}|g".format(key, value)
+            self.socket.sendto(line.encode("utf-8"), self.address)
+
+    def close(self):
+        self.socket.close()
+
+    def __str__(self):
+        return "statsd://{}:{}".format(*self.address)
+
+
+def _statsd_name(name):
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
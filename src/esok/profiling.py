@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from os import path
+
+import click
+
+from esok.util import format_table
+
+LOG = logging.getLogger(__name__)
+
+# Requests with the longest total time that are listed in the summary.
+TOP_REQUESTS = 10
+
+
+class Profile(object):
+    def __init__(self):
+        """
+        Wall time spent in the phases of a run, such as initialization, client
+        creation and requests. Phases may be recorded from several threads.
+        """
+        self.started = time.perf_counter()
+        self.enabled = False
+        self.phases = dict()
+        self.requests = dict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Records the time spent in the with-block as the given phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        with self._lock:
+            calls, total = self.phases.get(name, (0, 0.0))
+            self.phases[name] = (calls + 1, total + seconds)
+
+    def on_request(
+        self, connection, method, url, params, body, status, response, seconds
+    ):
+        """Listener of esok.transport.InstrumentedConnection."""
+        endpoint = "{} {}".format(method, url)
+        self.record("request", seconds)
+        with self._lock:
+            calls, total = self.requests.get(endpoint, (0, 0.0))
+            self.requests[endpoint] = (calls + 1, total + seconds)
+
+    def summary(self):
+        """A human readable table of the time spent in each phase."""
+        total = time.perf_counter() - self.started
+        with self._lock:
+            phases = dict(self.phases)
+            requests = dict(self.requests)
+
+        # Phases may overlap when requests are made from several threads.
+        other = max(total - sum(seconds for _, seconds in phases.values()), 0.0)
+        phases["other"] = (None, other)
+
+        rows = [
+            (
+                name,
+                "-" if calls is None else calls,
+                "{:.3f}".format(seconds),
+                _share(seconds, total),
+            )
+            for name, (calls, seconds) in phases.items()
+        ]
+        rows.append(("total", "-", "{:.3f}".format(total), _share(total, total)))
+        lines = [format_table(("phase", "calls", "seconds", "share"), rows)]
+
+        if requests:
+            slowest = sorted(requests.items(), key=lambda r: r[1][1], reverse=True)
+            rows = [
+                (endpoint, calls, "{:.3f}".format(seconds))
+                for endpoint, (calls, seconds) in slowest[:TOP_REQUESTS]
+            ]
+            lines.append("")
+            lines.append(format_table(("request", "calls", "seconds"), rows))
+
+        return "\n".join(lines)
+
+
+# Created on import, so that it also covers start-up of the process.
+PROFILE = Profile()
+
+
+def phase(name):
+    """Records the time spent in the with-block as the given phase of PROFILE."""
+    return PROFILE.phase(name)
+
+
+def start(ctx, dump=False):
+    """
+    Enables PROFILE, and prints its summary when ``ctx`` is closed.
+
+    :param ctx: Context of the profiled command
+    :param dump: Also profile with cProfile, and write its statistics to the logs
+           directory of the app
+    """
+    PROFILE.enabled = True
+
+    profiler = None
+    if dump:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    def _stop():
+        PROFILE.enabled = False
+        if profiler is not None:
+            profiler.disable()
+            _dump(ctx, profiler)
+        click.echo(PROFILE.summary(), err=True)
+
+    ctx.call_on_close(_stop)
+
+
+def _dump(ctx, profiler):
+    app_dir = (ctx.obj or dict()).get("app_dir")
+    if app_dir is None:
+        LOG.warning("No app directory to write profile to.")
+        return
+
+    file_name = "profile-{}.pstats".format(time.strftime("%Y%m%d-%H%M%S"))
+    dump_file = path.join(app_dir, "logs", file_name)
+    profiler.dump_stats(dump_file)
+    click.echo("Profile written to: {}".format(dump_file), err=True)
+
+
+def _share(seconds, total):
+    return "{:.1f}%".format(100 * seconds / total) if total > 0 else "-"
@@ -0,0 +1,63 @@
+import logging
+
+import click
+
+from esok.config.connection_options import session_obj
+from esok.log.decorator import current_verbosity
+
+LOG = logging.getLogger(__name__)
+
+
+class Session(object):
+    def __init__(self, ctx):
+        """
+        Runs esok command lines in this process, sharing the configuration and
+        Elasticsearch clients between them. Commands may run concurrently.
+
+        Options given to the root command of ``ctx`` are the defaults of every
+        command line.
+
+        :param ctx: Context of the command that starts the session
+        """
+        root = ctx.find_root()
+        self.command = root.command
+        self.obj = session_obj(root)
+        self.defaults = dict(root.params, verbosity=current_verbosity(root))
+
+    def run(self, args):
+        """
+        Runs one command line.
+
+        :param args: Arguments of the command line, without the leading "esok"
+        :return: The exit code of the command
+        """
+        from esok.esok import handle_error
+
+        LOG.debug("Running command: %s", args)
+        try:
+            r = self.command.main(
+                args=list(args),
+                prog_name="esok",
+                standalone_mode=False,
+                obj=self.obj,
+                default_map=self.defaults,
+            )
+            return r if isinstance(r, int) else 0
+
+        except click.ClickException as e:
+            e.show()
+            return e.exit_code
+
+        except click.Abort:
+            click.echo("Aborted!", err=True)
+            return 1
+
+        except SystemExit as e:
+            return e.code or 0
+
+        except Exception as e:
+            return handle_error(e)
+
+    def close(self):
+        """Closes all connections opened by the session."""
+        self.obj["client_pool"].close()
@@ -0,0 +1,62 @@
+import json
+import logging
+import time
+
+from esok.util import byte_size
+
+# Configured in logging.yaml to write to trace.jsonl in the logs directory.
+LOG = logging.getLogger(__name__)
+
+
+def enable():
+    """Enables tracing of requests made by clients created from now on."""
+    LOG.setLevel(logging.INFO)
+
+
+def enabled():
+    return LOG.isEnabledFor(logging.INFO)
+
+
+class Tracer(object):
+    def __init__(self, cluster=None, site=None):
+        """
+        Writes every request of a client as a line of JSON to the trace log.
+
+        :param cluster: Name of the cluster the client connects to, if any
+        :param site: Name of the site the client connects to, if any
+        """
+        self.cluster = cluster
+        self.site = site
+
+    def on_request(
+        self, connection, method, url, params, body, status, response, seconds
+    ):
+        """Listener of esok.transport.InstrumentedConnection."""
+        LOG.info(
+            json.dumps(
+                dict(
+                    timestamp=round(time.time(), 3),
+                    cluster=self.cluster,
+                    site=self.site,
+                    host=connection.host,
+                    method=method,
+                    endpoint=url,
+                    params=_params(params),
+                    status=status,
+                    request_bytes=byte_size(body),
+                    response_bytes=byte_size(response),
+                    seconds=round(seconds, 6),
+                ),
+                default=str,
+            )
+        )
+
+
+def _params(params):
+    if not params:
+        return None
+    # The client has already encoded most values.
+    return {
+        key: value.decode("utf-8") if isinstance(value, bytes) else value
+        for key, value in params.items()
+    }
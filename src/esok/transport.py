@@ -0,0 +1,62 @@
+import time
+
+from elasticsearch import JSONSerializer, TransportError, Urllib3HttpConnection
+
+from esok.profiling import PROFILE
+
+
+class InstrumentedConnection(Urllib3HttpConnection):
+    def __init__(self, *args, listeners=(), **kwargs):
+        """
+        An Elasticsearch connection that reports every request to listeners.
+
+        :param listeners: Objects with an ``on_request(connection, method, url,
+               params, body, status, response, seconds)`` method. ``status``
+               and ``response`` are None if no response was received.
+               Listeners may also have an ``on_request_start(connection, method,
+               url)`` method.
+        """
+        super(InstrumentedConnection, self).__init__(*args, **kwargs)
+        self.listeners = list(listeners)
+        self._on_start = [
+            listener.on_request_start
+            for listener in self.listeners
+            if hasattr(listener, "on_request_start")
+        ]
+
+    def perform_request(
+        self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None
+    ):
+        for on_start in self._on_start:
+            on_start(self, method, url)
+
+        status = None
+        response = None
+        start = time.perf_counter()
+        try:
+            status, response_headers, response = super(
+                InstrumentedConnection, self
+            ).perform_request(method, url, params, body, timeout, ignore, headers)
+            return status, response_headers, response
+        except TransportError as e:
+            if isinstance(e.status_code, int):
+                status = e.status_code
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            for listener in self.listeners:
+                listener.on_request(
+                    self, method, url, params, body, status, response, seconds
+                )
+
+
+class ProfiledSerializer(JSONSerializer):
+    """A JSON serializer that records its time as the serialization phase."""
+
+    def dumps(self, data):
+        with PROFILE.phase("serialization"):
+            return super(ProfiledSerializer, self).dumps(data)
+
+    def loads(self, s):
+        with PROFILE.phase("serialization"):
+            return super(ProfiledSerializer, self).loads(s)
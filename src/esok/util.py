@@ -1,8 +1,19 @@
+import json
 import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from os import path
 
 from esok.constants import UNKNOWN_ERROR
 
 LOG = logging.getLogger(__name__)
+SIZE_UNITS = ("b", "kb", "mb", "gb", "tb", "pb")
+# Paths of the task info needed to follow a task.
+TASK_PATHS = ("completed", "error", "task.status", "response.failures")
 
 
 def clean_index(index, skip_settings, skip_mapping):
@@ -28,3 +39,172 @@ def clean_index(index, skip_settings, skip_mapping):
         u"settings": settings if not skip_settings else {},
     }
     return cleaned_mapping
+
+
+def create_target_index(client, source, target_index):
+    """Creates an index from the mapping and settings of a fetched source index.
+
+    :param client: Client of the cluster to create the index on
+    :param source: Source index, as returned by ``indices.get``
+    :param target_index: Name of the index to create
+    """
+    from esok.config.connection_options import ACKNOWLEDGED, response_filter
+
+    cleaned_index = clean_index(source, False, False)
+
+    r = client.indices.create(
+        index=target_index,
+        body=cleaned_index,
+        filter_path=response_filter(ACKNOWLEDGED),
+    )
+    ok = r.get("acknowledged")
+    LOG.debug(json.dumps(r))
+    if not ok:
+        sys.exit(UNKNOWN_ERROR)
+
+    LOG.info("Index created: %s", target_index)
+
+
+def task_progress(status):
+    """Fraction of documents processed by a reindex-like task, between 0 and 1."""
+    modified = status["created"] + status["updated"] + status["deleted"]
+    total = status["total"]
+    if total == 0:
+        return 1.0
+    return float(modified) / total
+
+
+def task_errors(task_info):
+    """Errors or failures of a completed task, or None if it was successful."""
+    return task_info.get("error") or task_info.get("response", dict()).get("failures")
+
+
+def wait_for_task(client, task_id, poll_interval=5.0, on_status=None):
+    """
+    Blocks until the given task has completed, returning its final task info.
+
+    :param on_status: Called with the status of the task after every poll
+    """
+    from esok.config.connection_options import response_filter
+
+    # Commands print the response of the task, unless --filter-path is given.
+    filter_path = response_filter(*TASK_PATHS, default="response")
+    while True:
+        task_info = client.tasks.get(task_id=task_id, filter_path=filter_path)
+        if on_status is not None:
+            on_status(task_info["task"]["status"])
+        if task_info.get("completed"):
+            return task_info
+        LOG.debug("Task %s not completed yet.", task_id)
+        time.sleep(poll_interval)
+
+
+def max_field_value(client, index, field):
+    """The highest value of a field in an index, or None for an empty index."""
+    r = client.search(
+        index=index,
+        body={"size": 0, "aggs": {"watermark": {"max": {"field": field}}}},
+        filter_path="aggregations",
+    )
+    watermark = r.get("aggregations", dict()).get("watermark", dict())
+    # Dates are kept in the field's own format, so range queries can parse them.
+    return watermark.get("value_as_string", watermark.get("value"))
+
+
+def read_state(state_file):
+    """Reads persisted state, or an empty dictionary if there is none yet."""
+    if not path.isfile(state_file):
+        return dict()
+
+    with open(state_file, "r") as f:
+        return json.load(f)
+
+
+def write_state(state_file, state):
+    """Persists state as JSON, replacing the previous file atomically."""
+    state_dir = path.dirname(state_file)
+    if state_dir and not path.exists(state_dir):
+        os.makedirs(state_dir)
+
+    tmp_file = state_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, state_file)
+
+
+def format_table(header, rows):
+    """Formats rows as left-aligned columns, in the style of the cat APIs."""
+    rows = [list(header)] + [[str(cell) for cell in row] for row in rows]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    lines = [
+        " ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+        for row in rows
+    ]
+    return "\n".join(lines)
+
+
+def byte_size(data):
+    """Size in bytes of a request or response body, which may be None."""
+    if data is None:
+        return 0
+    if isinstance(data, str):
+        return len(data.encode("utf-8"))
+    return len(data)
+
+
+def human_size(size):
+    """Formats a number of bytes in the style of the cat APIs, e.g. 1.2gb."""
+    size = float(size)
+    unit = 0
+    while size >= 1024 and unit < len(SIZE_UNITS) - 1:
+        size /= 1024
+        unit += 1
+    if unit == 0:
+        return "{}b".format(int(size))
+    return "{:.1f}{}".format(size, SIZE_UNITS[unit])
+
+
+def parse_size(text):
+    """Parses a size such as 500mb or 1.5gb into a number of bytes.
+
+    :raises ValueError: If the size cannot be parsed.
+    """
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([kmgtp]?b)?\s*$", text, re.IGNORECASE)
+    if match is None:
+        raise ValueError("Invalid size: {}".format(text))
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** SIZE_UNITS.index((unit or "b").lower()))
+
+
+def prefetched(*pages, depth=2):
+    """
+    Fetches pages in background threads, flattening them into one iterator.
+
+    :param pages: Iterables of pages. Pages of several iterables are interleaved,
+        in the order they are fetched.
+    :param depth: Maximum number of fetched pages waiting to be consumed, per
+        iterable
+    """
+    fetched = queue.Queue(maxsize=depth * len(pages))
+    done = object()
+
+    def _fetch(iterable):
+        try:
+            for page in iterable:
+                fetched.put(page)
+        except Exception as e:
+            fetched.put(e)
+        fetched.put(done)
+
+    for iterable in pages:
+        threading.Thread(target=_fetch, args=(iterable,), daemon=True).start()
+
+    remaining = len(pages)
+    while remaining:
+        page = fetched.get()
+        if page is done:
+            remaining -= 1
+            continue
+        if isinstance(page, Exception):
+            raise page
+        yield from page
@@ -0,0 +1,64 @@
+import json
+import time
+from os import path
+
+import pytest
+
+BASELINES_FILE = path.join(path.dirname(__file__), "baselines.json")
+# A benchmark fails if it is this many times slower than its baseline, which
+# leaves room for slower machines while catching regressions in complexity.
+TOLERANCE = 3.0
+
+# Lines of the timings of all benchmarks, printed in the terminal summary.
+RESULTS = list()
+
+
+def pytest_terminal_summary(terminalreporter):
+    if RESULTS and terminalreporter.verbosity >= 0:
+        terminalreporter.section("benchmarks")
+        for line in RESULTS:
+            terminalreporter.write_line(line)
+
+
+@pytest.fixture(scope="session")
+def baselines(request):
+    with open(BASELINES_FILE) as f:
+        stored = json.load(f)
+    timings = dict()
+
+    yield stored, timings
+
+    if request.config.getoption("--update-baselines") and timings:
+        stored.update(timings)
+        with open(BASELINES_FILE, "w") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+@pytest.fixture
+def benchmark(request, baselines):
+    """
+    Runs a function a few times, and compares its fastest run against the stored
+    baseline of the benchmark, named after the test.
+
+    :return: Function of the benchmarked function and its number of rounds
+    """
+    stored, timings = baselines
+    name = request.node.name
+
+    def _benchmark(f, rounds=3):
+        seconds = list()
+        for _ in range(rounds):
+            start = time.perf_counter()
+            f()
+            seconds.append(time.perf_counter() - start)
+        best = min(seconds)
+        timings[name] = round(best, 4)
+
+        baseline = stored.get(name)
+        RESULTS.append("{}: {:.4f} seconds (baseline {})".format(name, best, baseline))
+        if baseline is not None and not request.config.getoption("--update-baselines"):
+            assert best <= baseline * TOLERANCE, "{} got slower.".format(name)
+        return best
+
+    return _benchmark
@@ -0,0 +1,73 @@
+"""
+Benchmarks of common commands against tests/fake_elasticsearch.py, which run
+offline. Run them with:
+
+    pytest --benchmark --no-cov tests/benchmarks
+
+and store new baselines by adding --update-baselines.
+"""
+import json
+import subprocess
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+from esok.esok import esok
+from tests.fake_elasticsearch import FakeElasticsearch
+
+pytestmark = pytest.mark.benchmark
+
+DOC_COUNT = 20000
+SITES = ("eu", "us", "ae", "ap", "sa")
+# Latency of the fake sites, for benchmarks where waiting on the network dominates.
+SITE_LATENCY = 0.05
+
+
+def _documents(count):
+    return [{"n": n, "title": "Document number {}".format(n)} for n in range(count)]
+
+
+def _invoke(*args):
+    result = CliRunner(mix_stderr=False).invoke(esok, args)
+    assert result.exit_code == 0, result.stderr
+    return result
+
+
+def test_startup(benchmark, tmp_path):
+    command = [
+        sys.executable,
+        "-c",
+        "from esok.esok import entry_point; entry_point()",
+        "-a",
+        str(tmp_path),
+        "--help",
+    ]
+    subprocess.run(command, stdout=subprocess.DEVNULL, check=True)  # Warms caches.
+
+    benchmark(lambda: subprocess.run(command, stdout=subprocess.DEVNULL, check=True))
+
+
+def test_index_write(benchmark, fake_config_file, tmp_path):
+    docs = tmp_path / "docs.json"
+    with docs.open("w") as f:
+        for document in _documents(DOC_COUNT):
+            f.write(json.dumps(document) + "\n")
+
+    benchmark(lambda: _invoke("index", "write", "-i", "bench", str(docs)))
+
+
+def test_index_read(benchmark, fake_config_file, fake_es):
+    fake_es.add_documents("bench", _documents(DOC_COUNT))
+
+    benchmark(lambda: _invoke("index", "read", "bench"))
+
+
+def test_fan_out(benchmark, test_app_dir):
+    with FakeElasticsearch(latency=SITE_LATENCY) as fake_es:
+        fake_es.add_documents("bench", _documents(10))
+        sites = "".join("{} = {}\n".format(site, fake_es.host) for site in SITES)
+        config = "[general]\ndefault_connection = bench\n[cluster:bench]\n" + sites
+        (test_app_dir / "esok.ini").write_text(config)
+
+        benchmark(lambda: _invoke("index", "list"))
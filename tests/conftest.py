@@ -6,6 +6,31 @@ from click.testing import CliRunner
 from elasticsearch import Elasticsearch, TransportError
 from testcontainers.elasticsearch import ElasticsearchContainer
 
+from tests.fake_elasticsearch import FakeElasticsearch
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmarks")
+    group.addoption(
+        "--benchmark",
+        action="store_true",
+        help="Run the benchmarks in tests/benchmarks.",
+    )
+    group.addoption(
+        "--update-baselines",
+        action="store_true",
+        help="Store the timings of the benchmarks as their new baselines.",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+    skip = pytest.mark.skip(reason="Benchmarks only run with --benchmark.")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
 
 @pytest.fixture(autouse=True)
 def test_app_dir(monkeypatch, tmp_path):
@@ -14,6 +39,21 @@ def test_app_dir(monkeypatch, tmp_path):
     yield tmp_path
 
 
+@pytest.fixture
+def fake_es():
+    """Returns an in-process fake of Elasticsearch, see tests/fake_elasticsearch.py."""
+    with FakeElasticsearch() as es:
+        yield es
+
+
+@pytest.fixture
+def fake_config_file(test_app_dir, fake_es):
+    """Sets up config file with default_connection pointing towards fake_es."""
+    config_file = test_app_dir / "esok.ini"
+    config_file.write_text("[general]\ndefault_connection = {}\n".format(fake_es.host))
+    yield config_file
+
+
 @pytest.fixture
 def user_config_file(test_app_dir):
     conf = test_app_dir / "esok.ini"
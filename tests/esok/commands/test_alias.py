@@ -0,0 +1,125 @@
+from click.testing import CliRunner
+
+from esok.commands.alias import _alias_differences, _simulate, _swap_actions
+from esok.constants import USER_ERROR
+from esok.esok import esok
+from tests.fake_elasticsearch import FakeElasticsearch
+
+ALIAS_MAP = {
+    "products-v1": {"products"},
+    "products-v2": set(),
+    "users-v1": {"users", "people"},
+    "users-v2": set(),
+}
+
+
+def test_swap_actions_with_patterns():
+    actions = _swap_actions(ALIAS_MAP, "*", "*-v1", "*-v2")
+
+    assert actions == [
+        {"add": {"index": "products-v2", "alias": "products"}},
+        {"remove": {"index": "products-v1", "alias": "products"}},
+        {"add": {"index": "users-v2", "alias": "people"}},
+        {"remove": {"index": "users-v1", "alias": "people"}},
+        {"add": {"index": "users-v2", "alias": "users"}},
+        {"remove": {"index": "users-v1", "alias": "users"}},
+    ]
+    expected, errors = _simulate(ALIAS_MAP, actions)
+    assert errors == []
+    assert expected == {
+        "products-v1": set(),
+        "products-v2": {"products"},
+        "users-v1": set(),
+        "users-v2": {"users", "people"},
+    }
+
+
+def test_simulate_reports_failing_actions():
+    actions = [
+        {"add": {"index": "missing", "alias": "products"}},
+        {"remove": {"index": "products-v2", "alias": "products"}},
+    ]
+
+    _, errors = _simulate(ALIAS_MAP, actions)
+
+    assert errors == [
+        "No index matches missing.",
+        "Alias products does not point to products-v2.",
+    ]
+
+
+def test_alias_differences():
+    actions = [{"add": {"index": "products-v2", "alias": "products"}}]
+    expected, _ = _simulate(ALIAS_MAP, actions)
+
+    assert _alias_differences(expected, ALIAS_MAP, actions) == [
+        ("products", "products-v2", "added to")
+    ]
+
+
+def test_apply_in_one_request_per_site(test_app_dir, tmp_path):
+    actions_file = tmp_path / "aliases.yml"
+    actions_file.write_text(
+        "- add: {index: products-v2, alias: products}\n"
+        "- remove: {index: products-v1, alias: products}\n"
+        "- add: {indices: [users-v1, users-v2], alias: people}\n"
+    )
+    with FakeElasticsearch() as eu, FakeElasticsearch() as us:
+        for es in (eu, us):
+            for index in ("products-v1", "products-v2", "users-v1", "users-v2"):
+                es.add_documents(index, [])
+            es.aliases["products"] = {"products-v1"}
+        (test_app_dir / "esok.ini").write_text(
+            "[general]\ndefault_connection = some-cluster\n"
+            "[cluster:some-cluster]\neu = {}\nus = {}\n".format(eu.host, us.host)
+        )
+
+        result = CliRunner(mix_stderr=False).invoke(
+            esok, ["alias", "apply", str(actions_file)]
+        )
+
+        assert result.exit_code == 0
+        for es in (eu, us):
+            assert es.aliases == {
+                "products": {"products-v2"},
+                "people": {"users-v1", "users-v2"},
+            }
+            assert es.requests.count(("POST", "/_aliases")) == 1
+
+
+def test_apply_changes_nothing_if_an_action_would_fail(
+    fake_config_file, fake_es, tmp_path
+):
+    actions_file = tmp_path / "aliases.json"
+    actions_file.write_text(
+        '{"actions": [{"add": {"index": "products-v2", "alias": "products"}},'
+        ' {"remove": {"index": "products-v1", "alias": "products"}}]}'
+    )
+    fake_es.add_documents("products-v2", [])
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["alias", "apply", str(actions_file)]
+    )
+
+    assert result.exit_code == USER_ERROR
+    assert fake_es.aliases == dict()
+
+
+def test_swap_pattern_dry_run(fake_config_file, fake_es):
+    for index in ("a-v1", "a-v2", "b-v1", "b-v2"):
+        fake_es.add_documents(index, [])
+    fake_es.aliases.update(a={"a-v1"}, b={"b-v1"})
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["alias", "swap", "--dry-run", "*", "*-v1", "*-v2"]
+    )
+
+    assert result.exit_code == 0
+    assert [line.split() for line in result.stdout.splitlines()] == [
+        ["action", "alias", "index"],
+        ["add", "a", "a-v2"],
+        ["remove", "a", "a-v1"],
+        ["add", "b", "b-v2"],
+        ["remove", "b", "b-v1"],
+    ]
+    assert fake_es.aliases == dict(a={"a-v1"}, b={"b-v1"})
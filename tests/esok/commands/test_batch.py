@@ -0,0 +1,87 @@
+from click.testing import CliRunner
+
+from esok.constants import USER_ERROR
+from esok.esok import esok
+
+
+def _invoke(test_app_dir, content, *args):
+    batch_file = test_app_dir / "batch.yaml"
+    batch_file.write_text(content)
+    return CliRunner().invoke(esok, ["batch", str(batch_file)] + list(args))
+
+
+def test_batch_runs_steps(test_app_dir):
+    result = _invoke(
+        test_app_dir,
+        """
+        - name: first
+          command: config
+        - name: second
+          command: [config]
+          after: first
+        """,
+    )
+
+    assert result.exit_code == 0
+    assert result.output.count("Configuration file location") == 2
+    assert "2 steps in" in result.output
+
+
+def test_batch_accepts_json(test_app_dir):
+    result = _invoke(test_app_dir, '[{"command": "config"}, "config"]')
+
+    assert result.exit_code == 0
+    assert result.output.count("Configuration file location") == 2
+
+
+def test_batch_skips_steps_after_failed_step(test_app_dir):
+    result = _invoke(
+        test_app_dir,
+        """
+        - name: broken
+          command: nope
+        - name: dependent
+          command: config
+          after: [broken]
+        - name: transitive
+          command: config
+          after: [dependent]
+        """,
+    )
+
+    assert result.exit_code == USER_ERROR
+    assert "Configuration file location" not in result.output
+    lines = result.output.splitlines()
+    assert any(line.startswith("broken") and "failed" in line for line in lines)
+    assert any(line.startswith("dependent") and "skipped" in line for line in lines)
+    assert any(line.startswith("transitive") and "skipped" in line for line in lines)
+
+
+def test_batch_rejects_cycles(test_app_dir):
+    result = _invoke(
+        test_app_dir,
+        """
+        - {name: a, command: config, after: b}
+        - {name: b, command: config, after: a}
+        """,
+    )
+
+    assert result.exit_code == USER_ERROR
+    assert "cycle" in result.output
+    assert "Configuration file location" not in result.output
+
+
+def test_batch_rejects_unknown_dependencies(test_app_dir):
+    result = _invoke(test_app_dir, "- {name: a, command: config, after: b}")
+
+    assert result.exit_code == USER_ERROR
+    assert "unknown" in result.output
+
+
+def test_batch_rejects_duplicate_names(test_app_dir):
+    result = _invoke(
+        test_app_dir, "- {name: a, command: config}\n- {name: a, command: config}"
+    )
+
+    assert result.exit_code == USER_ERROR
+    assert "unique" in result.output
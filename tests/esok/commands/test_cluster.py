@@ -0,0 +1,96 @@
+import json
+
+from click.testing import CliRunner
+
+from esok.commands.cluster import _node_loads, _skew, _suggest_moves
+from esok.esok import esok
+
+
+def _shard(index, shard, node, store, prirep="p"):
+    return dict(
+        index=index, shard=shard, prirep=prirep, docs="1", store=str(store), node=node
+    )
+
+
+def test_suggest_moves_evens_out_bytes():
+    shards = [
+        _shard("a", "0", "n1", 100),
+        _shard("b", "0", "n1", 30),
+        _shard("c", "0", "n1", 30),
+        _shard("c", "0", "n2", 30, prirep="r"),
+    ]
+    nodes = _node_loads(["n1", "n2", "n3"], shards)
+
+    moves = _suggest_moves(nodes, shards, threshold=0.1, max_moves=10)
+
+    assert [(m["index"], m["from"], m["to"]) for m in moves] == [("a", "n1", "n3")]
+    assert _skew([n["bytes"] for n in nodes.values()]) == 160 / (190 / 3.0)
+
+
+def test_suggest_moves_never_doubles_a_shard_on_a_node():
+    shards = [_shard("a", "0", "n1", 40), _shard("a", "0", "n2", 40, prirep="r")]
+    shards += [_shard("c", "0", "n1", 30), _shard("d", "0", "n1", 30)]
+    nodes = _node_loads(["n1", "n2"], shards)
+
+    moves = _suggest_moves(nodes, shards, threshold=0.0, max_moves=10)
+
+    assert [(m["index"], m["from"], m["to"]) for m in moves] == [("c", "n1", "n2")]
+
+
+def test_hotspots_offline(fake_config_file, fake_es):
+    fake_es.data_nodes = 3
+    for name, docs in [("a", 50), ("b", 1), ("c", 1), ("d", 50)]:
+        fake_es.add_documents(name, [dict(n=n) for n in range(docs)])
+        fake_es.settings[name] = dict(number_of_shards=1, number_of_replicas=0)
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["cluster", "hotspots", "-i", "0", "-o", "json"]
+    )
+
+    assert result.exit_code == 0
+    report = json.loads(result.stdout)
+    assert [(n["node"], n["shards"], n["docs"]) for n in report["nodes"]] == [
+        ("node-0", 2, 100),
+        ("node-1", 1, 1),
+        ("node-2", 1, 1),
+    ]
+    assert report["skew"]["shards"] == 1.5
+    assert report["moves"] == [
+        dict(move=dict(index="a", shard=0, from_node="node-0", to_node="node-1")),
+        dict(move=dict(index="b", shard=0, from_node="node-1", to_node="node-2")),
+    ]
+
+
+def test_hotspots_follows_nodes_leaving_and_joining(test_app_dir, fake_es):
+    (test_app_dir / "esok.ini").write_text(
+        "[general]\ndefault_connection = {}\nmetadata_cache_ttl = 300\n".format(
+            fake_es.host
+        )
+    )
+    fake_es.data_nodes = 3
+    for name in ("a", "b", "c", "d"):
+        fake_es.add_documents(name, [dict(n=n) for n in range(10)])
+        fake_es.settings[name] = dict(number_of_shards=1, number_of_replicas=0)
+    runner = CliRunner(mix_stderr=False)
+
+    def _report():
+        result = runner.invoke(esok, ["cluster", "hotspots", "-i", "0", "-o", "json"])
+        assert result.exit_code == 0
+        return json.loads(result.stdout)
+
+    assert [n["node"] for n in _report()["nodes"]] == ["node-0", "node-1", "node-2"]
+
+    fake_es.data_nodes = 2
+    report = _report()
+    assert [n["node"] for n in report["nodes"]] == ["node-0", "node-1"]
+    assert report["skew"]["shards"] == 1.0
+    assert report["moves"] == []
+
+    fake_es.data_nodes = 4
+    report = _report()
+    assert [n["node"] for n in report["nodes"]] == [
+        "node-0",
+        "node-1",
+        "node-2",
+        "node-3",
+    ]
@@ -0,0 +1,497 @@
+import json
+import threading
+import time
+
+from click.testing import CliRunner
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import bulk
+
+from esok.commands.index import (
+    _concurrent_map,
+    _content_hash,
+    _merge_join,
+    _replica_plan,
+    _url_batches,
+)
+from esok.constants import UNKNOWN_ERROR, USER_ERROR
+from esok.esok import esok
+from tests.fake_elasticsearch import FakeElasticsearch
+
+
+def test_merge_join_identical():
+    docs = [("1", "a"), ("2", "b")]
+    assert list(_merge_join(docs, docs)) == []
+
+
+def test_merge_join_differences():
+    source = [("1", "a"), ("2", "b"), ("4", "d")]
+    target = [("2", "changed"), ("3", "c"), ("4", "d"), ("5", "e")]
+
+    differences = list(_merge_join(source, target))
+
+    assert differences == [
+        ("missing", "1"),
+        ("changed", "2"),
+        ("extra", "3"),
+        ("extra", "5"),
+    ]
+
+
+def test_diff_with_slices(fake_config_file, fake_es):
+    fake_es.add_documents("source", [{"n": n} for n in range(20)])
+    fake_es.indices["target"] = dict(fake_es.indices["source"])
+    del fake_es.indices["target"]["3"]
+    fake_es.indices["target"]["12"] = {"n": -1}
+    fake_es.indices["target"]["99"] = {"n": 99}
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["index", "diff", "-i", "3", "-c", "2", "source", "target"]
+    )
+
+    assert result.exit_code == UNKNOWN_ERROR
+    assert result.stdout.splitlines() == ["changed\t12", "missing\t3", "extra\t99"]
+    assert fake_es.requests.count(("GET", "/source/_search")) == 3
+
+
+def test_merge_join_empty_side():
+    docs = [("1", "a"), ("2", "b")]
+    assert list(_merge_join(docs, [])) == [("missing", "1"), ("missing", "2")]
+    assert list(_merge_join([], docs)) == [("extra", "1"), ("extra", "2")]
+
+
+def test_content_hash_ignores_key_order():
+    assert _content_hash({"a": 1, "b": 2}) == _content_hash({"b": 2, "a": 1})
+    assert _content_hash({"a": 1}) != _content_hash({"a": 2})
+
+
+def test_write_and_read_offline(fake_config_file, fake_es, tmp_path):
+    docs = tmp_path / "docs.json"
+    docs.write_text("".join('{"n": %d}\n' % n for n in range(25)))
+    runner = CliRunner(mix_stderr=False)
+
+    result = runner.invoke(esok, ["index", "write", "-i", "some-index", str(docs)])
+    assert result.exit_code == 0
+    assert len(fake_es.indices["some-index"]) == 25
+
+    result = runner.invoke(esok, ["index", "read", "-c", "10", "some-index"])
+    assert result.exit_code == 0
+    read = [json.loads(line)["_source"] for line in result.stdout.splitlines()]
+    assert sorted(doc["n"] for doc in read) == list(range(25))
+
+
+def test_write_rejected_offline(fake_config_file, fake_es, tmp_path):
+    fake_es.reject_rate = 1.0
+    docs = tmp_path / "docs.json"
+    docs.write_text('{"n": 1}\n')
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["index", "write", "-i", "some-index", str(docs)]
+    )
+
+    assert result.exit_code == UNKNOWN_ERROR
+    assert "some-index" not in fake_es.indices
+
+
+def test_list_merges_sites(test_app_dir):
+    with FakeElasticsearch() as eu, FakeElasticsearch() as us:
+        eu.add_documents("b-index", [{"n": n} for n in range(3)])
+        us.add_documents("a-index", [{"n": 1}])
+        us.add_documents("c-index", [{"n": n} for n in range(1000)])
+        us.health["a-index"] = "yellow"
+        (test_app_dir / "esok.ini").write_text(
+            "[general]\ndefault_connection = some-cluster\n"
+            "[cluster:some-cluster]\neu = {}\nus = {}\n".format(eu.host, us.host)
+        )
+        runner = CliRunner(mix_stderr=False)
+
+        result = runner.invoke(esok, ["index", "list", "--columns", "index,docs.count"])
+        assert result.exit_code == 0
+        assert result.stdout.splitlines() == [
+            "site index   docs.count",
+            "us   a-index 1",
+            "eu   b-index 3",
+            "us   c-index 1000",
+        ]
+
+        for sort in ("docs.count:desc", "dc:desc"):
+            result = runner.invoke(esok, ["index", "list", "-s", sort])
+            assert [line.split()[3] for line in result.stdout.splitlines()[1:]] == [
+                "c-index",
+                "b-index",
+                "a-index",
+            ]
+
+        result = runner.invoke(esok, ["index", "list", "--health", "yellow"])
+        assert len(result.stdout.splitlines()) == 2
+        assert "a-index" in result.stdout
+
+        result = runner.invoke(esok, ["index", "list", "--min-size", "1kb", "*-index"])
+        assert len(result.stdout.splitlines()) == 2
+        assert "c-index" in result.stdout
+        assert "kb" in result.stdout
+
+
+def test_stats_summary_without_interval(fake_config_file, fake_es, monkeypatch):
+    fake_es.add_documents("some-index", [{"n": 1}])
+    sleeps = list()
+    monkeypatch.setattr("esok.commands.index.time.sleep", sleeps.append)
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["index", "stats", "--summary", "some-index"]
+    )
+
+    assert result.exit_code == 0
+    assert result.stdout.splitlines()[0].split() == ["indices", "docs", "size"]
+    assert not any(sleeps), "Rates should not be sampled by default."
+
+
+def test_stats_prints_response_before_failing(fake_config_file, monkeypatch):
+    response = {"indices": {}}
+    monkeypatch.setattr(
+        "elasticsearch.client.IndicesClient.stats", lambda *args, **kwargs: response
+    )
+
+    result = CliRunner(mix_stderr=False).invoke(esok, ["index", "stats", "a-*"])
+
+    assert result.exit_code == UNKNOWN_ERROR
+    assert json.loads(result.stdout) == response
+
+
+def test_stats_filter_path(fake_config_file, fake_es):
+    fake_es.add_documents("some-index", [{"n": 1}])
+
+    runner = CliRunner(mix_stderr=False)
+    expected = {"indices": {"some-index": {"total": {"docs": {"count": 1}}}}}
+
+    result = runner.invoke(
+        esok, ["-F", "indices.*.total.docs.count", "index", "stats", "some-index"]
+    )
+    assert result.exit_code == 0
+    assert json.loads(result.stdout) == expected
+
+
+def test_stats_summary(fake_config_file, fake_es, monkeypatch):
+    fake_es.add_documents("small-index", [{"n": 1}])
+    fake_es.add_documents("big-index", [{"n": n} for n in range(100)])
+    client = Elasticsearch(fake_es.host)
+
+    def _search_while_sleeping(seconds):
+        for _ in range(int(seconds)):
+            client.search(index="small-index")
+
+    monkeypatch.setattr("esok.commands.index.time.sleep", _search_while_sleeping)
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["index", "stats", "--summary", "-n", "1", "-i", "4", "*-index"]
+    )
+
+    assert result.exit_code == 0
+    rows = [line.split() for line in result.stdout.splitlines()]
+    assert rows[0] == ["indices", "docs", "size", "indexing/s", "search/s"]
+    assert rows[1][:2] == ["2", "101"]
+    assert rows[1][3:] == ["0.0", "1.0"]
+    assert rows[3:6] == [
+        ["Top", "1", "by", "docs:"],
+        ["index", "docs", "size", "indexing/s", "search/s"],
+        ["big-index", "100", rows[5][2], "0.0", "0.0"],
+    ]
+    assert rows[-3:] == [
+        ["Top", "1", "by", "search/s:"],
+        ["index", "docs", "size", "indexing/s", "search/s"],
+        ["small-index", "1", rows[-1][2], "0.0", "1.0"],
+    ]
+
+
+def test_stats_watch(fake_config_file, fake_es, monkeypatch, tmp_path):
+    fake_es.add_documents("some-index", [{"n": 1}])
+    fake_es.add_documents("other-index", [{"n": 1}])
+    client = Elasticsearch(fake_es.host)
+
+    clock = [0.0]
+
+    def _index_while_sleeping(seconds):
+        # The client sleeps for 0 seconds before every request.
+        if seconds:
+            clock[0] += seconds
+            bulk(client, [{"_index": "some-index", "_type": "_doc"}] * 8)
+
+    monkeypatch.setattr("esok.commands.index.time.sleep", _index_while_sleeping)
+    monkeypatch.setattr("esok.commands.index.time.monotonic", lambda: clock[0])
+    csv_file = tmp_path / "rates.csv"
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok,
+        ["index", "stats", "-w", "-i", "4", "--count", "2", "--csv", str(csv_file)]
+        + ["*-index"],
+    )
+
+    assert result.exit_code == 0
+    tables = [line.split() for line in result.stdout.splitlines()]
+    assert tables[1:5] == [
+        ["index", "index/s", "query/s", "merge%", "refresh%"],
+        ["_all", "2.0", "0.0", "0.0", "0.0"],
+        ["some-index", "2.0", "0.0", "0.0", "0.0"],
+        ["other-index", "0.0", "0.0", "0.0", "0.0"],
+    ]
+    assert len(tables) == 11
+    rows = csv_file.read_text().splitlines()
+    assert rows[0] == "timestamp,site,index,index/s,query/s,merge%,refresh%"
+    assert rows[1].endswith(",,_all,2.0,0.0,0.0,0.0")
+    assert len(rows) == 7
+
+
+def test_replica_plan():
+    assert _replica_plan("i", 2, 1, 3, 4) == ("i", 2, 1, 5.0, 5)
+    assert _replica_plan("i", 3, 1, 2, 4) == ("i", 3, 1, 5 / 3.0, 1)
+    assert _replica_plan("i", 5, 1, 1, 2) == ("i", 5, 1, 0.0, 0)
+    assert _replica_plan("i", 5, 1, 2, None) == ("i", 5, 1, 2.0, 2)
+
+
+def test_url_batches(monkeypatch):
+    monkeypatch.setattr("esok.commands.index.MAX_URL_INDICES_LENGTH", 10)
+    assert list(_url_batches(["abc", "def", "ghi", "jklmnopqrstu"])) == [
+        ["abc", "def"],
+        ["ghi"],
+        ["jklmnopqrstu"],
+    ]
+
+
+def test_shards_plan_is_applied_in_batches(fake_config_file, fake_es):
+    fake_es.data_nodes = 3
+    for name, shards in [("a-index", 1), ("b-index", 1), ("c-index", 3), ("d", 1)]:
+        fake_es.indices[name] = dict()
+        fake_es.settings[name] = dict(number_of_shards=shards, number_of_replicas=1)
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["index", "shards", "-y", "*-index", "1"]
+    )
+
+    assert result.exit_code == 0
+    assert [line.split() for line in result.stdout.splitlines()] == [
+        ["index", "pri", "rep", "new", "rep", "note"],
+        ["a-index", "1", "1", "2"],
+        ["b-index", "1", "1", "2"],
+        ["c-index", "3", "1", "0"],
+        "Changed the replica count of 3 indices in 2 requests.".split(),
+    ]
+    replicas = {n: s["number_of_replicas"] for n, s in fake_es.settings.items()}
+    assert replicas == {"a-index": 2, "b-index": 2, "c-index": 0, "d": 1}
+
+
+def test_shards_dry_run(fake_config_file, fake_es):
+    fake_es.indices["some-index"] = dict()
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["index", "shards", "--dry-run", "-a", "some-index", "0"]
+    )
+
+    assert result.exit_code == 0
+    assert "some-index 5   1   0" in result.stdout
+    assert "some-index" not in fake_es.settings
+
+
+def test_forcemerge_reports_segments(fake_config_file, fake_es):
+    fake_es.add_documents("a-index", [{"n": n} for n in range(6)])
+    fake_es.add_documents("b-index", [{"n": n} for n in range(4)])
+    fake_es.add_documents("other", [{"n": 1}])
+    for name in ("a-index", "b-index", "other"):
+        fake_es.settings[name] = dict(number_of_shards=2, number_of_replicas=0)
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["index", "forcemerge", "-m", "1", "*-index"]
+    )
+
+    assert result.exit_code == 0
+    rows = [line.split() for line in result.stdout.splitlines()]
+    assert rows[:4] == [
+        ["a-index:", "done"],
+        ["b-index:", "done"],
+        [],
+        ["index", "segments", "new", "segments", "seconds", "status"],
+    ]
+    assert [row[:3] + row[4:] for row in rows[4:]] == [
+        ["a-index", "6", "2", "ok"],
+        ["b-index", "4", "2", "ok"],
+    ]
+    assert fake_es.merged == {"a-index": 1, "b-index": 1}
+
+
+def test_shrink_and_split(fake_config_file, fake_es):
+    fake_es.add_documents("some-index", [{"n": n} for n in range(4)])
+    fake_es.settings["some-index"] = dict(number_of_shards=4, number_of_replicas=0)
+    runner = CliRunner(mix_stderr=False)
+
+    result = runner.invoke(esok, ["index", "shrink", "-y", "-s", "2", "some-index"])
+
+    assert result.exit_code == 0
+    row = result.stdout.splitlines()[-1].split()
+    assert row[:4] + row[5:] == ["some-index", "some-index-shrunk", "4", "4", "ok"]
+    assert fake_es.settings["some-index"] == dict(
+        number_of_shards=4, number_of_replicas=0, **{"blocks.write": True}
+    )
+    assert fake_es.settings["some-index-shrunk"] == dict(
+        number_of_shards=2, number_of_replicas=0
+    )
+
+    result = runner.invoke(esok, ["index", "split", "-y", "some-index-shrunk", "6"])
+
+    assert result.exit_code == 0
+    assert fake_es.settings["some-index-shrunk-split"]["number_of_shards"] == 6
+    assert len(fake_es.indices["some-index-shrunk-split"]) == 4
+
+
+def test_shrink_failure_releases_source(fake_config_file, fake_es):
+    fake_es.data_nodes = 2
+    fake_es.add_documents("some-index", [{"n": n} for n in range(4)])
+    fake_es.settings["some-index"] = dict(number_of_shards=2, number_of_replicas=0)
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["index", "shrink", "-y", "--node", "node-0", "some-index"]
+    )
+
+    assert result.exit_code == UNKNOWN_ERROR
+    assert "routing.allocation.require._name" not in fake_es.settings["some-index"]
+    assert "some-index-shrunk" not in fake_es.indices
+
+
+def test_shrink_red_index_fails(fake_config_file, fake_es):
+    fake_es.data_nodes = 0
+    fake_es.add_documents("some-index", [{"n": 1}])
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["index", "shrink", "-y", "some-index"]
+    )
+
+    assert result.exit_code == UNKNOWN_ERROR
+    assert result.stdout.splitlines()[-1].split()[-1] == "failed"
+    assert ("PUT", "/some-index/_settings") not in fake_es.requests
+
+
+def test_split_without_acknowledged_write_block_fails(
+    fake_config_file, fake_es, monkeypatch
+):
+    fake_es.add_documents("some-index", [{"n": 1}])
+    monkeypatch.setattr(
+        "elasticsearch.client.IndicesClient.put_settings",
+        lambda *args, **kwargs: {"acknowledged": False},
+    )
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["index", "split", "-y", "some-index", "2"]
+    )
+
+    assert result.exit_code == UNKNOWN_ERROR
+    assert "some-index-split" not in fake_es.indices
+
+
+def test_forcemerge_without_matching_indices(fake_config_file, fake_es):
+    result = CliRunner(mix_stderr=False).invoke(esok, ["index", "forcemerge", "a-*"])
+
+    assert result.exit_code == USER_ERROR
+
+
+def test_split_failure_exits(fake_config_file, fake_es):
+    for name in ("some-index", "some-index-split"):
+        fake_es.add_documents(name, [{"n": 1}])
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["index", "split", "-y", "some-index", "2"]
+    )
+
+    assert result.exit_code == UNKNOWN_ERROR
+    assert result.stdout.splitlines()[-1].split()[-1] == "failed"
+
+
+def test_delete_by_query(fake_config_file, fake_es, tmp_path):
+    fake_es.add_documents("some-index", [{"n": n % 2} for n in range(10)])
+    query_file = tmp_path / "query.json"
+    query_file.write_text('{"query": {"term": {"n": 1}}}')
+    runner = CliRunner(mix_stderr=False)
+
+    result = runner.invoke(
+        esok,
+        ["index", "delete-by-query", "-r", "100", "some-index", str(query_file)],
+    )
+
+    assert result.exit_code == 0
+    task_id = result.stdout.split()[-1]
+    assert fake_es.tasks[task_id]["task"]["status"]["requests_per_second"] == 100
+    assert sorted(doc["n"] for doc in fake_es.indices["some-index"].values()) == [0] * 5
+
+    result = runner.invoke(esok, ["reindex", "progress", task_id])
+    assert result.stdout == "100.0%\n"
+
+
+def test_delete_by_query_requires_query(fake_config_file, fake_es, tmp_path):
+    query_file = tmp_path / "query.json"
+    query_file.write_text("{}")
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["index", "delete-by-query", "some-index", str(query_file)]
+    )
+
+    assert result.exit_code == USER_ERROR
+
+
+def test_update_by_query_wait(fake_config_file, fake_es):
+    fake_es.add_documents("some-index", [{"n": n} for n in range(3)])
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["index", "update-by-query", "--wait", "-p", "0", "some-index"]
+    )
+
+    assert result.exit_code == 0
+    assert json.loads(result.stdout)["updated"] == 3
+
+
+def test_mget_in_input_order(fake_config_file, fake_es, tmp_path):
+    fake_es.add_documents("some-index", [{"n": n} for n in range(10)])
+    ids_file = tmp_path / "ids.txt"
+    ids_file.write_text('7\n3\n\nmissing\n{"_id": "5"}\n')
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["index", "mget", "-c", "2", "-m", "2", "some-index", str(ids_file)]
+    )
+
+    assert result.exit_code == 0
+    docs = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [(doc["_id"], doc["_source"]["n"]) for doc in docs] == [
+        ("7", 7),
+        ("3", 3),
+        ("5", 5),
+    ]
+    assert result.stderr == "1 documents were not found.\n"
+    assert fake_es.requests.count(("GET", "/some-index/_mget")) == 2
+
+
+def test_mget_reports_errors(fake_config_file, fake_es, tmp_path):
+    fake_es.add_documents("some-index", [{"n": n} for n in range(3)])
+    ids_file = tmp_path / "ids.txt"
+    ids_file.write_text('1\n{"_id": "2", "_index": "missing-index"}\n')
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok, ["index", "mget", "some-index", str(ids_file)]
+    )
+
+    assert result.exit_code == UNKNOWN_ERROR
+    assert [json.loads(line)["_id"] for line in result.stdout.splitlines()] == ["1"]
+    assert "not found" not in result.stderr
+
+
+def test_concurrent_map_bounds_running_calls():
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def _f(item):
+        with lock:
+            running.append(item)
+            peak.append(len(running))
+        time.sleep(0.01 * (5 - item))
+        with lock:
+            running.remove(item)
+        return item
+
+    assert list(_concurrent_map(_f, range(5), 2)) == [0, 1, 2, 3, 4]
+    assert max(peak) == 2
+    assert sorted(_concurrent_map(_f, range(5), 3, ordered=False)) == [0, 1, 2, 3, 4]
+    assert max(peak) == 3
@@ -0,0 +1,25 @@
+import json
+
+from click.testing import CliRunner
+
+from esok.esok import esok
+
+
+def test_batch_creates_a_shared_target_once(fake_config_file, fake_es, tmp_path):
+    fake_es.add_documents("logs-1", [{"n": n} for n in range(3)])
+    fake_es.add_documents("logs-2", [{"n": n} for n in range(2)])
+    mapping_file = tmp_path / "pairs.json"
+    mapping_file.write_text(json.dumps({"logs-1": "logs", "logs-2": "logs"}))
+    state_file = tmp_path / "state.json"
+
+    result = CliRunner(mix_stderr=False).invoke(
+        esok,
+        ["reindex", "batch", "-f", str(mapping_file), "-S", str(state_file)]
+        + ["-y", "-p", "0"],
+    )
+
+    assert result.exit_code == 0
+    assert fake_es.requests.count(("PUT", "/logs")) == 1
+    assert len(fake_es.indices["logs"]) == 5
+    (tasks,) = json.loads(state_file.read_text()).values()
+    assert {task["status"] for task in tasks.values()} == {"done"}
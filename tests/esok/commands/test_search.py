@@ -0,0 +1,137 @@
+import copy
+import json
+
+from click.testing import CliRunner
+
+from esok.commands.search import _ranges
+from esok.constants import USER_ERROR
+from esok.esok import esok
+
+COMPOSITE = {
+    "size": 0,
+    "aggs": {
+        "per_day": {
+            "composite": {
+                "sources": [
+                    {"day": {"terms": {"field": "day"}}},
+                    {"user": {"terms": {"field": "user"}}},
+                ]
+            }
+        }
+    },
+}
+
+
+def _search(args, body):
+    return CliRunner(mix_stderr=False).invoke(
+        esok, ["search"] + args + ["logs", "-"], input=json.dumps(body)
+    )
+
+
+def _fill_logs(fake_es):
+    fake_es.add_documents(
+        "logs", [dict(day=day, user=user) for day in range(10) for user in "ab"]
+    )
+
+
+def test_ranges():
+    assert _ranges(0, 10, 3) == [(0, 3), (3, 6), (6, 10)]
+    assert _ranges(0, 2, 4) == [(0, 1), (1, 2)]
+    assert _ranges(5, 5, 2) == [(5, 5)]
+    assert _ranges(0.0, 1.5, 2) == [(0.0, 0.75), (0.75, 1.5)]
+
+
+def test_search_hits_with_limit(fake_config_file, fake_es):
+    _fill_logs(fake_es)
+
+    result = _search(
+        ["-c", "3", "-n", "7"], {"query": {"term": {"user": "a"}}, "sort": ["_doc"]}
+    )
+
+    assert result.exit_code == 0
+    hits = [json.loads(line) for line in result.stdout.splitlines()]
+    assert len(hits) == 7
+    assert {hit["_source"]["user"] for hit in hits} == {"a"}
+
+
+def test_search_follows_composite_pages(fake_config_file, fake_es):
+    _fill_logs(fake_es)
+
+    result = _search(["-c", "3"], COMPOSITE)
+
+    assert result.exit_code == 0
+    buckets = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [bucket["key"] for bucket in buckets] == [
+        dict(day=day, user=user) for day in range(10) for user in "ab"
+    ]
+    assert {bucket["doc_count"] for bucket in buckets} == {1}
+    assert fake_es.requests.count(("GET", "/logs/_search")) == 8
+
+
+def test_search_partitions(fake_config_file, fake_es):
+    _fill_logs(fake_es)
+
+    buckets = _search(["-P", "3", "-c", "2"], COMPOSITE)
+    hits = _search(["-P", "3"], {"query": {"match_all": {}}})
+
+    assert buckets.exit_code == 0
+    keys = [json.loads(line)["key"] for line in buckets.stdout.splitlines()]
+    assert sorted(keys, key=lambda k: (k["day"], k["user"])) == [
+        dict(day=day, user=user) for day in range(10) for user in "ab"
+    ]
+    assert hits.exit_code == 0
+    ids = [json.loads(line)["_id"] for line in hits.stdout.splitlines()]
+    assert sorted(ids, key=int) == sorted(fake_es.indices["logs"], key=int)
+
+
+def test_search_other_aggregations(fake_config_file, fake_es):
+    _fill_logs(fake_es)
+
+    result = _search([], {"aggs": {"last": {"max": {"field": "day"}}}})
+
+    assert result.exit_code == 0
+    assert json.loads(result.stdout) == {"last": {"value": 9}}
+
+
+def test_search_histogram_buckets(fake_config_file, fake_es):
+    _fill_logs(fake_es)
+    body = copy.deepcopy(COMPOSITE)
+    body["aggs"]["per_day"]["composite"]["sources"] = [
+        {"days": {"histogram": {"field": "day", "interval": 4}}}
+    ]
+
+    result = _search(["-c", "2"], body)
+    partitioned = _search(["-P", "2"], body)
+
+    assert result.exit_code == 0
+    assert [json.loads(line) for line in result.stdout.splitlines()] == [
+        dict(key=dict(days=0), doc_count=8),
+        dict(key=dict(days=4), doc_count=8),
+        dict(key=dict(days=8), doc_count=4),
+    ]
+    # A bucket straddling two partitions would be printed twice.
+    assert partitioned.exit_code == USER_ERROR
+    assert partitioned.stdout == ""
+
+
+def test_search_refuses_partitions_with_missing_bucket(fake_config_file, fake_es):
+    _fill_logs(fake_es)
+    body = copy.deepcopy(COMPOSITE)
+    body["aggs"]["per_day"]["composite"]["sources"][0]["day"]["terms"][
+        "missing_bucket"
+    ] = True
+
+    result = _search(["-P", "2"], body)
+
+    assert result.exit_code == USER_ERROR
+
+
+def test_search_refuses_unpaged_composite(fake_config_file, fake_es):
+    _fill_logs(fake_es)
+    body = copy.deepcopy(COMPOSITE)
+    body["aggs"]["last"] = {"max": {"field": "day"}}
+
+    result = _search([], body)
+
+    assert result.exit_code == USER_ERROR
+    assert fake_es.requests.count(("GET", "/logs/_search")) == 0
@@ -0,0 +1,37 @@
+from click.testing import CliRunner
+
+from esok.constants import USER_ERROR
+from esok.esok import esok
+
+
+def test_shell_runs_commands(test_app_dir):
+    runner = CliRunner()
+    result = runner.invoke(esok, ["shell"], input="config\n\n# comment\nconfig\n")
+
+    assert result.exit_code == 0
+    assert result.output.count("Configuration file location") == 2
+
+
+def test_shell_continues_after_failed_command(test_app_dir):
+    runner = CliRunner()
+    result = runner.invoke(esok, ["shell"], input="nope\n'unbalanced\nconfig\n")
+
+    assert result.exit_code == USER_ERROR
+    assert "No such command" in result.output
+    assert "Configuration file location" in result.output
+
+
+def test_shell_exit_on_error(test_app_dir):
+    runner = CliRunner()
+    result = runner.invoke(esok, ["shell", "-x"], input="nope\nconfig\n")
+
+    assert result.exit_code != 0
+    assert "Configuration file location" not in result.output
+
+
+def test_shell_exit_command(test_app_dir):
+    runner = CliRunner()
+    result = runner.invoke(esok, ["shell"], input="exit\nconfig\n")
+
+    assert result.exit_code == 0
+    assert "Configuration file location" not in result.output
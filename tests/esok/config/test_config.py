@@ -12,6 +12,8 @@ def test_config_defaults(user_config_file, caplog):
     assert config["cluster_hostname_pattern"] is None
     assert config["cluster_pattern_default_sites"] is None
     assert "connections" in config
+    assert config["metadata_cache_ttl"] == 300
+    assert config["metadata_cache_ttls"] == dict()
 
     assert str(user_config_file) in caplog.text
 
@@ -43,3 +45,17 @@ def test_config_with_cluster_section(user_config_file, test_app_dir):
     assert (
         cluster.get("site3") == "backup.example.com"
     ), "Cluster/site definition should be included"
+
+
+def test_config_with_metadata_cache_ttls(user_config_file):
+    user_config_file.write_text(
+        """
+    [metadata_cache_ttl]
+    some-cluster = 3600
+    localhost = 0
+    """
+    )
+
+    config = read_config_files(str(user_config_file), DEFAULT_CONFIG)
+
+    assert config["metadata_cache_ttls"] == {"some-cluster": 3600, "localhost": 0}
@@ -1,7 +1,16 @@
+from unittest import mock
+
 import click
 import pytest
 
-from esok.config.connection_options import per_connection
+from esok.config.connection_options import (
+    ACKNOWLEDGED,
+    ClientPool,
+    per_connection,
+    resolve_remote,
+    response_filter,
+    set_response_filter,
+)
 from esok.constants import CLI_ERROR, CONFIGURATION_ERROR, USER_ERROR
 from esok.esok import esok
 
@@ -506,6 +515,97 @@ def test_timeout(runner):
     assert kwargs["timeout"] == timeout
 
 
+@pytest.mark.usefixtures("mock_clients")
+def test_resolve_remote_without_configured_cluster(runner):
+    remotes = list()
+
+    @esok.command()
+    @per_connection(include_site=True)
+    def remote_sub(client, site):
+        remotes.append(resolve_remote("remote-host", site)[1]["hosts"][0])
+
+    r = runner.invoke(esok, ["remote-sub"])
+
+    assert r.exit_code == 0, "The command should succeed."
+    assert remotes == ["remote-host"], "Remote should be used as hostname directly."
+
+
+@pytest.mark.usefixtures("mock_clients")
+def test_resolve_remote_with_configured_cluster(user_config_file, runner):
+    user_config_file.write_text(
+        """
+        [cluster:awesome-cluster]
+        eu = 192.168.0.1
+        """
+    )
+    remotes = list()
+
+    @esok.command()
+    @per_connection(include_site=True)
+    def remote_sub(client, site):
+        remotes.append(resolve_remote("awesome-cluster", site)[1]["hosts"][0])
+
+    r = runner.invoke(esok, ["-H", "some-host", "remote-sub"])
+
+    assert r.exit_code == 0, "The command should succeed."
+    assert remotes == ["192.168.0.1"], "Remote should resolve to configured cluster."
+
+
+@pytest.mark.usefixtures("mock_clients")
+def test_trace(user_config_file, runner):
+    user_config_file.write_text(
+        """
+        [cluster:awesome-cluster]
+        eu = 192.168.0.1
+        """
+    )
+    clients, command = _attach_sub_command(esok, hostname_only=False)
+
+    r = runner.invoke(esok, ["--trace", "-c", "awesome-cluster", command])
+    assert r.exit_code == 0
+
+    _, kwargs = clients[0]
+    assert kwargs["connection_class"].__name__ == "InstrumentedConnection"
+    [tracer] = kwargs["listeners"]
+    assert (tracer.cluster, tracer.site) == ("awesome-cluster", "eu")
+
+
+def test_client_pool_reuses_clients():
+    pool = ClientPool()
+    created = list()
+
+    def create():
+        created.append(mock.Mock())
+        return created[-1]
+
+    assert pool.get(("host", 10), create) is pool.get(("host", 10), create)
+    assert pool.get(("host", 5), create) is not created[0]
+    assert len(created) == 2
+
+    pool.close()
+    assert all(client.transport.close.called for client in created)
+
+
+def test_shell_reuses_clients_and_password(monkeypatch, runner):
+    monkeypatch.setattr(
+        "elasticsearch.Elasticsearch",
+        lambda *args, **kwargs: mock.Mock(kwargs=kwargs),
+    )
+    clients, command = _attach_sub_command(esok, hostname_only=False)
+
+    r = runner.invoke(
+        esok,
+        ["-u", "user", "shell"],
+        input="secret\n{0}\n{0}\n-H other {0}\n".format(command),
+    )
+
+    assert r.exit_code == 0, "The command should succeed."
+    assert r.output.count("Password") == 1, "Password should be prompted once."
+    assert clients[0] is clients[1], "Client should be reused in a session."
+    assert clients[2] is not clients[0]
+    assert clients[2].kwargs["http_auth"] == ("user", "secret")
+
+
 def _attach_sub_command(root_command, hostname_only=True):
     clients = list()
 
@@ -523,10 +623,24 @@ def _attach_sub_command(root_command, hostname_only=True):
 @pytest.fixture()
 def mock_clients(monkeypatch):
     monkeypatch.setattr(
-        "esok.config.connection_options.Elasticsearch",
+        "elasticsearch.Elasticsearch",
         lambda *args, **kwargs: (args, kwargs),
     )
     monkeypatch.setattr(
-        "esok.config.connection_options.create_default_context",
+        "ssl.create_default_context",
         lambda *args, cafile, **kwargs: cafile,
     )
+
+
+def test_response_filter():
+    with click.Context(click.Command("esok")) as ctx:
+        assert response_filter() is None
+        assert response_filter(ACKNOWLEDGED) == "acknowledged"
+        assert response_filter("completed", default="response") == "response,completed"
+
+        set_response_filter(ctx, "*.settings")
+        assert response_filter() == "*.settings"
+        assert response_filter(ACKNOWLEDGED) == "*.settings,acknowledged"
+        assert response_filter("completed", default="response") == (
+            "*.settings,completed"
+        )
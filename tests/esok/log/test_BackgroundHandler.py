@@ -0,0 +1,72 @@
+import logging
+import threading
+import time
+
+from esok.log.BackgroundHandler import BackgroundHandler
+
+
+class BlockingHandler(logging.Handler):
+    def __init__(self):
+        super(BlockingHandler, self).__init__()
+        self.records = []
+        self.started = threading.Event()
+        self.released = threading.Event()
+
+    def emit(self, record):
+        self.started.set()
+        self.released.wait(5)
+        self.records.append(record)
+
+
+def test_records_are_passed_on():
+    target = BlockingHandler()
+    target.released.set()
+    handler = BackgroundHandler([target])
+
+    handler.handle(make_record("message %s", "arg"))
+    handler.close()
+
+    assert [r.getMessage() for r in target.records] == ["message arg"]
+
+
+def test_handler_level_is_respected():
+    target = BlockingHandler()
+    target.released.set()
+    target.setLevel(logging.WARNING)
+    handler = BackgroundHandler([target])
+
+    handler.handle(make_record("info", level=logging.INFO))
+    handler.handle(make_record("warning", level=logging.WARNING))
+    handler.close()
+
+    assert [r.getMessage() for r in target.records] == ["warning"]
+
+
+def test_records_are_dropped_and_counted_when_queue_is_full():
+    target = BlockingHandler()
+    handler = BackgroundHandler([target], queue_size=1)
+
+    handler.handle(make_record("first"))
+    assert target.started.wait(5), "Listener should be handling the first record."
+    handler.handle(make_record("second"))  # Fills the queue
+    handler.handle(make_record("dropped"))
+    handler.handle(make_record("dropped"))
+    assert handler.dropped == 2
+
+    target.released.set()
+    while not handler.queue.empty():
+        time.sleep(0.01)
+    handler.handle(make_record("last"))
+    handler.close()
+
+    assert [r.getMessage() for r in target.records] == [
+        "first",
+        "second",
+        "2 log records were dropped, as logging could not keep up.",
+        "last",
+    ]
+    assert handler.dropped == 0
+
+
+def make_record(msg, *args, level=logging.INFO):
+    return logging.LogRecord("esok.test", level, __file__, 0, msg, args, None)
@@ -0,0 +1,64 @@
+import click
+from elasticsearch import Elasticsearch
+
+from esok.cache import MetadataCache, metadata_cache
+
+
+def test_get_fetches_missing_value(tmp_path):
+    cache = MetadataCache(str(tmp_path / "cache.json"), "some-host", 60)
+    assert cache.get("key", lambda: "value") == "value"
+
+
+def test_get_uses_cached_value(tmp_path):
+    cache = MetadataCache(str(tmp_path / "cache.json"), "some-host", 60)
+    cache.get("key", lambda: "value")
+
+    assert cache.get("key", lambda: "other value") == "value"
+
+
+def test_get_refetches_expired_value(tmp_path, monkeypatch):
+    cache = MetadataCache(str(tmp_path / "cache.json"), "some-host", 60)
+    monkeypatch.setattr("esok.cache.time.time", lambda: 1000.0)
+    cache.get("key", lambda: "value")
+
+    monkeypatch.setattr("esok.cache.time.time", lambda: 1061.0)
+    assert cache.get("key", lambda: "other value") == "other value"
+
+
+def test_get_with_disabled_cache(tmp_path):
+    cache_file = tmp_path / "cache.json"
+    cache = MetadataCache(str(cache_file), "some-host", 0)
+    cache.get("key", lambda: "value")
+
+    assert cache.get("key", lambda: "other value") == "other value"
+    assert not cache_file.exists(), "Nothing should be written when disabled."
+
+
+def test_cache_is_kept_per_host(tmp_path):
+    cache_file = str(tmp_path / "cache.json")
+    MetadataCache(cache_file, "some-host", 60).get("key", lambda: "value")
+
+    other = MetadataCache(cache_file, "other-host", 60)
+    assert other.get("key", lambda: "other value") == "other value"
+
+
+def test_invalidate(tmp_path):
+    cache_file = str(tmp_path / "cache.json")
+    cache = MetadataCache(cache_file, "some-host", 60)
+    other = MetadataCache(cache_file, "other-host", 60)
+    cache.get("key", lambda: "value")
+    other.get("key", lambda: "value")
+
+    cache.invalidate()
+
+    assert cache.get("key", lambda: "new value") == "new value"
+    assert other.get("key", lambda: "new value") == "value"
+
+
+def test_metadata_cache_uses_ttl_of_hostname(tmp_path):
+    config = dict(metadata_cache_ttl=300, metadata_cache_ttls=dict(localhost=0))
+    obj = dict(config=config, app_dir=str(tmp_path))
+
+    with click.Context(click.Command("some-command"), obj=obj):
+        assert metadata_cache(Elasticsearch("localhost:9200")).ttl == 0
+        assert metadata_cache(Elasticsearch("other-host:9200")).ttl == 300
@@ -1,9 +1,14 @@
+import json
+import logging
 from getpass import getuser
 
 import pytest
+from click.testing import CliRunner
 
 from esok.constants import APP_CONFIG_BASENAME, DEFAULT_CONFIG
-from esok.init import app_init
+from esok.esok import esok
+from esok.init import INIT_CACHE_BASENAME, app_init
+from esok.log.BackgroundHandler import BackgroundHandler
 
 LOGS_DIR = "logs"
 
@@ -59,9 +64,68 @@ def test_init_logging(tmpdir):
     logs = tmpdir.mkdir(LOGS_DIR)
 
     app_init(str(tmpdir))
+    assert not logs.join("all.log").check(), u"Log files should be opened lazily."
 
-    assert len(logs.listdir()) == 4
+    logger = logging.getLogger("esok")
+    logger.info("info")
+    logger.warning("warning")
+    logger.error("error")
+    logging.shutdown()
+
+    assert len(logs.listdir(lambda p: p.ext == ".log")) == 4
     assert logs.join("info.log").check()
     assert logs.join("warning.log").check()
     assert logs.join("error.log").check()
     assert logs.join("all.log").check()
+
+
+def test_init_logging_in_background(tmpdir):
+    app_init(str(tmpdir))
+
+    for logger in (logging.getLogger(), logging.getLogger("esok")):
+        assert len(logger.handlers) == 1
+        assert isinstance(logger.handlers[0], BackgroundHandler)
+
+
+def test_init_cache_is_written(tmpdir):
+    app_init(str(tmpdir))
+
+    cache = json.loads(tmpdir.join(LOGS_DIR, INIT_CACHE_BASENAME).read())
+    assert "handlers" in cache["logging"]
+
+
+def test_init_cache_skips_setup(tmpdir):
+    app_init(str(tmpdir))
+    tmpdir.join(APP_CONFIG_BASENAME).remove()
+
+    app_init(str(tmpdir))
+
+    assert not tmpdir.join(
+        APP_CONFIG_BASENAME
+    ).check(), u"A warm start should not touch the app directory."
+
+
+def test_deleted_user_config_is_restored_after_warm_start(test_app_dir):
+    runner = CliRunner()
+    runner.invoke(esok, ["config"])
+    (test_app_dir / APP_CONFIG_BASENAME).unlink()
+
+    result = runner.invoke(esok, ["config"])
+
+    assert result.exit_code == 0
+    assert "Could not read user's config file" not in result.output
+    with open(DEFAULT_CONFIG, u"r") as default_config:
+        assert (test_app_dir / APP_CONFIG_BASENAME).read_text() == default_config.read()
+
+
+def test_init_cache_of_other_version_is_ignored(tmpdir):
+    app_init(str(tmpdir))
+    cache_file = tmpdir.join(LOGS_DIR, INIT_CACHE_BASENAME)
+    cache = json.loads(cache_file.read())
+    cache["version"] = "0.0.0"
+    cache_file.write(json.dumps(cache))
+    tmpdir.join(APP_CONFIG_BASENAME).remove()
+
+    app_init(str(tmpdir))
+
+    assert tmpdir.join(APP_CONFIG_BASENAME).check()
@@ -0,0 +1,123 @@
+import json
+import socket
+
+from click.testing import CliRunner
+
+from esok.esok import esok
+from esok.metrics import Metrics, PrometheusTextfile, StatsD
+
+
+def _samples(metrics):
+    return {
+        (name, labels.get("quantile")): value
+        for name, labels, value, _ in metrics.samples()
+    }
+
+
+BULK_RESPONSE = json.dumps(
+    dict(
+        errors=True,
+        items=[
+            dict(index=dict(status=201)),
+            dict(index=dict(status=429)),
+            dict(create=dict(status=429)),
+            dict(index=dict(status=400)),
+        ],
+    )
+)
+
+
+def test_requests_are_measured():
+    metrics = Metrics()
+    metrics.enabled = True
+
+    metrics.on_request_start(None, "POST", "/_bulk")
+    assert metrics.values["in_flight_requests"] == 1
+
+    metrics.on_request(None, "POST", "/_bulk", {}, "abc", 200, "de", 0.5)
+    metrics.on_request(None, "POST", "/_bulk", {}, "abc", 200, BULK_RESPONSE, 0.5)
+    metrics.on_request(None, "POST", "/_bulk", {}, None, 429, None, 1.5)
+    metrics.on_request(None, "POST", "/_bulk", {}, None, None, None, 2.5)
+    metrics.count("docs", 10)
+
+    samples = _samples(metrics)
+    assert samples[("docs_total", None)] == 10
+    assert samples[("requests_total", None)] == 4
+    assert samples[("request_bytes_total", None)] == 6
+    assert samples[("response_bytes_total", None)] == 2 + len(BULK_RESPONSE)
+    assert samples[("retryable_responses_total", None)] == 2
+    assert samples[("rejected_items_total", None)] == 2
+    assert samples[("in_flight_requests", None)] == -3
+    assert samples[("request_latency_seconds", "0.5")] == 1.5
+    assert samples[("request_latency_seconds", "0.99")] == 2.5
+    assert samples[("request_latency_seconds_sum", None)] == 5.0
+    assert samples[("request_latency_seconds_count", None)] == 4
+
+    assert ("request_latency_seconds", "0.5") not in _samples(
+        metrics
+    ), "Latencies should be reset after every interval."
+
+
+def test_disabled_metrics_are_not_counted():
+    metrics = Metrics()
+
+    metrics.count("docs", 10)
+    metrics.set("queue_depth", 10)
+
+    assert metrics.values["docs"] == 0
+    assert metrics.values["queue_depth"] == 0
+
+
+def test_prometheus_textfile(tmp_path):
+    textfile = tmp_path / "esok.prom"
+    samples = [
+        ("docs_total", dict(), 10, "counter"),
+        ("request_latency_seconds", dict(quantile="0.5"), 0.25, "summary"),
+        ("request_latency_seconds", dict(quantile="0.9"), 0.75, "summary"),
+        ("request_latency_seconds_sum", dict(), 2.5, "summary"),
+        ("request_latency_seconds_count", dict(), 4, "summary"),
+    ]
+
+    PrometheusTextfile(str(textfile)).write("index_write", samples)
+
+    assert textfile.read_text().splitlines() == [
+        "# TYPE esok_docs_total counter",
+        'esok_docs_total{job="index_write"} 10',
+        "# TYPE esok_request_latency_seconds summary",
+        'esok_request_latency_seconds{job="index_write",quantile="0.5"} 0.25',
+        'esok_request_latency_seconds{job="index_write",quantile="0.9"} 0.75',
+        'esok_request_latency_seconds_sum{job="index_write"} 2.5',
+        'esok_request_latency_seconds_count{job="index_write"} 4',
+    ]
+
+
+def test_statsd():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    server.settimeout(5)
+    statsd = StatsD(*server.getsockname())
+
+    statsd.write("index_write", [("docs_total", dict(), 10, "counter")])
+    statsd.write("index_write", [("docs_total", dict(), 15, "counter")])
+    statsd.write(
+        "index_write",
+        [("request_latency_seconds", dict(quantile="0.99"), 0.5, "summary")],
+    )
+    statsd.close()
+
+    received = [server.recv(1024).decode() for _ in range(3)]
+    server.close()
+    assert received == [
+        "esok.index_write.docs_total:10|c",
+        "esok.index_write.docs_total:5|c",
+        "esok.index_write.request_latency_seconds.p99:0.5|g",
+    ]
+
+
+def test_metrics_option(test_app_dir):
+    textfile = test_app_dir / "esok.prom"
+
+    result = CliRunner().invoke(esok, ["--metrics", str(textfile), "config"])
+
+    assert result.exit_code == 0
+    assert 'esok_docs_total{job="esok"} 0' in textfile.read_text()
@@ -0,0 +1,60 @@
+import re
+
+from click.testing import CliRunner
+
+from esok.esok import esok
+from esok.profiling import Profile
+
+
+def test_phases_are_recorded():
+    profile = Profile()
+
+    with profile.phase("client"):
+        pass
+    with profile.phase("client"):
+        pass
+    profile.record("config", 0.5)
+
+    assert profile.phases["client"][0] == 2
+    assert profile.phases["config"] == (1, 0.5)
+
+
+def test_requests_are_recorded_per_endpoint():
+    profile = Profile()
+
+    profile.on_request(
+        None, "GET", "/_cat/indices", {"format": "json"}, None, 200, "", 0.5
+    )
+    profile.on_request(None, "GET", "/_cat/indices", {}, None, 200, "", 0.25)
+
+    assert profile.requests == {"GET /_cat/indices": (2, 0.75)}
+    assert profile.phases["request"] == (2, 0.75)
+
+
+def test_summary():
+    profile = Profile()
+    profile.record("config", 0.0)
+    profile.on_request(None, "GET", "/", {}, None, 200, "", 0.0)
+
+    summary = profile.summary()
+
+    for phase in ("config", "request", "other", "total"):
+        assert re.search(r"^{} ".format(phase), summary, re.MULTILINE)
+    assert "GET /" in summary
+
+
+def test_profile_option(test_app_dir):
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(esok, ["--profile", "config"])
+
+    assert result.exit_code == 0
+    assert "init" in result.stderr
+    assert "total" in result.stderr
+
+
+def test_profile_dump_option(test_app_dir):
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(esok, ["--profile-dump", "config"])
+
+    assert result.exit_code == 0
+    assert list((test_app_dir / "logs").glob("profile-*.pstats"))
@@ -0,0 +1,68 @@
+import subprocess
+import sys
+
+import pytest
+
+# Budget for the cumulative import time of the esok entry point, in microseconds.
+# Importing elasticsearch alone used to take more than this.
+IMPORT_TIME_BUDGET = 100000
+
+pytestmark = pytest.mark.skipif(
+    sys.version_info < (3, 7), reason="-X importtime requires Python 3.7 or newer."
+)
+
+
+def test_import_time_budget():
+    times = _import_times("import esok.esok")
+    assert times["esok.esok"] < IMPORT_TIME_BUDGET, "Start-up got slower."
+
+
+def test_import_does_not_load_commands_or_libraries():
+    times = _import_times("import esok.esok")
+
+    for module in ["elasticsearch", "yaml", "esok.commands.index"]:
+        assert module not in times, "{} should be imported lazily.".format(module)
+
+
+@pytest.mark.parametrize("args", [["--help"], ["config"], ["index", "--help"]])
+def test_commands_without_connection_do_not_load_elasticsearch(tmp_path, args):
+    times = _import_times(_invocation(tmp_path, args))
+
+    assert "elasticsearch" not in times
+
+
+def test_warm_start_does_not_load_yaml(tmp_path):
+    code = _invocation(tmp_path, ["--help"])
+    _import_times(code)
+
+    times = _import_times(code)
+
+    assert "yaml" not in times, "Logging configuration should be read from cache."
+
+
+def _invocation(app_dir, args):
+    return (
+        "from esok.esok import esok\n"
+        "try:\n"
+        "    esok({})\n"
+        "except SystemExit:\n"
+        "    pass\n".format(["-a", str(app_dir)] + args)
+    )
+
+
+def _import_times(code):
+    r = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+    times = dict()
+    for line in r.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
@@ -0,0 +1,95 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from elasticsearch import Elasticsearch, NotFoundError
+
+from esok import trace
+from esok.trace import Tracer
+from esok.transport import InstrumentedConnection
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        status = 404 if self.path.startswith("/missing") else 200
+        body = json.dumps({"path": self.path}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+class Listener(object):
+    def __init__(self):
+        self.requests = list()
+
+    def on_request(
+        self, connection, method, url, params, body, status, response, seconds
+    ):
+        self.requests.append((method, url, status, response))
+
+
+@pytest.fixture()
+def server():
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "127.0.0.1:{}".format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def test_instrumented_connection_reports_requests(server):
+    listener = Listener()
+    client = Elasticsearch(
+        hosts=[server], connection_class=InstrumentedConnection, listeners=[listener]
+    )
+
+    client.info()
+    with pytest.raises(NotFoundError):
+        client.indices.get(index="missing")
+
+    assert listener.requests[0] == ("GET", "/", 200, '{"path": "/"}')
+    method, url, status, _ = listener.requests[1]
+    assert (method, url, status) == ("GET", "/missing", 404)
+
+
+def test_tracer_writes_requests(server, monkeypatch):
+    records = list()
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = logging.getLogger("esok.trace")
+    monkeypatch.setattr(logger, "handlers", [handler])
+    monkeypatch.setattr(logger, "propagate", False)
+
+    tracer = Tracer(cluster="some-cluster", site="eu")
+    client = Elasticsearch(
+        hosts=[server], connection_class=InstrumentedConnection, listeners=[tracer]
+    )
+    level = logger.level
+    trace.enable()
+    try:
+        client.search(index="some-index", body={"size": 1}, size=1)
+    finally:
+        logger.setLevel(level)
+
+    [record] = [json.loads(r.getMessage()) for r in records]
+    assert record["cluster"] == "some-cluster"
+    assert record["site"] == "eu"
+    assert record["host"] == "http://{}".format(server)
+    assert record["method"] == "GET"
+    assert record["endpoint"] == "/some-index/_search"
+    assert record["params"] == {"size": "1"}
+    assert record["status"] == 200
+    assert record["request_bytes"] == len('{"size":1}')
+    assert record["response_bytes"] > 0
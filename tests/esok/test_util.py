@@ -1,4 +1,14 @@
-from esok.util import clean_index
+import pytest
+
+from esok.util import (
+    clean_index,
+    format_table,
+    human_size,
+    parse_size,
+    read_state,
+    task_progress,
+    write_state,
+)
 
 DELETED_SETTINGS_KEYS = [u"version", u"creation_date", u"uuid", u"provided_name"]
 
@@ -71,8 +81,49 @@ def test_clean_index_skip_settings_and_mappings():
     assert cleaned == {u"settings": {}, u"mappings": {}}
 
 
+def test_task_progress():
+    status = dict(created=2, updated=1, deleted=1, total=8)
+    assert task_progress(status) == 0.5
+
+
+def test_task_progress_without_documents():
+    status = dict(created=0, updated=0, deleted=0, total=0)
+    assert task_progress(status) == 1.0, "An empty task is trivially complete."
+
+
+def test_read_state_missing_file(tmp_path):
+    assert read_state(str(tmp_path / "missing.json")) == dict()
+
+
+def test_write_state_roundtrip(tmp_path):
+    state_file = str(tmp_path / "state" / "some-state.json")
+    state = {"some-host": {"some-index": {"status": "done"}}}
+
+    write_state(state_file, state)
+
+    assert read_state(state_file) == state
+    assert not (tmp_path / "state" / "some-state.json.tmp").exists()
+
+
 def _create_index_setting():
     index_settings = dict()
     for key in DELETED_SETTINGS_KEYS:
         index_settings[key] = u"something"
     return index_settings
+
+
+def test_format_table():
+    table = format_table(("name", "count"), [("a", 1), ("longer", 10)])
+
+    assert table.splitlines() == ["name   count", "a      1", "longer 10"]
+
+
+def test_sizes():
+    assert human_size(500) == "500b"
+    assert human_size(1536) == "1.5kb"
+    assert human_size(3 * 1024 ** 3) == "3.0gb"
+    assert parse_size("500") == 500
+    assert parse_size("1.5kb") == 1536
+    assert parse_size("10GB") == 10 * 1024 ** 3
+    with pytest.raises(ValueError):
+        parse_size("ten gigabytes")
@@ -0,0 +1,831 @@
+"""
+An in-process stand-in for Elasticsearch, for tests and benchmarks that should
+run without Docker.
+
+Only the parts of the REST API used by esok are implemented, with documents kept
+in memory: index creation, retrieval and deletion, _bulk, _search with scroll and
+search_after, _mget, _delete_by_query, _update_by_query, _stats, _settings,
+_forcemerge, _shrink, _split, _nodes/stats, _cluster/health, _cat/indices,
+_cat/shards, _cat/segments, _cat/recovery, _cat/allocation, _cat/aliases,
+_alias, _aliases, _reindex and _tasks, as well as the filter_path parameter.
+Queries may be term, range, bool and match_all queries, and aggregations min,
+max and composite ones with terms and histogram sources.
+Shards are placed on data nodes round-robin, and have one segment per document
+until force merged.
+Latency and rejection of bulk items can be configured, to mimic a loaded cluster.
+"""
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, unquote, urlparse
+
+ROUTES = list()
+
+CAT_INDICES_COLUMNS = (
+    "health",
+    "status",
+    "index",
+    "uuid",
+    "pri",
+    "rep",
+    "docs.count",
+    "docs.deleted",
+    "store.size",
+    "pri.store.size",
+)
+# Aliases of some columns of the cat indices API, by alias.
+CAT_INDICES_ALIASES = {
+    "h": "health",
+    "s": "status",
+    "i": "index",
+    "idx": "index",
+    "p": "pri",
+    "r": "rep",
+    "dc": "docs.count",
+    "dd": "docs.deleted",
+    "ss": "store.size",
+}
+CAT_SHARDS_COLUMNS = ("index", "shard", "prirep", "state", "docs", "store", "node")
+CAT_SEGMENTS_COLUMNS = ("index", "shard", "prirep", "segment", "docs.count")
+CAT_RECOVERY_COLUMNS = ("index", "shard", "stage", "bytes_percent")
+CAT_ALLOCATION_COLUMNS = ("shards", "disk.indices", "disk.percent", "node")
+CAT_ALIASES_COLUMNS = ("alias", "index", "filter")
+
+
+def route(method, pattern):
+    def decorator(f):
+        ROUTES.append((method, re.compile("^{}$".format(pattern)), f))
+        return f
+
+    return decorator
+
+
+class FakeElasticsearch(object):
+    def __init__(self, latency=0.0, reject_rate=0.0, seed=0, data_nodes=1):
+        """
+        :param latency: Number of seconds each request is delayed
+        :param reject_rate: Fraction of bulk items rejected with status 429
+        :param seed: Seed of the random rejections
+        :param data_nodes: Number of data nodes of the cluster
+        """
+        self.latency = latency
+        self.reject_rate = reject_rate
+        self.data_nodes = data_nodes
+        # Documents by ID, by index name.
+        self.indices = dict()
+        # Health of indices, which are green if not set.
+        self.health = dict()
+        # Index settings without the "index." prefix, by index name.
+        self.settings = dict()
+        # Number of documents indexed into, and searches of, indices.
+        self.indexed = dict()
+        self.searched = dict()
+        self.aliases = dict()
+        # Number of segments per shard of force merged indices.
+        self.merged = dict()
+        self.tasks = dict()
+        self.requests = list()
+        self._random = random.Random(seed)
+        self._scrolls = dict()
+        self._ids = itertools.count()
+        self._lock = threading.RLock()
+        self._server = None
+
+    @property
+    def host(self):
+        return "{}:{}".format(*self._server.server_address)
+
+    def start(self):
+        fake = self
+
+        class Handler(_Handler):
+            es = fake
+
+        self._server = _Server(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def add_documents(self, index, documents):
+        """Indexes documents directly, keyed by generated IDs."""
+        with self._lock:
+            docs = self.indices.setdefault(index, dict())
+            for document in documents:
+                docs[str(next(self._ids))] = document
+
+    def handle(self, method, path, query, body):
+        """Returns status and JSON (or text) response of a request."""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests.append((method, path))
+
+        for route_method, pattern, f in ROUTES:
+            match = pattern.match(path)
+            if match and method in route_method.split(","):
+                args = [group and unquote(group) for group in match.groups()]
+                with self._lock:
+                    try:
+                        status, response = f(self, query, body, *args)
+                    except Exception as e:
+                        return 500, _error("exception", repr(e))
+                if "filter_path" in query and isinstance(response, (dict, list)):
+                    paths = [p.split(".") for p in query["filter_path"].split(",")]
+                    response = _filter_path(response, paths) or dict()
+                return status, response
+
+        return 400, _error("no_handler_found_exception", "{} {}".format(method, path))
+
+    @route("GET,HEAD", "/")
+    def _info(self, query, body):
+        return 200, {"name": "fake", "version": {"number": "6.8.0"}}
+
+    @route("PUT", "/([^_/][^/]*)")
+    def _create_index(self, query, body, index):
+        if index in self.indices:
+            return 400, _error("resource_already_exists_exception", index)
+        self.indices[index] = dict()
+        settings = json.loads(body).get("settings", dict()) if body else dict()
+        self.settings[index] = _flat_settings(settings)
+        return 200, {"acknowledged": True, "shards_acknowledged": True}
+
+    @route("GET", "/([^_/][^/]*)")
+    def _get_index(self, query, body, index):
+        names = self._resolve(index)
+        if not names:
+            return 404, _error("index_not_found_exception", index)
+        return 200, {
+            name: {
+                "aliases": dict(),
+                "mappings": dict(),
+                "settings": {
+                    "index": dict(
+                        {k: str(v) for k, v in self.settings.get(name, {}).items()},
+                        version=dict(created="6080099"),
+                        creation_date="0",
+                        uuid=name,
+                        provided_name=name,
+                    )
+                },
+            }
+            for name in names
+        }
+
+    @route("DELETE", "/([^_/][^/]*)")
+    def _delete_index(self, query, body, index):
+        names = self._resolve(index)
+        if not names:
+            return 404, _error("index_not_found_exception", index)
+        for name in names:
+            del self.indices[name]
+            for alias_indices in self.aliases.values():
+                alias_indices.discard(name)
+        return 200, {"acknowledged": True}
+
+    @route("HEAD", "/([^_/][^/]*)")
+    def _index_exists(self, query, body, index):
+        return (200 if self._resolve(index) else 404), ""
+
+    @route("POST,PUT", "/(?:([^_/][^/]*)/)?(?:[^_/][^/]*/)?_bulk")
+    def _bulk(self, query, body, default_index):
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        items = list()
+        errors = False
+        while lines:
+            action = lines.pop(0)
+            ((op_type, meta),) = action.items()
+            source = lines.pop(0) if op_type != "delete" else None
+            index = meta.get("_index", default_index)
+            doc_id = str(meta.get("_id", next(self._ids)))
+
+            if self.reject_rate and self._random.random() < self.reject_rate:
+                errors = True
+                item = dict(
+                    status=429,
+                    error=_error("es_rejected_execution_exception", "rejected")[
+                        "error"
+                    ],
+                )
+            elif op_type == "delete":
+                existed = self.indices.get(index, dict()).pop(doc_id, None)
+                item = dict(status=200 if existed is not None else 404)
+            else:
+                if op_type == "update":
+                    current = self.indices.get(index, dict()).get(doc_id, dict())
+                    source = dict(current, **source.get("doc", dict()))
+                self.indices.setdefault(index, dict())[doc_id] = source
+                self.indexed[index] = self.indexed.get(index, 0) + 1
+                item = dict(status=201)
+
+            item.update(_index=index, _type="_doc", _id=doc_id)
+            items.append({op_type: item})
+
+        return 200, {"took": 1, "errors": errors, "items": items}
+
+    @route("GET,POST", "/(?:([^_/][^/]*)/)?_search")
+    def _search(self, query, body, index):
+        body = json.loads(body) if body else dict()
+        size = int(query.get("size", body.get("size", 10)))
+        hits = self._hits(index or "_all", body)
+        for name in self._resolve(index or "_all"):
+            self.searched[name] = self.searched.get(name, 0) + 1
+
+        if "search_after" in body:
+            after = body["search_after"][0]
+            hits = [hit for hit in hits if hit["_id"] > after]
+        for hit in hits:
+            if body.get("sort"):
+                hit["sort"] = [hit["_id"]]
+
+        response = _search_response(hits[:size], len(hits))
+        aggregations = body.get("aggs", body.get("aggregations"))
+        if aggregations:
+            sources = [hit["_source"] for hit in hits]
+            response["aggregations"] = {
+                name: _aggregation(sources, aggregation)
+                for name, aggregation in aggregations.items()
+            }
+        if "scroll" in query:
+            scroll_id = "scroll-{}".format(next(self._ids))
+            self._scrolls[scroll_id] = (hits[size:], size)
+            response["_scroll_id"] = scroll_id
+        return 200, response
+
+    @route("GET,POST", "/(?:([^_/][^/]*)/)?_mget")
+    def _mget(self, query, body, index):
+        body = json.loads(body)
+        docs = body.get("docs") or [dict(_id=i) for i in body.get("ids", [])]
+        response = list()
+        for doc in docs:
+            name = doc.get("_index", index)
+            if name not in self.indices:
+                error = _error("index_not_found_exception", name)["error"]
+                response.append(dict(_index=name, _id=doc["_id"], error=error))
+                continue
+            source = self.indices[name].get(doc["_id"])
+            found = dict(_index=name, _type="_doc", _id=doc["_id"], found=False)
+            if source is not None:
+                found.update(_version=1, found=True, _source=source)
+            response.append(found)
+        return 200, dict(docs=response)
+
+    @route("GET,POST", "/_search/scroll")
+    def _scroll(self, query, body):
+        scroll_id = json.loads(body)["scroll_id"]
+        if scroll_id not in self._scrolls:
+            return 404, _error("search_context_missing_exception", scroll_id)
+        hits, size = self._scrolls[scroll_id]
+        self._scrolls[scroll_id] = (hits[size:], size)
+        response = _search_response(hits[:size], len(hits))
+        response["_scroll_id"] = scroll_id
+        return 200, response
+
+    @route("DELETE", "/_search/scroll")
+    def _clear_scroll(self, query, body):
+        scroll_ids = json.loads(body)["scroll_id"] if body else list()
+        for scroll_id in scroll_ids:
+            self._scrolls.pop(scroll_id, None)
+        return 200, {"succeeded": True, "num_freed": len(scroll_ids)}
+
+    @route("GET", "/(?:([^_/][^/]*)/)?_stats(?:/[^/]+)?")
+    def _stats(self, query, body, index):
+        names = sorted(self._resolve(index or "_all"))
+        indices = {
+            name: dict(uuid=name, primaries=self._index_stats([name])) for name in names
+        }
+        for name in names:
+            indices[name]["total"] = indices[name]["primaries"]
+        totals = self._index_stats(names)
+        return 200, dict(
+            _shards=dict(total=len(indices)),
+            _all=dict(primaries=totals, total=totals),
+            indices=indices,
+        )
+
+    def _index_stats(self, names):
+        return dict(
+            docs=dict(count=sum(len(self.indices[n]) for n in names), deleted=0),
+            store=dict(
+                size_in_bytes=sum(len(json.dumps(self.indices[n])) for n in names)
+            ),
+            indexing=dict(index_total=sum(self.indexed.get(n, 0) for n in names)),
+            search=dict(query_total=sum(self.searched.get(n, 0) for n in names)),
+        )
+
+    @route("PUT", "/([^_/][^/]*)/_settings")
+    def _put_settings(self, query, body, index):
+        names = self._resolve(index)
+        if not names:
+            return 404, _error("index_not_found_exception", index)
+        settings = _flat_settings(json.loads(body))
+        for name in names:
+            index_settings = self.settings.setdefault(name, dict())
+            index_settings.update(settings)
+            # Settings set to null are reset to their defaults.
+            for key in (key for key, value in settings.items() if value is None):
+                del index_settings[key]
+        return 200, {"acknowledged": True}
+
+    @route("POST", "/([^_/][^/]*)/_forcemerge")
+    def _forcemerge(self, query, body, index):
+        names = self._resolve(index)
+        if not names:
+            return 404, _error("index_not_found_exception", index)
+        for name in names:
+            self.merged[name] = int(query.get("max_num_segments", 1))
+        return 200, dict(_shards=dict(total=len(names), successful=len(names)))
+
+    @route("PUT,POST", "/([^_/][^/]*)/_(shrink|split)/([^/]+)")
+    def _resize(self, query, body, index, operation, target):
+        if index not in self.indices:
+            return 404, _error("index_not_found_exception", index)
+        if target in self.indices:
+            return 400, _error("resource_already_exists_exception", target)
+        settings = _flat_settings(json.loads(body).get("settings", dict()))
+        self.indices[target] = dict(self.indices[index])
+        self.settings[target] = dict(
+            self.settings.get(index, dict()),
+            **{key: value for key, value in settings.items() if value is not None}
+        )
+        for key in (key for key, value in settings.items() if value is None):
+            self.settings[target].pop(key, None)
+        return 200, {"acknowledged": True, "shards_acknowledged": True}
+
+    @route("GET", "/_cluster/health(?:/([^/]+))?")
+    def _cluster_health(self, query, body, index):
+        return 200, dict(
+            status="green",
+            timed_out=False,
+            relocating_shards=0,
+            initializing_shards=0,
+            unassigned_shards=0,
+        )
+
+    @route("GET", "/_nodes/stats(?:/[^/]+){0,2}")
+    def _nodes_stats(self, query, body):
+        nodes = {
+            name: dict(
+                name=name,
+                roles=["data"],
+                indices=dict(indexing=dict(index_total=0), search=dict(query_total=0)),
+            )
+            for name in self._node_names()
+        }
+        # Counters of an index are split evenly between its primary shards.
+        for shard in self._shards():
+            if shard["prirep"] == "p":
+                pri = int(self._setting(shard["index"], "number_of_shards"))
+                indices = nodes[shard["node"]]["indices"]
+                indices["indexing"]["index_total"] += (
+                    self.indexed.get(shard["index"], 0) // pri
+                )
+                indices["search"]["query_total"] += (
+                    self.searched.get(shard["index"], 0) // pri
+                )
+        return 200, dict(nodes=nodes)
+
+    @route("GET", "/_cat/indices(?:/([^/]+))?")
+    def _cat_indices(self, query, body, pattern):
+        if "help" in query:
+            return 200, "".join(
+                "{} | {} | \n".format(
+                    column,
+                    ",".join(a for a, c in CAT_INDICES_ALIASES.items() if c == column),
+                )
+                for column in CAT_INDICES_COLUMNS
+            )
+        rows = [
+            {
+                "health": self.health.get(name, "green"),
+                "status": "open",
+                "index": name,
+                "uuid": name,
+                "pri": self._setting(name, "number_of_shards"),
+                "rep": self._setting(name, "number_of_replicas"),
+                "docs.count": str(len(docs)),
+                "docs.deleted": "0",
+                "store.size": _size(len(json.dumps(docs)), query),
+                "pri.store.size": _size(len(json.dumps(docs)), query),
+            }
+            for name, docs in self.indices.items()
+            if name in self._resolve(pattern or "_all")
+        ]
+        if "health" in query:
+            rows = [row for row in rows if row["health"] == query["health"]]
+        return 200, _cat(rows, query, CAT_INDICES_COLUMNS, CAT_INDICES_ALIASES)
+
+    @route("GET", "/_cat/shards(?:/([^/]+))?")
+    def _cat_shards(self, query, body, pattern):
+        names = self._resolve(pattern or "_all")
+        rows = [
+            dict(shard, store=shard["node"] and _size(shard["store"], query))
+            for shard in self._shards()
+            if shard["index"] in names
+        ]
+        return 200, _cat(rows, query, CAT_SHARDS_COLUMNS)
+
+    @route("GET", "/_cat/segments(?:/([^/]+))?")
+    def _cat_segments(self, query, body, pattern):
+        names = self._resolve(pattern or "_all")
+        rows = [
+            {
+                "index": shard["index"],
+                "shard": shard["shard"],
+                "prirep": shard["prirep"],
+                "segment": "_{}".format(n),
+                "docs.count": "1",
+            }
+            for shard in self._shards()
+            if shard["index"] in names and shard["node"]
+            for n in range(self.merged.get(shard["index"], max(int(shard["docs"]), 1)))
+        ]
+        return 200, _cat(rows, query, CAT_SEGMENTS_COLUMNS)
+
+    @route("GET", "/_cat/recovery(?:/([^/]+))?")
+    def _cat_recovery(self, query, body, pattern):
+        names = self._resolve(pattern or "_all")
+        if not names:
+            return 404, _error("index_not_found_exception", pattern)
+        rows = [
+            dict(shard, stage="done", bytes_percent="100.0%")
+            for shard in self._shards()
+            if shard["index"] in names and shard["node"]
+        ]
+        return 200, _cat(rows, query, CAT_RECOVERY_COLUMNS)
+
+    @route("GET", "/_cat/allocation(?:/([^/]+))?")
+    def _cat_allocation(self, query, body, node):
+        shards = self._shards()
+        rows = [
+            {
+                "shards": str(sum(1 for s in shards if s["node"] == name)),
+                "disk.indices": _size(
+                    sum(s["store"] for s in shards if s["node"] == name), query
+                ),
+                "disk.percent": "10",
+                "node": name,
+            }
+            for name in self._node_names()
+            if node is None or node == name
+        ]
+        return 200, _cat(rows, query, CAT_ALLOCATION_COLUMNS)
+
+    @route("GET", "/_cat/aliases(?:/([^/]+))?")
+    def _cat_aliases(self, query, body, pattern):
+        rows = [
+            dict(alias=alias, index=index, filter="-")
+            for alias, indices in self.aliases.items()
+            for index in sorted(indices)
+            if pattern is None or re.match(_wildcard(pattern), alias)
+        ]
+        return 200, _cat(rows, query, CAT_ALIASES_COLUMNS)
+
+    @route("POST", "/_aliases")
+    def _update_aliases(self, query, body):
+        for action in json.loads(body)["actions"]:
+            ((op_type, args),) = action.items()
+            indices = self._resolve(
+                args.get("index", ",".join(args.get("indices", [])))
+            )
+            if not indices:
+                return 404, _error("index_not_found_exception", args.get("index"))
+            aliases = self.aliases.setdefault(args["alias"], set())
+            if op_type == "add":
+                aliases.update(indices)
+            elif op_type == "remove":
+                aliases.difference_update(indices)
+        return 200, {"acknowledged": True}
+
+    @route("GET", "/(?:([^_/][^/]*)/)?_alias(?:es)?(?:/([^/]+))?")
+    def _get_aliases(self, query, body, index, alias):
+        indices = self._resolve(index or "_all")
+        response = {
+            name: dict(
+                aliases={
+                    a: dict()
+                    for a, names in sorted(self.aliases.items())
+                    if name in names
+                    and (alias is None or re.match(_wildcard(alias), a))
+                }
+            )
+            for name in sorted(indices)
+        }
+        if index is None or alias is not None:
+            response = {name: r for name, r in response.items() if r["aliases"]}
+        return 200, response
+
+    @route("PUT,POST", "/([^_/][^/]*)/_alias(?:es)?/([^/]+)")
+    def _put_alias(self, query, body, index, alias):
+        indices = self._resolve(index)
+        if not indices:
+            return 404, _error("index_not_found_exception", index)
+        self.aliases.setdefault(alias, set()).update(indices)
+        return 200, {"acknowledged": True}
+
+    @route("POST", "/_reindex")
+    def _reindex(self, query, body):
+        body = json.loads(body)
+        source = self._hits(body["source"]["index"], body["source"])
+        target = self.indices.setdefault(body["dest"]["index"], dict())
+        for hit in source:
+            target[hit["_id"]] = hit["_source"]
+
+        return self._task_response(query, "reindex", len(source), created=len(source))
+
+    @route("POST", "/([^_/][^/]*)/(?:[^_/][^/]*/)?_(delete|update)_by_query")
+    def _by_query(self, query, body, index, operation):
+        hits = self._hits(index, json.loads(body) if body else dict())
+        if operation == "delete":
+            for hit in hits:
+                del self.indices[hit["_index"]][hit["_id"]]
+            return self._task_response(
+                query, "delete/byquery", len(hits), deleted=len(hits)
+            )
+        return self._task_response(
+            query, "update/byquery", len(hits), updated=len(hits)
+        )
+
+    def _task_response(self, query, action, total, **counts):
+        """Response of a reindex-like request, or its task if run in the background."""
+        status = dict(total=total, created=0, updated=0, deleted=0, batches=1)
+        status.update(counts)
+        status["requests_per_second"] = float(query.get("requests_per_second", -1))
+        response = dict(status, took=1, timed_out=False, failures=list())
+        if query.get("wait_for_completion") == "false":
+            task_id = "fake:{}".format(next(self._ids))
+            self.tasks[task_id] = dict(
+                completed=True,
+                task=dict(node="fake", id=task_id, action=action, status=status),
+                response=response,
+            )
+            return 200, {"task": task_id}
+        return 200, response
+
+    @route("GET", "/_tasks/([^/]+)")
+    def _task(self, query, body, task_id):
+        if task_id not in self.tasks:
+            return 404, _error("resource_not_found_exception", task_id)
+        return 200, self.tasks[task_id]
+
+    def _setting(self, index, name):
+        defaults = dict(number_of_shards="5", number_of_replicas="1")
+        return str(self.settings.get(index, dict()).get(name, defaults[name]))
+
+    def _node_names(self):
+        return ["node-{}".format(n) for n in range(self.data_nodes)]
+
+    def _shards(self):
+        """
+        Shards of all indices, placed round-robin on the data nodes in order of
+        index name, with replicas on the nodes following their primary. Documents
+        are split between shards in order of ID.
+        """
+        nodes = self._node_names()
+        shards = list()
+        primaries = itertools.count()
+        for index in sorted(self.indices):
+            pri = int(self._setting(index, "number_of_shards"))
+            rep = int(self._setting(index, "number_of_replicas"))
+            docs = [doc for _, doc in sorted(self.indices[index].items())]
+            for n in range(pri):
+                shard_docs = docs[n::pri]
+                first = next(primaries)
+                for copy in range(rep + 1):
+                    assigned = copy < len(nodes)
+                    shards.append(
+                        dict(
+                            index=index,
+                            shard=str(n),
+                            prirep="p" if copy == 0 else "r",
+                            state="STARTED" if assigned else "UNASSIGNED",
+                            docs=str(len(shard_docs)) if assigned else None,
+                            store=len(json.dumps(shard_docs)) if assigned else 0,
+                            node=nodes[(first + copy) % len(nodes)]
+                            if assigned
+                            else None,
+                        )
+                    )
+        return shards
+
+    def _resolve(self, pattern):
+        """Names of the indices matched by a pattern, which may contain aliases."""
+        names = set()
+        for part in pattern.split(","):
+            if part in ("_all", "*"):
+                names.update(self.indices)
+            elif part in self.aliases:
+                names.update(self.aliases[part])
+            else:
+                names.update(n for n in self.indices if re.match(_wildcard(part), n))
+        return names
+
+    def _hits(self, pattern, body):
+        hits = [
+            dict(_index=index, _type="_doc", _id=doc_id, _source=source)
+            for index in sorted(self._resolve(pattern))
+            for doc_id, source in sorted(self.indices[index].items())
+        ]
+        query = body.get("query")
+        if query:
+            hits = [hit for hit in hits if _matches(hit["_source"], query)]
+        if "slice" in body:
+            slice_id, slice_max = body["slice"]["id"], body["slice"]["max"]
+            hits = [hit for hit in hits if int(hit["_id"]) % slice_max == slice_id]
+        return hits
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, as used by the Elasticsearch client.
+    protocol_version = "HTTP/1.1"
+    es = None
+
+    def _handle(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+
+        status, response = self.es.handle(self.command, url.path, query, body)
+
+        if isinstance(response, str):
+            content_type = "text/plain; charset=UTF-8"
+            data = response.encode("utf-8")
+        else:
+            content_type = "application/json; charset=UTF-8"
+            data = json.dumps(response).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+def _search_response(hits, total):
+    return dict(
+        took=1,
+        timed_out=False,
+        _shards=dict(total=1, successful=1, skipped=0, failed=0),
+        hits=dict(total=total, max_score=None, hits=hits),
+    )
+
+
+def _matches(source, query):
+    """Whether a document matches a term, range, bool or match_all query."""
+    ((query_type, params),) = query.items()
+    if query_type == "term":
+        ((field, value),) = params.items()
+        return source.get(field) == value
+    if query_type == "range":
+        ((field, bounds),) = params.items()
+        value = source.get(field)
+        operators = dict(
+            gt=lambda b: value > b,
+            gte=lambda b: value >= b,
+            lt=lambda b: value < b,
+            lte=lambda b: value <= b,
+        )
+        return value is not None and all(
+            operators[op](bound) for op, bound in bounds.items()
+        )
+    if query_type == "bool":
+        clauses = params.get("must", list()) + params.get("filter", list())
+        return all(_matches(source, clause) for clause in clauses)
+    return True
+
+
+def _aggregation(sources, aggregation):
+    """Result of a min, max or composite aggregation with terms or histogram sources."""
+    ((aggregation_type, params),) = aggregation.items()
+    if aggregation_type in ("min", "max"):
+        values = [s[params["field"]] for s in sources if params["field"] in s]
+        return dict(value=(min if aggregation_type == "min" else max)(values or [None]))
+
+    names = [next(iter(source)) for source in params["sources"]]
+    values = [
+        _source_value(source[name]) for source, name in zip(params["sources"], names)
+    ]
+    counts = dict()
+    for source in sources:
+        key = tuple(value(source) for value in values)
+        if None not in key:
+            counts[key] = counts.get(key, 0) + 1
+    keys = sorted(counts)
+    if "after" in params:
+        after = tuple(params["after"][name] for name in names)
+        keys = [key for key in keys if key > after]
+    keys = keys[: params.get("size", 10)]
+    buckets = [dict(key=dict(zip(names, key)), doc_count=counts[key]) for key in keys]
+    if not buckets:
+        return dict(buckets=buckets)
+    return dict(buckets=buckets, after_key=buckets[-1]["key"])
+
+
+def _source_value(source):
+    """Function of a document, returning its key in a terms or histogram source."""
+    ((source_type, params),) = source.items()
+    field = params["field"]
+    if source_type == "histogram":
+        interval = params["interval"]
+        return lambda s: None if field not in s else s[field] // interval * interval
+    return lambda s: s.get(field)
+
+
+def _cat(rows, query, columns, aliases=None):
+    """
+    Rows of a _cat API, as JSON or as a text table, with the h, s and v options.
+    Columns are named by their full names, also if requested by an alias.
+    """
+    aliases = aliases or dict()
+    columns = query["h"].split(",") if "h" in query else columns
+    columns = [aliases.get(column, column) for column in columns]
+    for sort_key in reversed(query.get("s", "").split(",")):
+        if sort_key:
+            key, _, order = sort_key.partition(":")
+            key = aliases.get(key, key)
+            rows = sorted(rows, key=lambda r: r.get(key, ""), reverse=order == "desc")
+
+    rows = [{column: row.get(column) for column in columns} for row in rows]
+    if query.get("format") == "json":
+        return rows
+
+    table = [[str(row[column]) for column in columns] for row in rows]
+    if query.get("v") == "true":
+        table.insert(0, list(columns))
+    widths = [max([len(r[i]) for r in table] + [0]) for i in range(len(columns))]
+    return "".join(
+        " ".join(cell.ljust(width) for cell, width in zip(r, widths)).rstrip() + "\n"
+        for r in table
+    )
+
+
+def _size(size, query):
+    return str(size) if query.get("bytes") == "b" else "{}b".format(size)
+
+
+def _filter_path(value, paths):
+    """Keeps the parts of a response matched by the split paths of filter_path."""
+    if any(not path for path in paths):
+        return value
+    if isinstance(value, list):
+        items = [_filter_path(item, paths) for item in value]
+        return [item for item in items if item is not None] or None
+    if not isinstance(value, dict):
+        return None
+
+    filtered = dict()
+    for key, child in value.items():
+        rest = [path[1:] for path in paths if re.match(_wildcard(path[0]), key)]
+        if rest:
+            child = _filter_path(child, rest)
+            if child is not None:
+                filtered[key] = child
+    return filtered or None
+
+
+def _flat_settings(settings):
+    """Settings without the "index." prefix, whether nested or dotted."""
+    flat = dict()
+    for key, value in settings.items():
+        if isinstance(value, dict):
+            value = _flat_settings(value)
+            flat.update({"{}.{}".format(key, k): v for k, v in value.items()})
+        else:
+            flat[key] = value
+    return {
+        key[len("index.") :] if key.startswith("index.") else key: value
+        for key, value in flat.items()
+    }
+
+
+def _wildcard(pattern):
+    return "^{}$".format(".*".join(re.escape(part) for part in pattern.split("*")))
+
+
+def _error(error_type, reason):
+    return dict(error=dict(type=error_type, reason=reason), status=None)
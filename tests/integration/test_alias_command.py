@@ -73,6 +73,52 @@ def test_swap_with_missing_from_index(runner, client, empty_index):
     assert "" == client.cat.aliases()
 
 
+def test_swap_with_patterns(runner, client, make_index, make_alias):
+    make_index("products-v1")
+    make_index("products-v2")
+    make_alias("products-v1", "products")
+
+    r = runner.invoke(esok, ["alias", "swap", "products", "*-v1", "*-v2"])
+    assert r.exit_code == 0
+    assert client.indices.get_alias(name="products") == {
+        "products-v2": {"aliases": {"products": {}}}
+    }
+
+
+def test_apply(runner, client, test_app_dir, make_index, make_alias):
+    some_index = make_index()
+    other_index = make_index()
+    alias = make_alias(some_index)
+    actions_file = test_app_dir / "aliases.yml"
+    actions_file.write_text(
+        "- add: {{index: {0}, alias: {1}}}\n"
+        "- remove: {{index: {2}, alias: {1}}}\n"
+        "- add: {{index: {0}, alias: other-alias}}\n".format(
+            other_index, alias, some_index
+        )
+    )
+
+    r = runner.invoke(esok, ["alias", "apply", str(actions_file)])
+    assert r.exit_code == 0
+
+    aliases = client.cat.aliases()
+    assert some_index not in aliases
+    assert "{} {}".format(alias, other_index) in aliases
+    assert "other-alias {}".format(other_index) in aliases
+
+
+def test_apply_with_missing_index(runner, client, test_app_dir, empty_index):
+    actions_file = test_app_dir / "aliases.yml"
+    actions_file.write_text(
+        "- add: {{index: {}, alias: some-alias}}\n"
+        "- add: {{index: missing-index, alias: some-alias}}\n".format(empty_index)
+    )
+
+    r = runner.invoke(esok, ["alias", "apply", str(actions_file)])
+    assert isinstance(r.exception, SystemExit)
+    assert "" == client.cat.aliases()
+
+
 @pytest.fixture
 def make_alias(client):
     alias_list = list()
@@ -0,0 +1,40 @@
+from esok.esok import esok
+
+
+def test_batch(runner, client, tmp_path):
+    batch_file = tmp_path / "batch.yaml"
+    batch_file.write_text(
+        """
+        - name: index
+          command: index touch some-index
+        - name: other
+          command: index touch other-index
+        - name: alias
+          command: alias create some-alias some-index
+          after: [index]
+        """
+    )
+
+    r = runner.invoke(esok, ["batch", str(batch_file)])
+
+    assert r.exit_code == 0
+    assert client.indices.exists("other-index")
+    assert "some-alias some-index" in client.cat.aliases()
+
+
+def test_batch_skips_steps_after_failure(runner, client, tmp_path):
+    batch_file = tmp_path / "batch.yaml"
+    batch_file.write_text(
+        """
+        - name: alias
+          command: alias create some-alias missing-index
+        - name: index
+          command: index touch some-index
+          after: [alias]
+        """
+    )
+
+    r = runner.invoke(esok, ["batch", str(batch_file)])
+
+    assert r.exit_code != 0
+    assert not client.indices.exists("some-index")
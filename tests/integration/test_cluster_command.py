@@ -0,0 +1,27 @@
+import json
+
+from esok.esok import esok
+
+
+def test_hotspots(runner, empty_index):
+    result = runner.invoke(esok, ["cluster", "hotspots", "-i", "0", "-o", "json"])
+    assert result.exit_code == 0
+    report = json.loads(result.output)
+    assert len(report["nodes"]) == 1
+    assert report["nodes"][0]["shards"] >= 1
+    assert report["moves"] == []
+
+
+def test_hotspots_table(runner, empty_index):
+    result = runner.invoke(esok, ["cluster", "hotspots", "-i", "0.1"])
+    assert result.exit_code == 0
+    assert result.output.splitlines()[0].split() == [
+        "node",
+        "shards",
+        "bytes",
+        "docs",
+        "index/s",
+        "query/s",
+        "disk%",
+    ]
+    assert "No shard moves suggested." in result.output
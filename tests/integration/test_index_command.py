@@ -71,6 +71,39 @@ def test_copy(runner, client, empty_index):
     assert _clean(source_index) == _clean(new_index)
 
 
+def test_diff(runner, client, filled_index):
+    index_name, _ = filled_index
+    client.reindex(
+        {"source": {"index": index_name}, "dest": {"index": "other-index"}},
+        refresh=True,
+    )
+
+    result = runner.invoke(esok, ["index", "diff", index_name, "other-index"])
+
+    assert result.exit_code == 0
+    assert "0 missing, 0 extra, 0 changed." in result.output
+
+
+def test_diff_with_differences(runner, client, filled_index):
+    index_name, _ = filled_index
+    client.reindex(
+        {"source": {"index": index_name}, "dest": {"index": "other-index"}},
+        refresh=True,
+    )
+    client.delete("other-index", "_doc", "0", refresh=True)
+    client.index("other-index", "_doc", dict(title="changed"), id="1", refresh=True)
+    client.index("other-index", "_doc", dict(title="new"), id="9", refresh=True)
+
+    result = runner.invoke(
+        esok, ["index", "diff", "-c", "2", index_name, "other-index"]
+    )
+
+    assert result.exit_code == 1
+    assert "missing\t0" in result.output
+    assert "changed\t1" in result.output
+    assert "extra\t9" in result.output
+
+
 def test_delete(runner, client, empty_index):
     result = runner.invoke(esok, ["index", "delete", empty_index])
     assert result.exit_code == 0
@@ -97,12 +130,42 @@ def test_get(runner, empty_index, client):
     assert json.loads(result.output) == client.indices.get(empty_index)
 
 
+def test_get_with_filter_path(runner, empty_index):
+    filter_path = "*.settings.index.number_of_shards"
+    result = runner.invoke(esok, ["-F", filter_path, "index", "get", empty_index])
+    assert result.exit_code == 0
+    assert json.loads(result.output) == {
+        empty_index: {"settings": {"index": {"number_of_shards": "1"}}}
+    }
+
+
 def test_stats(runner, empty_index, client):
     result = runner.invoke(esok, ["index", "stats", empty_index])
     assert result.exit_code == 0
     assert json.loads(result.output) == client.indices.stats(empty_index)
 
 
+def test_stats_summary(runner, empty_index):
+    result = runner.invoke(
+        esok, ["index", "stats", "--summary", "-i", "0", empty_index]
+    )
+    assert result.exit_code == 0
+    assert result.output.splitlines()[1].split()[:2] == ["1", "0"]
+    assert "Top 10 by size:" in result.output
+
+
+def test_stats_watch(runner, empty_index):
+    result = runner.invoke(
+        esok, ["index", "stats", "--watch", "-i", "0.1", "--count", "1", empty_index]
+    )
+    assert result.exit_code == 0
+    assert [line.split() for line in result.output.splitlines()[1:]] == [
+        ["index", "index/s", "query/s", "merge%", "refresh%"],
+        ["_all", "0.0", "0.0", "0.0", "0.0"],
+        [empty_index, "0.0", "0.0", "0.0", "0.0"],
+    ]
+
+
 def test_shards(runner, empty_index, client):
     result = runner.invoke(esok, ["index", "shards", empty_index, "1"])
     assert result.exit_code == 0
@@ -110,6 +173,66 @@ def test_shards(runner, empty_index, client):
     assert "0" == settings[empty_index]["settings"]["index"]["number_of_replicas"]
 
 
+def test_forcemerge(runner, filled_index):
+    index_name, _ = filled_index
+    result = runner.invoke(esok, ["index", "forcemerge", index_name])
+    assert result.exit_code == 0
+    assert result.output.splitlines()[-1].split()[-1] == "ok"
+
+
+def test_shrink(runner, client, filled_index):
+    index_name, _ = filled_index
+    result = runner.invoke(esok, ["index", "shrink", "-y", index_name])
+    assert result.exit_code == 0
+    settings = client.indices.get_settings(index_name + "-shrunk")
+    assert (
+        settings[index_name + "-shrunk"]["settings"]["index"]["number_of_shards"] == "1"
+    )
+
+
+def test_split(runner, client):
+    client.indices.create(
+        "split-me",
+        {"settings": {"number_of_shards": 1, "number_of_routing_shards": 4}},
+    )
+    result = runner.invoke(esok, ["index", "split", "-y", "split-me", "2"])
+    assert result.exit_code == 0
+    settings = client.indices.get_settings("split-me-split")
+    assert settings["split-me-split"]["settings"]["index"]["number_of_shards"] == "2"
+
+
+def test_delete_by_query(runner, client, filled_index, tmp_path):
+    index_name, _ = filled_index
+    query_file = tmp_path / "query.json"
+    query_file.write_text('{"query": {"match": {"title": "title-1"}}}')
+
+    result = runner.invoke(
+        esok, ["index", "delete-by-query", "--wait", index_name, str(query_file)]
+    )
+
+    assert result.exit_code == 0
+    assert json.loads(result.output)["deleted"] == 1
+
+
+def test_update_by_query(runner, filled_index):
+    index_name, _ = filled_index
+    result = runner.invoke(esok, ["index", "update-by-query", index_name])
+    assert result.exit_code == 0
+    assert result.output.startswith("Task ID: ")
+
+
+def test_mget(runner, filled_index, tmp_path):
+    index_name, data = filled_index
+    ids_file = tmp_path / "ids.txt"
+    ids_file.write_text("2\n0\n")
+
+    result = runner.invoke(esok, ["index", "mget", index_name, str(ids_file)])
+
+    assert result.exit_code == 0
+    docs = [json.loads(line) for line in result.output.splitlines()]
+    assert [doc["_source"] for doc in docs] == [data[2], data[0]]
+
+
 def test_read(runner, filled_index):
     index_name, data = filled_index
     result = runner.invoke(esok, ["index", "read", index_name])
@@ -157,6 +280,24 @@ def test_write_only_data(host):
         assert indexed_doc["_type"] == "_doc"
 
 
+def test_write_with_metrics(host, tmp_path):
+    runner = CliRunner()
+    documents_file = tmp_path / "docs.json"
+    documents_file.write_text("\n".join(json.dumps(dict(n=n)) for n in range(10)))
+    textfile = tmp_path / "esok.prom"
+
+    result = runner.invoke(
+        esok,
+        ["--metrics", str(textfile), "index", "write", "-i", "woot"]
+        + [str(documents_file)],
+    )
+
+    assert result.exit_code == 0
+    metrics = textfile.read_text()
+    assert 'esok_docs_total{job="index_write"} 10' in metrics
+    assert 'esok_requests_total{job="index_write"}' in metrics
+
+
 def test_write_with_routing(host):
     runner = CliRunner()
     index_name = "woot"
@@ -0,0 +1,65 @@
+import json
+
+from elasticsearch.helpers import bulk
+
+from esok.esok import esok
+
+
+def test_migrate(runner, client, empty_index):
+    docs = [dict(updated_at="2021-01-0{}".format(i)) for i in range(1, 4)]
+    actions = [dict(_index=empty_index, _type="_doc", _source=d) for d in docs]
+    bulk(client, actions, refresh=True)
+    client.indices.put_alias(empty_index, "some-alias")
+
+    r = runner.invoke(
+        esok,
+        ["migrate", "--since-field", "updated_at", "-w", "yellow", "-p", "0.1"]
+        + [empty_index, "new-index", "some-alias"],
+    )
+
+    assert r.exit_code == 0
+    assert client.count(index="new-index")["count"] == 3
+    assert list(client.indices.get_alias(name="some-alias").keys()) == ["new-index"]
+    settings = client.indices.get_settings("new-index")["new-index"]["settings"]
+    assert "refresh_interval" not in settings["index"], "Settings should be restored."
+
+
+def test_migrate_is_resumed(runner, client, empty_index):
+    args = ["migrate", "-w", "yellow", "-p", "0.1", empty_index, "new-index", "alias"]
+    runner.invoke(esok, args)
+
+    r = runner.invoke(esok, args)
+
+    assert r.exit_code == 0
+    assert "[1/7] copy: already done" in r.output
+
+
+def test_migrate_restart_after_tune_restores_original_settings(
+    runner, client, empty_index, test_app_dir
+):
+    # Persisted progress of a migration that stopped after the tune step.
+    tuned = {"index": {"refresh_interval": "-1", "number_of_replicas": 0}}
+    client.indices.create("new-index", body=dict(settings=tuned))
+    host = client.transport.get_connection().host
+    state_file = test_app_dir / "migrate.json"
+    state_file.write_text(
+        json.dumps(
+            {
+                "{0}/{1} -> {0}/new-index".format(host, empty_index): dict(
+                    done=["copy", "tune"],
+                    settings=dict(refresh_interval=None, number_of_replicas="1"),
+                )
+            }
+        )
+    )
+
+    r = runner.invoke(
+        esok,
+        ["migrate", "--restart", "-S", str(state_file), "-w", "yellow", "-p", "0.1"]
+        + [empty_index, "new-index", "alias"],
+    )
+
+    assert r.exit_code == 0
+    settings = client.indices.get_settings("new-index")["new-index"]["settings"]
+    assert "refresh_interval" not in settings["index"]
+    assert settings["index"]["number_of_replicas"] == "1"
@@ -0,0 +1,83 @@
+import json
+
+from elasticsearch.helpers import bulk
+
+from esok.esok import esok
+
+
+def test_batch(runner, client, make_index):
+    indices = [make_index(), make_index()]
+    _fill(client, indices)
+
+    r = runner.invoke(esok, ["reindex", "batch", "some-index-*", "-y", "-p", "0.1"])
+
+    assert r.exit_code == 0
+    client.indices.refresh("_all")
+    for index in indices:
+        target = "{}-reindexed".format(index)
+        assert client.count(index=target)["count"] == 2
+    assert "2 / 2 indices reindexed." in r.output
+
+
+def test_batch_with_mapping_file(runner, client, test_app_dir, empty_index):
+    mapping_file = test_app_dir / "pairs.json"
+    mapping_file.write_text(json.dumps({empty_index: "other-index"}))
+
+    r = runner.invoke(
+        esok, ["reindex", "batch", "-f", str(mapping_file), "-y", "-p", "0.1"]
+    )
+
+    assert r.exit_code == 0
+    assert client.indices.exists("other-index")
+
+
+def test_batch_is_resumed(runner, client, test_app_dir, empty_index):
+    args = ["reindex", "batch", empty_index, "-y", "-p", "0.1"]
+    runner.invoke(esok, args)
+    client.indices.delete("{}-reindexed".format(empty_index))
+
+    r = runner.invoke(esok, args)
+
+    assert r.exit_code == 0
+    assert not client.indices.exists(
+        "{}-reindexed".format(empty_index)
+    ), "Already completed indices should not be reindexed again."
+
+
+def test_batch_requires_pattern_or_mapping_file(runner, app_defaults):
+    r = runner.invoke(esok, ["reindex", "batch"])
+    assert r.exit_code != 0
+
+
+def test_start_since_field(runner, client, empty_index):
+    _write(client, empty_index, {"1": "2021-01-01", "2": "2021-01-02"})
+    args = ["reindex", "start", "--since-field", "updated_at", "-p", "0.1"]
+    args += [empty_index, "target-index"]
+    r = runner.invoke(esok, args, input="y\n")
+    assert r.exit_code == 0
+
+    client.delete("target-index", "_doc", "1", refresh=True)
+    _write(client, empty_index, {"3": "2021-01-03"})
+    r = runner.invoke(esok, args)
+
+    assert r.exit_code == 0
+    client.indices.refresh("target-index")
+    ids = {hit["_id"] for hit in client.search("target-index")["hits"]["hits"]}
+    assert ids == {"2", "3"}, "Only documents since the last run should be copied."
+
+
+def _write(client, index, dates):
+    actions = [
+        dict(_index=index, _type="_doc", _id=i, _source=dict(updated_at=date))
+        for i, date in dates.items()
+    ]
+    bulk(client, actions, refresh=True)
+
+
+def _fill(client, indices):
+    actions = [
+        dict(_index=index, _type="_doc", _id=i, _source=dict(title="title-%s" % i))
+        for index in indices
+        for i in range(2)
+    ]
+    bulk(client, actions, refresh=True)
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import bulk
+
+from esok.esok import esok
+
+COMPOSITE = {
+    "aggs": {
+        "per_day": {
+            "composite": {
+                "size": 2,
+                "sources": [{"day": {"terms": {"field": "day"}}}],
+            }
+        }
+    }
+}
+
+
+def test_search_hits(runner, logs_index, test_app_dir):
+    query_file = test_app_dir / "query.json"
+    query_file.write_text(json.dumps({"query": {"term": {"day": 3}}}))
+
+    result = runner.invoke(esok, ["search", logs_index, str(query_file)])
+
+    assert result.exit_code == 0
+    hits = [json.loads(line) for line in result.output.splitlines()]
+    assert [hit["_source"]["day"] for hit in hits] == [3, 3]
+
+
+@pytest.mark.parametrize("partitions", ["1", "3"])
+def test_search_composite_buckets(runner, logs_index, test_app_dir, partitions):
+    query_file = test_app_dir / "query.json"
+    query_file.write_text(json.dumps(COMPOSITE))
+
+    result = runner.invoke(
+        esok, ["search", "-P", partitions, logs_index, str(query_file)]
+    )
+
+    assert result.exit_code == 0
+    buckets = [json.loads(line) for line in result.output.splitlines()]
+    assert sorted(b["key"]["day"] for b in buckets) == list(range(5))
+    assert {b["doc_count"] for b in buckets} == {2}
+
+
+@pytest.fixture
+def logs_index(host):
+    index = "test-logs"
+    actions = [
+        dict(_index=index, _id=i, _type="_doc", _source=dict(day=i // 2))
+        for i in range(10)
+    ]
+    client = Elasticsearch(host)
+    bulk(client, actions, refresh=True)
+    yield index
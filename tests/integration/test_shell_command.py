@@ -0,0 +1,17 @@
+from esok.esok import esok
+
+
+def test_shell(runner, client):
+    commands = "index touch some-index\nalias create some-alias some-index\n"
+    r = runner.invoke(esok, ["shell"], input=commands)
+
+    assert r.exit_code == 0
+    assert "some-alias some-index" in client.cat.aliases()
+
+
+def test_shell_exits_with_code_of_failed_command(runner, client):
+    commands = "alias create some-alias missing-index\nindex touch some-index\n"
+    r = runner.invoke(esok, ["shell"], input=commands)
+
+    assert r.exit_code != 0
+    assert client.indices.exists("some-index"), "Shell should continue after errors."